@@ -0,0 +1,90 @@
+#
+# export_entries.py
+#
+# Exports the journal entries, of one user (--uid) or of every
+# user, as a compressed columnar file in S3 -- Parquet (zstd) if
+# pyarrow is installed, else gzipped CSV -- and prints a
+# presigned URL to download it, valid for --expires seconds.
+#
+# The rows are streamed from the database and the file is
+# written to S3 by multipart upload as it is produced (see
+# entryexport.py in the layer), so memory stays bounded however
+# big the entries table is.
+#
+# Usage:
+#   python export_entries.py [--uid 80001] [--format parquet|csv]
+#       [--bucket name] [--key exports/all.parquet] [--expires 3600]
+#       [--local DIR]
+#
+# The database comes from journalapp-config.ini ([rds], or
+# JOURNALAPP_CONFIG_FILE / JOURNALAPP_RDS_* overrides) as for
+# the lambdas; if read replicas are configured the export reads
+# from the first one. The bucket defaults to [s3] bucket_name.
+# --local DIR writes to benchmarks/local_s3.LocalS3 under DIR
+# instead of S3, for testing.
+#
+
+import argparse
+import datetime
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda_layers", "journalapp_common", "python"))
+
+import config
+import datatier
+import entryexport
+import storage
+
+
+def default_key(uid, fmt):
+  stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+  who = "all" if uid is None else str(uid)
+  return "exports/" + who + "/entries-" + stamp + entryexport.FORMATS[fmt][0]
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--uid", type=int, help="export only this user's entries")
+  parser.add_argument("--format", choices=sorted(entryexport.FORMATS))
+  parser.add_argument("--bucket", help="defaults to [s3] bucket_name")
+  parser.add_argument("--key", help="defaults to exports/<uid or all>/entries-<time><ext>")
+  parser.add_argument("--expires", type=int, default=3600, help="seconds the URL is valid")
+  parser.add_argument("--local", metavar="DIR", help="write to a LocalS3 under DIR instead of S3")
+  args = parser.parse_args()
+
+  fmt = args.format or entryexport.default_format()
+
+  if args.local:
+    sys.path.insert(0, os.path.join(HERE, "..", "benchmarks"))
+    from local_s3 import LocalS3
+    storage.set_s3_client(LocalS3(args.local))
+
+  s3 = storage.s3_client()
+  bucket = args.bucket or storage.bucket_name()
+  key = args.key or default_key(args.uid, fmt)
+
+  replicas = config.replica_settings()
+  settings = replicas[0] if replicas else config.rds_settings()
+  dbConn = datatier.get_dbConn(*settings)
+
+  start = time.perf_counter()
+
+  try:
+    result = entryexport.export_entries(dbConn, s3, bucket, key, uid=args.uid, fmt=fmt)
+  finally:
+    dbConn.close()
+
+  print("%d entries, %d bytes of %s in %.1f s to s3://%s/%s" %
+        (result["rows"], result["bytes"], result["format"], time.perf_counter() - start,
+         bucket, key), file=sys.stderr)
+
+  print(s3.generate_presigned_url('get_object',
+                                  Params={'Bucket': bucket, 'Key': key},
+                                  ExpiresIn=args.expires))
+
+
+if __name__ == "__main__":
+  main()
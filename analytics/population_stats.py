@@ -0,0 +1,412 @@
+#
+# population_stats.py
+#
+# Nightly population-level statistics over the whole entries
+# table, for the data team:
+#
+#  - correlations between every pair of metrics (in particular
+#    sleep / eat / water / social against overall), overall and
+#    per cohort;
+#  - per-cohort distributions: a histogram of the 1-10 scores of
+#    each metric, with means and medians.
+#
+# A user's cohort is the month of their earliest entry when the
+# user is first seen; it does not change in later runs.
+#
+# The users are split into uid ranges of --partition uids, and a
+# ProcessPoolExecutor scans the ranges in parallel, each worker
+# with its own connection, streaming its rows with
+# datatier.stream_rows and reducing them BLOCK rows at a time
+# with NumPy (bincount per statistic) into per-user partial
+# results: the same additive sums and sums of products that
+# user_stats keeps (userstats.STAT_COLUMNS), plus a histogram.
+# The driver folds the partials into per-cohort totals as they
+# complete, so memory is bounded by BLOCK rows per worker plus
+# the per-cohort totals, not by the size of entries.
+#
+# Everything kept is additive, so the result is saved as a
+# compact NPZ snapshot (per-cohort totals, the uid -> cohort map
+# and the last entryid covered), and the next run only scans the
+# entries added since: entryid > last_entryid. Entries are never
+# updated or deleted by the app; --full rebuilds from scratch
+# should that change.
+#
+# Each run covers entries up to the MAX(entryid) read at its
+# start, after waiting --settle seconds so that uploads already
+# in flight (which may hold lower entryids) have committed.
+#
+# Usage:
+#   python population_stats.py [--snapshot population_stats.npz] [--full]
+#       [--workers 4] [--partition 2000] [--settle 5] [--json report.json]
+#
+# The database comes from journalapp-config.ini ([rds], or
+# JOURNALAPP_CONFIG_FILE / JOURNALAPP_RDS_* overrides) as for
+# the lambdas; if read replicas are configured the scans run on
+# the first one, away from the uploads.
+#
+
+import argparse
+import concurrent.futures
+import datetime
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda_layers", "journalapp_common", "python"))
+
+import config
+import datatier
+import userstats
+
+METRICS = userstats.METRICS
+NSTATS = len(userstats.STAT_COLUMNS)
+LEVELS = 10  # scores are 1..10
+
+BLOCK = 200000  # rows reduced at a time
+SNAPSHOT_VERSION = 1
+
+SCAN_SQL = """
+  SELECT uid, YEAR(date) * 12 + MONTH(date) - 1, """ + ", ".join(METRICS) + """
+  FROM entries
+  WHERE uid >= %s AND uid < %s AND entryid > %s AND entryid <= %s
+"""
+
+
+###################################################################
+#
+# reduce_block:
+#
+# Per-user partial results for an (m, 2 + 5) int64 block of
+# [uid - lo, month, metrics...] rows, with uids in [lo, lo +
+# size): returns (stats (size, NSTATS) in STAT_COLUMNS order,
+# hist (size, 5, LEVELS), first month (size,), -1 where absent).
+#
+def reduce_block(block, size):
+  group = block[:, 0]
+  months = block[:, 1]
+  V = block[:, 2:].astype(np.float64)
+
+  stats = np.empty((size, NSTATS))
+  stats[:, 0] = np.bincount(group, minlength=size)
+
+  col = 1
+  for i in range(len(METRICS)):
+    stats[:, col] = np.bincount(group, weights=V[:, i], minlength=size)
+    col += 1
+  for i in range(len(METRICS)):
+    for j in range(i, len(METRICS)):
+      stats[:, col] = np.bincount(group, weights=V[:, i] * V[:, j], minlength=size)
+      col += 1
+
+  # one bincount over (user, metric, score) cells:
+  cells = (group[:, None] * len(METRICS) + np.arange(len(METRICS))) * LEVELS + (block[:, 2:] - 1)
+  hist = np.bincount(cells.ravel(), minlength=size * len(METRICS) * LEVELS)
+  hist = hist.reshape(size, len(METRICS), LEVELS)
+
+  first = np.full(size, np.iinfo(np.int64).max)
+  np.minimum.at(first, group, months)
+  first[first == np.iinfo(np.int64).max] = -1
+
+  return stats, hist, first
+
+
+###################################################################
+#
+# worker side: one connection per process
+#
+_dbConn = None
+
+
+def worker_init(settings):
+  global _dbConn
+  _dbConn = datatier.get_dbConn(*settings)
+
+
+def scan_partition(lo, hi, after, upto):
+  """
+  Streams the entries of uids [lo, hi) with after < entryid <=
+  upto and returns (uids, stats, hist, first month) for the
+  users that have any
+  """
+  rows = datatier.stream_rows(_dbConn, SCAN_SQL, [lo, hi, after, upto], fetch_size=10000)
+  return reduce_rows(rows, lo, hi)
+
+
+def reduce_rows(rows, lo, hi):
+  """
+  The partition's partial results from an iterable of SCAN_SQL
+  rows, reduced BLOCK rows at a time
+  """
+  size = hi - lo
+  stats = np.zeros((size, NSTATS))
+  hist = np.zeros((size, len(METRICS), LEVELS), dtype=np.int64)
+  first = np.full(size, -1, dtype=np.int64)
+  rows = iter(rows)
+
+  while True:
+    # straight from the row tuples into an array, no lists:
+    flat = np.fromiter(itertools.chain.from_iterable(itertools.islice(rows, BLOCK)), dtype=np.int64)
+    if len(flat) == 0:
+      break
+
+    block = flat.reshape(-1, 2 + len(METRICS))
+    block[:, 0] -= lo
+
+    s, h, f = reduce_block(block, size)
+    stats += s
+    hist += h
+    first = np.where((first < 0) | ((f >= 0) & (f < first)), f, first)
+
+  present = np.nonzero(stats[:, 0])[0]
+
+  return lo + present, stats[present], hist[present], first[present]
+
+
+###################################################################
+#
+# Snapshot:
+#
+# The accumulated results: per-cohort totals, which cohort each
+# user is in, and the last entryid covered.
+#
+class Snapshot:
+  def __init__(self):
+    self.last_entryid = 0
+    self.uids = np.zeros(0, dtype=np.int64)     # sorted
+    self.cohort = np.zeros(0, dtype=np.int32)   # month # of each user's cohort
+    self.months = np.zeros(0, dtype=np.int32)   # sorted cohort month #s
+    self.stats = np.zeros((0, NSTATS))
+    self.hist = np.zeros((0, len(METRICS), LEVELS), dtype=np.int64)
+    self._new_uids = []
+    self._new_cohorts = []
+
+  @staticmethod
+  def load(path):
+    snapshot = Snapshot()
+
+    with np.load(path) as npz:
+      if int(npz["version"]) != SNAPSHOT_VERSION:
+        raise ValueError("unsupported snapshot version " + str(npz["version"]))
+
+      snapshot.last_entryid = int(npz["last_entryid"])
+      snapshot.uids = npz["uids"]
+      snapshot.cohort = npz["cohort"]
+      snapshot.months = npz["months"]
+      snapshot.stats = npz["stats"]
+      snapshot.hist = npz["hist"]
+
+    return snapshot
+
+  def save(self, path):
+    tmp = path + ".tmp"
+
+    with open(tmp, "wb") as f:
+      np.savez_compressed(f, version=SNAPSHOT_VERSION, last_entryid=self.last_entryid,
+                          uids=self.uids, cohort=self.cohort, months=self.months,
+                          stats=self.stats, hist=self.hist)
+
+    os.replace(tmp, path)  # readers never see a half-written file
+
+  def _cohort_rows(self, months):
+    """
+    Row #s in months/stats/hist for the given month #s, adding
+    rows for new cohorts
+    """
+    missing = np.setdiff1d(months, self.months)
+
+    if len(missing) > 0:
+      self.months = np.concatenate([self.months, missing.astype(np.int32)])
+      order = np.argsort(self.months, kind="stable")
+      self.months = self.months[order]
+      self.stats = np.concatenate([self.stats, np.zeros((len(missing), NSTATS))])[order]
+      self.hist = np.concatenate([self.hist, np.zeros((len(missing),) + self.hist.shape[1:],
+                                                      dtype=np.int64)])[order]
+
+    return np.searchsorted(self.months, months)
+
+  def merge(self, uids, stats, hist, first):
+    """
+    Adds one partition's partial results
+    """
+    if len(uids) == 0:
+      return
+
+    # users already in the snapshot keep their cohort:
+    known = np.zeros(len(uids), dtype=bool)
+    cohort = first.astype(np.int32)
+
+    if len(self.uids) > 0:
+      pos = np.minimum(np.searchsorted(self.uids, uids), len(self.uids) - 1)
+      known = self.uids[pos] == uids
+      cohort = np.where(known, self.cohort[pos], cohort)
+
+    self._new_uids.append(uids[~known])
+    self._new_cohorts.append(cohort[~known])
+
+    rows = self._cohort_rows(cohort)
+    np.add.at(self.stats, rows, stats)
+    np.add.at(self.hist, rows, hist)
+
+  def finish(self, last_entryid):
+    """
+    Folds the users first seen in this run into the uid map
+    """
+    uids = np.concatenate([self.uids] + self._new_uids)
+    cohort = np.concatenate([self.cohort] + self._new_cohorts)
+    order = np.argsort(uids, kind="stable")
+
+    self.uids, self.cohort = uids[order].astype(np.int64), cohort[order].astype(np.int32)
+    self._new_uids, self._new_cohorts = [], []
+    self.last_entryid = last_entryid
+
+  def report(self):
+    """
+    The results as a JSON-able dict
+    """
+    users = np.bincount(np.searchsorted(self.months, self.cohort), minlength=len(self.months))
+
+    cohorts = []
+    for k, month in enumerate(self.months):
+      year, month0 = divmod(int(month), 12)
+      cohorts.append(dict(describe(self.stats[k], self.hist[k]),
+                          cohort="%04d-%02d" % (year, month0 + 1), users=int(users[k])))
+
+    return dict(describe(self.stats.sum(axis=0), self.hist.sum(axis=0)),
+                users=len(self.uids), last_entryid=self.last_entryid, cohorts=cohorts)
+
+
+###################################################################
+#
+# describe:
+#
+# Entries, means, medians, histograms and the correlation
+# matrix from one set of totals (stats in STAT_COLUMNS order,
+# hist (5, LEVELS)).
+#
+def describe(stats, hist):
+  n = stats[0]
+  if n == 0:
+    return {"entries": 0}
+
+  sums = stats[1:1 + len(METRICS)]
+  products = np.empty((len(METRICS), len(METRICS)))
+  for k, (a, b) in enumerate(userstats.PAIRS):
+    i, j = METRICS.index(a), METRICS.index(b)
+    products[i, j] = products[j, i] = stats[1 + len(METRICS) + k]
+
+  mean = sums / n
+  cov = products / n - np.outer(mean, mean)
+  sd = np.sqrt(np.maximum(np.diag(cov), 0.0))
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    corr = cov / np.outer(sd, sd)
+
+  def number(x):
+    return None if not np.isfinite(x) else round(float(x), 4)
+
+  cumulative = np.cumsum(hist, axis=1)
+  medians = [int(np.searchsorted(cumulative[i], cumulative[i, -1] / 2.0)) + 1
+             for i in range(len(METRICS))]
+
+  return {
+    "entries": int(n),
+    "mean": {m: number(mean[i]) for i, m in enumerate(METRICS)},
+    "median": dict(zip(METRICS, medians)),
+    "histogram": {m: [int(c) for c in hist[i]] for i, m in enumerate(METRICS)},
+    "correlation": {a: {b: number(corr[i, j]) for j, b in enumerate(METRICS) if b != a}
+                    for i, a in enumerate(METRICS)},
+  }
+
+
+###################################################################
+#
+# driver
+#
+def partitions(lo, hi, size):
+  return [(start, min(start + size, hi)) for start in range(lo, hi, size)]
+
+
+def run(settings, snapshot, workers, partition_size, settle):
+  dbConn = datatier.get_dbConn(*settings)
+
+  try:
+    upto = datatier.retrieve_one_row(dbConn, "SELECT MAX(entryid) FROM entries")[0] or 0
+    lo, hi = datatier.retrieve_one_row(dbConn, "SELECT MIN(uid), MAX(uid) FROM users")
+  finally:
+    dbConn.close()
+
+  if upto <= snapshot.last_entryid or lo is None:
+    print("nothing new since entryid", snapshot.last_entryid, file=sys.stderr)
+    return 0
+
+  time.sleep(settle)
+
+  parts = partitions(lo, hi + 1, partition_size)
+  print("scanning entryid %d..%d, %d partitions, %d workers" %
+        (snapshot.last_entryid + 1, upto, len(parts), workers), file=sys.stderr)
+
+  scanned = 0
+
+  # spawn, not fork: workers open their own connections
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=worker_init,
+                                              initargs=(settings,),
+                                              mp_context=multiprocessing.get_context("spawn")) as pool:
+    futures = [pool.submit(scan_partition, a, b, snapshot.last_entryid, upto) for a, b in parts]
+
+    for future in concurrent.futures.as_completed(futures):
+      uids, stats, hist, first = future.result()
+      snapshot.merge(uids, stats, hist, first)
+      scanned += int(stats[:, 0].sum())
+
+  snapshot.finish(upto)
+
+  return scanned
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--snapshot", default="population_stats.npz")
+  parser.add_argument("--full", action="store_true", help="ignore the snapshot and rescan everything")
+  parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+  parser.add_argument("--partition", type=int, default=2000, help="uids per partition")
+  parser.add_argument("--settle", type=float, default=5.0,
+                      help="seconds to let in-flight uploads commit")
+  parser.add_argument("--json", help="write the report to this file instead of stdout")
+  args = parser.parse_args()
+
+  replicas = config.replica_settings()
+  settings = replicas[0] if replicas else config.rds_settings()
+
+  if os.path.exists(args.snapshot) and not args.full:
+    snapshot = Snapshot.load(args.snapshot)
+  else:
+    snapshot = Snapshot()
+
+  start = time.perf_counter()
+  scanned = run(settings, snapshot, args.workers, args.partition, args.settle)
+
+  if scanned > 0:
+    snapshot.save(args.snapshot)
+
+  print("%d entries in %.1f s, snapshot at entryid %d" %
+        (scanned, time.perf_counter() - start, snapshot.last_entryid), file=sys.stderr)
+
+  report = snapshot.report()
+  report["generated"] = datetime.datetime.now().isoformat(timespec="seconds")
+
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(report, f, indent=2)
+  else:
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+  main()
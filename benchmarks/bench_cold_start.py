@@ -0,0 +1,91 @@
+#
+# bench_cold_start.py
+#
+# Measures how long each lambda's module takes to import in a
+# fresh interpreter, which is what a cold start pays before the
+# first request is handled. Each handler is imported --runs
+# times in a new python process and the median is reported.
+#
+# Usage:
+#   python bench_cold_start.py [--runs 5] [--max-ms 300] [--json]
+#
+# With --max-ms the script exits with status 1 if any handler
+# is slower, so it can be used to catch cold-start regressions.
+# Handlers whose dependencies are not installed are reported
+# as errors rather than timed.
+#
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LAMBDA_DIR = os.path.join(HERE, "..", "lambda_functions")
+LAYER_DIR = os.path.join(HERE, "..", "lambda_layers", "journalapp_common", "python")
+
+PROBE = """
+import time
+start = time.perf_counter()
+import lambda_function
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def time_import(handler_dir):
+  """
+  Returns the import time in ms, or raises RuntimeError
+  """
+  # the shared layer is on sys.path in Lambda (/opt/python):
+  env = dict(os.environ, PYTHONPATH=LAYER_DIR)
+
+  result = subprocess.run([sys.executable, "-c", PROBE], cwd=handler_dir, env=env,
+                          capture_output=True, text=True)
+
+  if result.returncode != 0:
+    raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+  return float(result.stdout.strip())
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--runs", type=int, default=5)
+  parser.add_argument("--max-ms", type=float, default=None)
+  parser.add_argument("--json", action="store_true")
+  args = parser.parse_args()
+
+  results = {}
+
+  for name in sorted(os.listdir(LAMBDA_DIR)):
+    handler_dir = os.path.join(LAMBDA_DIR, name)
+    if not os.path.isfile(os.path.join(handler_dir, "lambda_function.py")):
+      continue
+
+    try:
+      times = [time_import(handler_dir) for _ in range(args.runs)]
+      results[name] = {"median_ms": statistics.median(times), "max_ms": max(times)}
+    except RuntimeError as err:
+      results[name] = {"error": str(err)}
+
+  if args.json:
+    print(json.dumps(results, indent=2))
+  else:
+    for name, res in results.items():
+      if "error" in res:
+        print("%-32s ERROR %s" % (name, res["error"]))
+      else:
+        print("%-32s %8.1f ms (max %.1f)" % (name, res["median_ms"], res["max_ms"]))
+
+  if args.max_ms is not None:
+    slow = [name for name, res in results.items()
+            if "error" in res or res["median_ms"] > args.max_ms]
+    if slow:
+      print("over budget:", ", ".join(slow), file=sys.stderr)
+      sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,129 @@
+#
+# bench_collage.py
+#
+# Throughput of journal_collage_download's collage builder for
+# 10 to 500 images, against benchmarks/local_s3.LocalS3 with a
+# simulated per-request S3 latency. Reports images/second for
+# each worker count, and the process's max RSS so far (Pillow
+# allocates image buffers outside the Python heap, so RSS is
+# the honest measure), to show that concurrency hides S3
+# latency while memory stays bounded by the number of workers
+# rather than the image count.
+#
+# With --source variants the collage is built from the
+# renditions journal_image_variants would have made (the
+# smallest one that fills a tile), as journal_collage_download
+# does once they exist, instead of from the originals.
+#
+# Usage:
+#   python bench_collage.py [--counts 10,100,500] [--workers 1,8,16]
+#                           [--latency 0.03] [--size 3000x2000]
+#                           [--source original|variants]
+#
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import resource
+
+from PIL import Image
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda_functions", "journal_collage_download"))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda_functions", "journal_image_variants"))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda_layers", "journalapp_common", "python"))
+
+import collage
+import imagevariants
+import renditions
+from local_s3 import LocalS3
+
+BUCKET = "journalapp-bench"
+
+
+def seed_images(s3, count, width, height):
+  """
+  Writes count distinct JPEGs and returns their keys
+  """
+  keys = []
+  rng = random.Random(310)
+
+  for i in range(count):
+    color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+    img = Image.new("RGB", (width, height), color)
+
+    data = io.BytesIO()
+    img.save(data, format="JPEG", quality=90)
+
+    key = "images/bench/%05d.jpg" % i
+    s3.put_object(Bucket=BUCKET, Key=key, Body=data.getvalue())
+    keys.append(key)
+
+  return keys
+
+
+def seed_variants(s3, keys, tile):
+  """
+  Renders the variants of each image and returns, per image,
+  the key collage_download would pick: the smallest variant at
+  least tile pixels on its longest edge, else the original
+  """
+  picked = []
+
+  for key in keys:
+    with s3.get_object(Bucket=BUCKET, Key=key)["Body"] as body:
+      variants = renditions.render(body, imagevariants.VARIANTS)
+
+    best = key
+    for name, data, width, height in variants:  # largest first
+      if max(width, height) >= tile:
+        best = imagevariants.variant_key(key, name)
+        s3.put_object(Bucket=BUCKET, Key=best, Body=data)
+
+    picked.append(best)
+
+  return picked
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--counts", default="10,50,100,250,500")
+  parser.add_argument("--workers", default="1,8,16")
+  parser.add_argument("--latency", type=float, default=0.03)
+  parser.add_argument("--size", default="3000x2000")
+  parser.add_argument("--tile", type=int, default=256)
+  parser.add_argument("--source", choices=["original", "variants"], default="original")
+  args = parser.parse_args()
+
+  width, height = [int(v) for v in args.size.split("x")]
+  counts = [int(v) for v in args.counts.split(",")]
+
+  with tempfile.TemporaryDirectory() as root:
+    s3 = LocalS3(root)
+    all_keys = seed_images(s3, max(counts), width, height)
+    if args.source == "variants":
+      all_keys = seed_variants(s3, all_keys, args.tile)
+    s3.latency = args.latency
+
+    print("%8s %8s %10s %12s %14s" % ("images", "workers", "secs", "images/s", "max RSS MB"))
+
+    for count in counts:
+      for workers in [int(v) for v in args.workers.split(",")]:
+        start = time.perf_counter()
+
+        data, failed = collage.build_collage(s3, BUCKET, all_keys[:count],
+                                             max_tile=args.tile, max_workers=workers)
+
+        secs = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+        assert not failed
+        print("%8d %8d %10.2f %12.1f %14.1f" % (count, workers, secs, count / secs, peak))
+
+
+if __name__ == "__main__":
+  main()
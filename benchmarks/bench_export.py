@@ -0,0 +1,140 @@
+#
+# bench_export.py
+#
+# Throughput and memory of entryexport.export_entries (the
+# journal_export lambda and analytics/export_entries.py) for
+# each format, exporting --entries synthetic entries into a
+# LocalS3 under a temporary directory.
+#
+# The rows come from a stand-in connection whose unbuffered
+# cursor generates them on demand, as pymysql's SSCursor would
+# fetch them, so nothing but the exporter holds them in memory.
+# Each format runs in a fresh process and reports its peak RSS,
+# which should stay flat as --entries grows. The file written is
+# then read back and checked against the rows generated.
+#
+# Usage:
+#   python bench_export.py [--entries 1000000] [--formats parquet,csv]
+#
+
+import argparse
+import csv
+import datetime
+import gzip
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda_layers", "journalapp_common", "python"))
+
+import entryexport
+from local_s3 import LocalS3
+
+WORDS = ["slept", "well", "beach", "trip", "work", "tired", "friends", "dinner", "rain", "run"]
+START = datetime.datetime(2022, 1, 1, 8, 0, 0)
+
+
+def synthetic(n, seed=25):
+  rng = random.Random(seed)
+  for entryid in range(1, n + 1):
+    yield (1 + rng.randrange(1000), entryid, START + datetime.timedelta(minutes=7 * entryid),
+           " ".join(rng.choice(WORDS) for _ in range(rng.randrange(5, 30))),
+           *(rng.randint(1, 10) for _ in range(5)))
+
+
+class Cursor:
+  def __init__(self, n):
+    self.rows = synthetic(n)
+
+  def execute(self, sql, parameters):
+    pass
+
+  def fetchmany(self, size):
+    return [row for _, row in zip(range(size), self.rows)]
+
+  def close(self):
+    pass
+
+
+class Connection:
+  def __init__(self, n):
+    self.n = n
+
+  def cursor(self, cursor_class=None):
+    return Cursor(self.n)
+
+
+def export(fmt, n, root):
+  s3 = LocalS3(root)
+  key = "exports/all/bench" + entryexport.FORMATS[fmt][0]
+
+  start = time.perf_counter()
+  result = entryexport.export_entries(Connection(n), s3, "bench", key, fmt=fmt)
+  secs = time.perf_counter() - start
+
+  return result, secs, peak_rss_mb(), os.path.join(root, "bench", key)
+
+
+def peak_rss_mb():
+  #
+  # ru_maxrss survives fork and exec, so a spawned worker would
+  # report the parent's peak if larger; VmHWM starts afresh:
+  #
+  try:
+    with open("/proc/self/status") as f:
+      for line in f:
+        if line.startswith("VmHWM:"):
+          return int(line.split()[1]) / 1024
+  except OSError:
+    pass
+
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def check(fmt, n, path):
+  expected = synthetic(n)
+
+  if fmt == "parquet":
+    import pyarrow.parquet as pq
+    table = pq.read_table(path)
+    assert table.num_rows == n
+    assert table.column_names == entryexport.COLUMNS
+    first = tuple(table.slice(0, 1).to_pylist()[0].values())
+    assert first == next(expected)
+  else:
+    with gzip.open(path, "rt", newline="") as f:
+      reader = csv.reader(f)
+      assert next(reader) == entryexport.COLUMNS
+      count = 0
+      for row, want in zip(reader, expected):
+        assert row == [str(v) for v in want]
+        count += 1
+      assert count == n
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--entries", type=int, default=1000000)
+  parser.add_argument("--formats", default="parquet,csv")
+  args = parser.parse_args()
+
+  context = multiprocessing.get_context("spawn")
+
+  print("%8s %10s %10s %8s %12s %10s" % ("format", "entries", "MB", "secs", "rows/s", "peak MB"))
+
+  for fmt in args.formats.split(","):
+    with tempfile.TemporaryDirectory() as root, context.Pool(1) as pool:
+      result, secs, peak_mb, path = pool.apply(export, (fmt, args.entries, root))
+      check(fmt, args.entries, path)
+
+    print("%8s %10d %10.1f %8.2f %12.0f %10.0f" %
+          (fmt, result["rows"], result["bytes"] / 2 ** 20, secs, result["rows"] / secs, peak_mb))
+
+
+if __name__ == "__main__":
+  main()
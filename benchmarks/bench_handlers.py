@@ -0,0 +1,282 @@
+#
+# bench_handlers.py
+#
+# Load test of the lambdas, run in-process against a local
+# MySQL server (see localdb.py) and benchmarks/local_s3.LocalS3
+# in place of S3. For each handler and concurrency level it
+# reports throughput and p50/p95/p99 latency, and can write the
+# results as JSON for tracking regressions between commits.
+#
+# Scenarios:
+#
+#   upload        journal_upload, one entry per request
+#   upload_batch  journal_upload, --batch entries per request
+#   upload_image  journal_upload_image (reservation + presigned POST)
+#   quote         journal_generate_quote
+#   regression    journal_linear_regression for one user
+#   trends        journal_trends, weekly over the whole dataset
+#
+# Concurrency is simulated with worker processes rather than
+# threads: each worker loads the handlers itself and so has its
+# own warm-container state (cached connection, caches), just as
+# concurrent Lambda invocations run in separate containers.
+#
+# The dataset is --users users with --entries entries each,
+# written through journal_upload's batch mode so that
+# user_stats and daily_stats are maintained as in production.
+#
+# There is deliberately no SQLite mode: the handlers' SQL is
+# MySQL's (ON DUPLICATE KEY UPDATE, LAST_INSERT_ID(), date
+# functions, multi-row executemany), and timings against a
+# rewritten dialect would not say anything about RDS.
+#
+# Usage:
+#   python bench_handlers.py --host localhost --user root --pwd ...
+#       [--scenarios upload,quote] [--concurrency 1,4,16]
+#       [--requests 500] [--users 100] [--entries 365] [--json out.json]
+#
+# The scratch database (default journalapp_bench) is dropped
+# and recreated; do not point this at real data.
+#
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import localdb
+
+BUCKET = "journalapp-bench"
+
+SCENARIOS = ["upload", "upload_batch", "upload_image", "quote", "regression", "trends"]
+
+HANDLERS = {
+  "upload": "journal_upload",
+  "upload_batch": "journal_upload",
+  "upload_image": "journal_upload_image",
+  "quote": "journal_generate_quote",
+  "regression": "journal_linear_regression",
+  "trends": "journal_trends",
+}
+
+EPOCH = datetime.datetime(2020, 1, 1)
+
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def entry(when):
+  return {"notes": "benchmark entry", "date": when.strftime('%Y-%m-%d %H:%M:%S'),
+          **{m: random.randint(1, 10) for m in ["sleep", "eat", "water", "social", "overall"]}}
+
+
+###################################################################
+#
+# worker side: each process has its own handlers and state
+#
+_handlers = {}
+
+
+def worker_init(db, s3_root):
+  localdb.use_local_db(*db)
+  os.environ["JOURNALAPP_S3_BUCKET_NAME"] = BUCKET
+  os.environ.setdefault("JOURNALAPP_LOG_SAMPLE_RATE", "0")
+
+  import storage
+  from local_s3 import LocalS3
+
+  storage.set_s3_client(LocalS3(s3_root))
+
+  for name in set(HANDLERS.values()):
+    _handlers[name] = localdb.load_handler(name)
+
+
+def event_for(scenario, uid, seq, batch, dataset_days):
+  """
+  The request for one call; seq is unique across workers and
+  runs, and makes upload dates unique
+  """
+  #
+  # uploads are dated after the seeded dataset:
+  #
+  base = EPOCH + datetime.timedelta(days=dataset_days + 1)
+
+  if scenario in ("upload", "upload_batch"):
+    count = batch if scenario == "upload_batch" else 1
+    entries = [entry(base + datetime.timedelta(seconds=seq * batch + i)) for i in range(count)]
+    body = entries if scenario == "upload_batch" else entries[0]
+    return {"pathParameters": {"uid": str(uid)}, "body": json.dumps(body)}
+
+  if scenario == "upload_image":
+    when = base + datetime.timedelta(seconds=seq)
+    body = {"filename": "bench.jpg", "content_type": "image/jpeg",
+            "date": when.strftime('%Y-%m-%d %H:%M:%S')}
+    return {"pathParameters": {"uid": str(uid)}, "body": json.dumps(body)}
+
+  if scenario == "trends":
+    end = (EPOCH + datetime.timedelta(days=dataset_days)).strftime('%Y-%m-%d')
+    return {"queryStringParameters": {"uid": str(uid), "start": "2020-01-01", "end": end,
+                                      "period": "week"}}
+
+  return {"queryStringParameters": {"uid": str(uid)}}
+
+
+def run_chunk(scenario, uids, first_seq, count, batch, dataset_days):
+  """
+  Runs count calls in this worker, returns (latencies in ms,
+  # of errors)
+  """
+  handler = _handlers[HANDLERS[scenario]]
+  times = []
+  errors = 0
+
+  for seq in range(first_seq, first_seq + count):
+    event = event_for(scenario, random.choice(uids), seq, batch, dataset_days)
+
+    start = time.perf_counter()
+    result = handler.lambda_handler(event, None)
+    times.append((time.perf_counter() - start) * 1000)
+
+    if result.get("statusCode") != 200:
+      errors += 1
+
+  return times, errors
+
+
+###################################################################
+#
+# driver side
+#
+def seed(db, uids, entries_per_user):
+  """
+  Writes the dataset through journal_upload's batch mode
+  """
+  localdb.use_local_db(*db)
+  os.environ.setdefault("JOURNALAPP_LOG_SAMPLE_RATE", "0")
+  upload = localdb.load_handler("journal_upload")
+
+  for uid in uids:
+    days = [EPOCH + datetime.timedelta(days=d, hours=random.randint(6, 22)) for d in range(entries_per_user)]
+
+    for lo in range(0, len(days), upload.MAX_BATCH):
+      body = [entry(when) for when in days[lo:lo + upload.MAX_BATCH]]
+      result = upload.lambda_handler({"pathParameters": {"uid": str(uid)}, "body": json.dumps(body)}, None)
+      assert result["statusCode"] == 200, result
+
+
+def run_scenario(pool, scenario, concurrency, requests, uids, batch, dataset_days, seq_base):
+  per_worker = max(1, requests // concurrency)
+
+  start = time.perf_counter()
+  futures = [pool.submit(run_chunk, scenario, uids, seq_base + w * per_worker, per_worker,
+                         batch, dataset_days)
+             for w in range(concurrency)]
+
+  times = []
+  errors = 0
+  for future in futures:
+    t, e = future.result()
+    times += t
+    errors += e
+
+  wall = time.perf_counter() - start
+
+  return {
+    "scenario": scenario,
+    "concurrency": concurrency,
+    "requests": len(times),
+    "errors": errors,
+    "throughput_rps": round(len(times) / wall, 1),
+    "p50_ms": round(percentile(times, 50), 3),
+    "p95_ms": round(percentile(times, 95), 3),
+    "p99_ms": round(percentile(times, 99), 3),
+  }
+
+
+def git_revision():
+  try:
+    return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                   cwd=localdb.ROOT, stderr=subprocess.DEVNULL).decode().strip()
+  except Exception:
+    return None
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--host", default="localhost")
+  parser.add_argument("--port", type=int, default=3306)
+  parser.add_argument("--user", default="root")
+  parser.add_argument("--pwd", default="")
+  parser.add_argument("--db", default="journalapp_bench")
+  parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+  parser.add_argument("--concurrency", default="1,4,16")
+  parser.add_argument("--requests", type=int, default=500, help="per scenario and concurrency")
+  parser.add_argument("--users", type=int, default=100)
+  parser.add_argument("--entries", type=int, default=365, help="seeded entries per user")
+  parser.add_argument("--batch", type=int, default=50, help="entries per upload_batch request")
+  parser.add_argument("--json", help="write the results to this file")
+  args = parser.parse_args()
+
+  scenarios = args.scenarios.split(",")
+  for scenario in scenarios:
+    if scenario not in HANDLERS:
+      parser.error("unknown scenario " + scenario)
+
+  levels = [int(c) for c in args.concurrency.split(",")]
+  db = (args.host, args.port, args.user, args.pwd, args.db)
+
+  print("seeding", args.users, "users x", args.entries, "entries...", file=sys.stderr)
+  localdb.create_scratch_db(*db)
+  uids = localdb.add_users(*db, args.users)
+  seed(db, uids, args.entries)
+
+  results = []
+  s3_root = tempfile.mkdtemp(prefix="bench_handlers_")
+
+  print("%14s %6s %8s %10s %10s %10s %10s %7s" %
+        ("scenario", "conc", "requests", "req/s", "p50 ms", "p95 ms", "p99 ms", "errors"))
+
+  seq_base = 0
+
+  for concurrency in levels:
+    #
+    # spawn, not fork, so that workers do not inherit the seeding
+    # connection:
+    #
+    with concurrent.futures.ProcessPoolExecutor(max_workers=concurrency, initializer=worker_init,
+                                                initargs=(db, s3_root),
+                                                mp_context=multiprocessing.get_context("spawn")) as pool:
+      for scenario in scenarios:
+        result = run_scenario(pool, scenario, concurrency, args.requests, uids, args.batch,
+                              args.entries, seq_base)
+        seq_base += args.requests + concurrency
+        results.append(result)
+
+        print("%14s %6d %8d %10.1f %10.3f %10.3f %10.3f %7d" %
+              (scenario, concurrency, result["requests"], result["throughput_rps"],
+               result["p50_ms"], result["p95_ms"], result["p99_ms"], result["errors"]))
+
+  if args.json:
+    report = {
+      "revision": git_revision(),
+      "time": datetime.datetime.now().isoformat(timespec="seconds"),
+      "python": platform.python_version(),
+      "dataset": {"users": args.users, "entries_per_user": args.entries, "batch": args.batch},
+      "results": results,
+    }
+    with open(args.json, "w") as f:
+      json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,143 @@
+#
+# bench_population_stats.py
+#
+# Throughput of analytics/population_stats.py's reduction and
+# its process-pool fan-out, on synthetic entries rather than a
+# database: each partition's rows are generated as tuples inside
+# the worker (as pymysql would hand them over) and reduced with
+# reduce_rows, for each worker count. Reports rows/second.
+#
+# It first checks the results on a smaller dataset against a
+# direct NumPy computation (correlations, histograms) and checks
+# that two incremental runs merge to the same snapshot as one
+# full run.
+#
+# Usage:
+#   python bench_population_stats.py [--entries 2000000] [--users 100000]
+#                                    [--workers 1,4,8] [--partition 2000]
+#
+
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "analytics"))
+
+import population_stats as ps
+
+FIRST_MONTH = 2022 * 12
+
+
+def synthetic(n, lo, hi, seed):
+  """
+  (n, 7) int64 rows of [uid, month, sleep, eat, water, social,
+  overall] for uids in [lo, hi), overall loosely following the
+  other metrics
+  """
+  rng = np.random.default_rng(seed)
+
+  rows = np.empty((n, 7), dtype=np.int64)
+  rows[:, 0] = rng.integers(lo, hi, size=n)
+  rows[:, 1] = FIRST_MONTH + rng.integers(0, 36, size=n)
+  rows[:, 2:6] = rng.integers(1, 11, size=(n, 4))
+  overall = 0.3 * rows[:, 2] + 0.2 * rows[:, 4] + 0.3 * rows[:, 5] + rng.normal(0, 1.5, size=n)
+  rows[:, 6] = np.clip(np.round(overall), 1, 10)
+
+  return rows
+
+
+def bench_partition(lo, hi, n):
+  rows = synthetic(n, lo, hi, lo)
+  return ps.reduce_rows(map(tuple, rows.tolist()), lo, hi)
+
+
+def run_snapshot(rows, partition, snapshot, last_entryid):
+  lo, hi = int(rows[:, 0].min()), int(rows[:, 0].max()) + 1
+  for a, b in ps.partitions(lo, hi, partition):
+    part = rows[(rows[:, 0] >= a) & (rows[:, 0] < b)]
+    snapshot.merge(*ps.reduce_rows(map(tuple, part.tolist()), a, b))
+  snapshot.finish(last_entryid)
+  return snapshot
+
+
+def check(partition):
+  rows = synthetic(200000, 1, 5001, 310)
+
+  full = run_snapshot(rows, partition, ps.Snapshot(), len(rows))
+  report = full.report()
+
+  corr = np.corrcoef(rows[:, 2:].T.astype(np.float64))
+  for i, a in enumerate(ps.METRICS):
+    for j, b in enumerate(ps.METRICS):
+      if a != b:
+        assert abs(report["correlation"][a][b] - corr[i, j]) < 1e-3, (a, b)
+
+  for i, m in enumerate(ps.METRICS):
+    expected = np.bincount(rows[:, 2 + i] - 1, minlength=ps.LEVELS)
+    assert report["histogram"][m] == expected.tolist(), m
+
+  #
+  # cohorts are the month of each user's earliest entry:
+  #
+  months = np.full(5001, np.iinfo(np.int64).max)
+  np.minimum.at(months, rows[:, 0], rows[:, 1])
+  users = np.bincount(months[1:] - FIRST_MONTH)
+  assert [c["users"] for c in report["cohorts"]] == users[users > 0].tolist()
+
+  #
+  # incremental: the first half, then the rest, is the same as a
+  # full run -- except for the cohorts, which are fixed from
+  # what the first run saw:
+  #
+  half = len(rows) // 2
+  incremental = run_snapshot(rows[:half], partition, ps.Snapshot(), half)
+  incremental = run_snapshot(rows[half:], partition, incremental, len(rows))
+
+  assert np.allclose(incremental.stats.sum(axis=0), full.stats.sum(axis=0))
+  assert (incremental.hist.sum(axis=0) == full.hist.sum(axis=0)).all()
+  assert (incremental.uids == full.uids).all()
+  assert incremental.last_entryid == full.last_entryid
+
+  print("check ok: correlations, histograms, cohorts, incremental merge", file=sys.stderr)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--entries", type=int, default=2000000)
+  parser.add_argument("--users", type=int, default=100000)
+  parser.add_argument("--workers", default="1,4,8")
+  parser.add_argument("--partition", type=int, default=2000)
+  args = parser.parse_args()
+
+  check(args.partition)
+
+  parts = ps.partitions(1, args.users + 1, args.partition)
+  per_part = args.entries // len(parts)
+
+  print("%8s %10s %10s %12s" % ("workers", "entries", "secs", "rows/s"))
+
+  for workers in [int(w) for w in args.workers.split(",")]:
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,
+                                                mp_context=multiprocessing.get_context("spawn")) as pool:
+      pool.submit(int).result()  # start the workers before timing
+
+      start = time.perf_counter()
+      snapshot = ps.Snapshot()
+      futures = [pool.submit(bench_partition, a, b, per_part) for a, b in parts]
+      for future in concurrent.futures.as_completed(futures):
+        snapshot.merge(*future.result())
+      snapshot.finish(per_part * len(parts))
+      secs = time.perf_counter() - start
+
+    total = int(snapshot.stats[:, 0].sum())
+    print("%8d %10d %10.2f %12.0f" % (workers, total, secs, total / secs))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,74 @@
+#
+# bench_regression.py
+#
+# Times the vectorized regression engine in
+# lambda_functions/journal_linear_regression/regression.py on
+# synthetic datasets, for both a single user's fit and the
+# batched all-users pass used by the nightly job.
+#
+# Usage:
+#   python bench_regression.py [--sizes 1000,100000,1000000,10000000]
+#                              [--entries-per-user 100]
+#
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda_layers", "journalapp_common", "python"))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda_functions", "journal_linear_regression"))
+
+import regression
+
+
+def synthetic(n, nusers, rng):
+  """
+  Returns (uids, X, y) with integer 1-10 scores and a known
+  per-user linear relationship plus noise
+  """
+  uids = rng.integers(0, nusers, size=n)
+  X = rng.integers(1, 11, size=(n, 4)).astype(np.float64)
+
+  true_coef = rng.normal(0.0, 0.5, size=(nusers, 5))
+  y = true_coef[uids, 0] + np.einsum('ij,ij->i', X, true_coef[uids, 1:]) \
+    + rng.normal(0.0, 1.0, size=n)
+
+  return uids, X, np.clip(np.round(y), 1, 10)
+
+
+def best_of(fn, repeats):
+  best = float("inf")
+  for _ in range(repeats):
+    start = time.perf_counter()
+    fn()
+    best = min(best, time.perf_counter() - start)
+  return best
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--sizes", default="1000,10000,100000,1000000,10000000")
+  parser.add_argument("--entries-per-user", type=int, default=100)
+  parser.add_argument("--repeats", type=int, default=3)
+  args = parser.parse_args()
+
+  rng = np.random.default_rng(310)
+
+  print("%10s %8s %14s %14s %16s" % ("entries", "users", "fit (ms)", "fit_all (ms)", "rows/s (all)"))
+
+  for n in [int(s) for s in args.sizes.split(",")]:
+    nusers = max(1, n // args.entries_per_user)
+    uids, X, y = synthetic(n, nusers, rng)
+
+    t_fit = best_of(lambda: regression.fit(X, y), args.repeats)
+    t_all = best_of(lambda: regression.fit_all(uids, X, y), args.repeats)
+
+    print("%10d %8d %14.2f %14.2f %16.0f" % (n, nusers, t_fit * 1000, t_all * 1000, n / t_all))
+
+
+if __name__ == "__main__":
+  main()
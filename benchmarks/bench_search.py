@@ -0,0 +1,178 @@
+#
+# bench_search.py
+#
+# Latency of searching journal notes at up to millions of
+# entries, with synthetic notes drawn from a Zipf-distributed
+# vocabulary:
+#
+#   memory   : lambda_functions/journal_search/search_index.py,
+#              the in-process fallback (build time and per-query
+#              latency for one user's index);
+#   fulltext : journal_search against a local MySQL server with
+#              the FULLTEXT index, next to the LIKE '%x%' query
+#              it replaces (only with --host).
+#
+# Usage:
+#   python bench_search.py [--sizes 10000,100000,1000000] [--queries 200]
+#   python bench_search.py --host localhost --user root --pwd ... [--users 10]
+#
+# In fulltext mode the scratch database (default
+# journalapp_bench) is dropped and recreated; do not point this
+# at real data.
+#
+
+import argparse
+import datetime
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "lambda_functions", "journal_search"))
+
+import search_index
+
+VOCABULARY = 5000
+
+
+def make_words(rng):
+  letters = "abcdefghijklmnopqrstuvwxyz"
+  return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(VOCABULARY)]
+
+
+def make_notes(rng, words, count):
+  cum_weights = list(itertools.accumulate(1.0 / (i + 1) for i in range(len(words))))  # Zipf
+  for _ in range(count):
+    yield " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(5, 40)))
+
+
+def make_queries(rng, words, count):
+  # mostly mid-frequency words, some two-word queries:
+  return [" ".join(rng.sample(words[20:2000], rng.choice([1, 1, 2]))) for _ in range(count)]
+
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def bench_memory(sizes, queries, rng):
+  words = make_words(rng)
+  qs = make_queries(rng, words, queries)
+  start_date = datetime.datetime(2000, 1, 1)
+
+  print("%10s %10s %10s %10s %10s %10s" % ("entries", "build s", "p50 ms", "p95 ms", "p99 ms", "hits/q"))
+
+  for size in sizes:
+    rows = [(i, start_date + datetime.timedelta(hours=i), notes, 5, 5, 5, 5, 5)
+            for i, notes in enumerate(make_notes(rng, words, size))]
+
+    start = time.perf_counter()
+    index = search_index.SearchIndex(rows)
+    build = time.perf_counter() - start
+
+    times = []
+    hits = 0
+    for q in qs:
+      start = time.perf_counter()
+      results = index.search(q, limit=21)
+      times.append((time.perf_counter() - start) * 1000)
+      hits += len(results)
+
+    print("%10d %10.2f %10.3f %10.3f %10.3f %10.1f" % (size, build, statistics.median(times),
+                                                      percentile(times, 95), percentile(times, 99),
+                                                      hits / len(qs)))
+
+
+def bench_fulltext(args, rng):
+  import pymysql
+
+  import localdb
+
+  db = (args.host, args.port, args.user, args.pwd, args.db)
+  localdb.create_scratch_db(*db)
+  uids = localdb.add_users(*db, args.users)
+  localdb.use_local_db(*db)
+  os.environ.setdefault("JOURNALAPP_LOG_SAMPLE_RATE", "0")
+  os.environ["JOURNALAPP_SEARCH_BACKEND"] = "fulltext"
+
+  words = make_words(rng)
+  qs = make_queries(rng, words, args.queries)
+  per_user = max(1, max(args.sizes) // len(uids))
+
+  print("seeding", per_user * len(uids), "entries...", file=sys.stderr)
+
+  dbConn = pymysql.connect(host=args.host, port=args.port, user=args.user, passwd=args.pwd,
+                           database=args.db)
+  sql = """INSERT INTO entries(uid, date, notes, sleep, eat, water, social, overall)
+                       VALUES(%s, %s, %s, %s, %s, %s, %s, %s)"""
+
+  with dbConn.cursor() as cur:
+    for uid in uids:
+      when = datetime.datetime(2000, 1, 1)
+      batch = []
+      for notes in make_notes(rng, words, per_user):
+        when += datetime.timedelta(hours=1)
+        batch.append((uid, when, notes[:512], 5, 5, 5, 5, 5))
+        if len(batch) == 5000:
+          cur.executemany(sql, batch)
+          batch = []
+      if batch:
+        cur.executemany(sql, batch)
+    dbConn.commit()
+
+  search = localdb.load_handler("journal_search")
+
+  fulltext = []
+  like = []
+  for q in qs:
+    uid = rng.choice(uids)
+    event = {"queryStringParameters": {"uid": str(uid), "q": q}}
+
+    start = time.perf_counter()
+    result = search.lambda_handler(event, None)
+    fulltext.append((time.perf_counter() - start) * 1000)
+    assert result["statusCode"] == 200, result
+
+    start = time.perf_counter()
+    with dbConn.cursor() as cur:
+      cur.execute("SELECT entryid FROM entries WHERE uid = %s AND notes LIKE %s "
+                  "ORDER BY entryid DESC LIMIT 21", [uid, "%" + q.split()[0] + "%"])
+      cur.fetchall()
+    like.append((time.perf_counter() - start) * 1000)
+
+  dbConn.close()
+
+  print("%10s %10s %10s %10s" % ("query", "p50 ms", "p95 ms", "p99 ms"))
+  for name, times in [("fulltext", fulltext), ("like", like)]:
+    print("%10s %10.3f %10.3f %10.3f" % (name, statistics.median(times),
+                                         percentile(times, 95), percentile(times, 99)))
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--sizes", default="10000,100000,1000000")
+  parser.add_argument("--queries", type=int, default=200)
+  parser.add_argument("--seed", type=int, default=310)
+  parser.add_argument("--host", help="benchmark FULLTEXT on this MySQL server")
+  parser.add_argument("--port", type=int, default=3306)
+  parser.add_argument("--user", default="root")
+  parser.add_argument("--pwd", default="")
+  parser.add_argument("--db", default="journalapp_bench")
+  parser.add_argument("--users", type=int, default=10)
+  args = parser.parse_args()
+
+  args.sizes = [int(s) for s in args.sizes.split(",")]
+  rng = random.Random(args.seed)
+
+  if args.host:
+    bench_fulltext(args, rng)
+  else:
+    bench_memory(args.sizes, args.queries, rng)
+
+
+if __name__ == "__main__":
+  main()
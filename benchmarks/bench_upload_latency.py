@@ -0,0 +1,101 @@
+#
+# bench_upload_latency.py
+#
+# Before/after latency of journal_upload's user check, run
+# in-process against a local MySQL server:
+#
+#   select : SELECT the user before every INSERT (the old path;
+#            the known-user cache is cleared before each call)
+#   cached : SELECT, but answered from the warm-container cache
+#   fk     : no SELECT, the entries.uid foreign key is the check
+#
+# Each mode uploads --count entries for random existing users,
+# then --count for a missing uid (which must get a 400).
+#
+# Usage:
+#   python bench_upload_latency.py --host localhost --user root --pwd ... [--count 2000]
+#
+# The scratch database (default journalapp_bench) is dropped
+# and recreated; do not point this at real data.
+#
+
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+
+import localdb
+
+
+def percentile(values, p):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def run(handler, uids, count, clear_cache, seconds):
+  """
+  Uploads count entries, returns latencies in ms
+  """
+  import handler as framework
+
+  times = []
+
+  for i in range(count):
+    if clear_cache:
+      framework._known_users.clear()
+
+    uid = random.choice(uids)
+    seconds[uid] = seconds.get(uid, 0) + 1  # unique (uid, date)
+
+    entry = {"notes": "benchmark", "sleep": 5, "eat": 5, "water": 5, "social": 5, "overall": 5,
+             "date": time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(1577836800 + seconds[uid]))}
+    event = {"pathParameters": {"uid": str(uid)}, "body": json.dumps(entry)}
+
+    start = time.perf_counter()
+    result = handler.lambda_handler(event, None)
+    times.append((time.perf_counter() - start) * 1000)
+
+    assert result["statusCode"] in (200, 400), result
+
+  return times
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--host", default="localhost")
+  parser.add_argument("--port", type=int, default=3306)
+  parser.add_argument("--user", default="root")
+  parser.add_argument("--pwd", default="")
+  parser.add_argument("--db", default="journalapp_bench")
+  parser.add_argument("--count", type=int, default=2000)
+  parser.add_argument("--users", type=int, default=100)
+  args = parser.parse_args()
+
+  db = (args.host, args.port, args.user, args.pwd, args.db)
+
+  localdb.create_scratch_db(*db)
+  uids = localdb.add_users(*db, args.users)
+  localdb.use_local_db(*db)
+
+  upload = localdb.load_handler("journal_upload")
+  seconds = {}
+
+  print("%8s %10s %10s %10s %10s" % ("mode", "p50 ms", "p95 ms", "p99 ms", "missing"))
+
+  for mode, check, clear_cache in [("select", "select", True),
+                                   ("cached", "select", False),
+                                   ("fk", "fk", False)]:
+    os.environ["JOURNALAPP_UPLOAD_USER_CHECK"] = check
+
+    times = run(upload, uids, args.count, clear_cache, seconds)
+    missing = run(upload, [max(uids) + 1000], min(args.count, 200), clear_cache, seconds)
+
+    print("%8s %10.3f %10.3f %10.3f %10.3f" % (mode, statistics.median(times),
+                                              percentile(times, 95), percentile(times, 99),
+                                              statistics.median(missing)))
+
+
+if __name__ == "__main__":
+  main()
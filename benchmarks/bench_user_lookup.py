@@ -0,0 +1,166 @@
+#
+# bench_user_lookup.py
+#
+# Seeds a scratch MySQL database with a growing number of
+# entries spread over many users, and after each step times the
+# per-user queries the lambdas run. With the (uid, date) key
+# from migrations/001 the lookup time should stay flat as the
+# table grows; with the original schema (--no-index) it grows
+# linearly with the table.
+#
+# Usage:
+#   python bench_user_lookup.py --host localhost --user root --pwd ... \
+#       [--sizes 100000,1000000,3000000] [--users 10000] [--no-index]
+#
+# The scratch database (default journalapp_bench) is dropped
+# and recreated; do not point this at real data.
+#
+
+import argparse
+import random
+import statistics
+import time
+
+import pymysql
+
+
+SCHEMA = [
+  """
+  CREATE TABLE users
+  (
+      uid       int not null AUTO_INCREMENT,
+      username  varchar(64) not null,
+      PRIMARY KEY  (uid),
+      unique(username)
+  )
+  """,
+  """
+  CREATE TABLE entries
+  (
+      entryid   int not null AUTO_INCREMENT,
+      uid       int not null,
+      date      datetime not null,
+      notes     varchar(512) not null,
+      sleep     int not null,
+      eat       int not null,
+      water     int not null,
+      social    int not null,
+      overall   int not null,
+      PRIMARY KEY (entryid),
+      FOREIGN KEY (uid) REFERENCES users(uid)
+      {keys}
+  )
+  """,
+]
+
+QUERIES = {
+  "recent": """
+    SELECT sleep, eat, water, social, overall FROM entries
+    WHERE uid = %s ORDER BY date DESC LIMIT 30
+  """,
+  "history": """
+    SELECT notes, sleep, eat, water, social, overall FROM entries
+    WHERE uid = %s
+  """,
+}
+
+
+def create_schema(dbConn, dbname, with_index):
+  keys = ", UNIQUE KEY entries_uid_date (uid, date)" if with_index else ""
+
+  with dbConn.cursor() as cur:
+    cur.execute("DROP DATABASE IF EXISTS " + dbname)
+    cur.execute("CREATE DATABASE " + dbname)
+    cur.execute("USE " + dbname)
+    cur.execute(SCHEMA[0])
+    cur.execute(SCHEMA[1].format(keys=keys))
+  dbConn.commit()
+
+
+def seed_users(dbConn, nusers):
+  with dbConn.cursor() as cur:
+    cur.executemany("INSERT INTO users(username) VALUES(%s)",
+                    [("user%d" % i,) for i in range(nusers)])
+  dbConn.commit()
+
+
+def seed_entries(dbConn, start, stop, nusers, chunk=20000):
+  """
+  Inserts entries numbered start..stop-1; entry i belongs to
+  user (i % nusers) + 1 and has a unique per-user timestamp
+  """
+  base = 1577836800  # 2020-01-01
+  sql = """
+    INSERT INTO entries(uid, date, notes, sleep, eat, water, social, overall)
+                VALUES(%s, FROM_UNIXTIME(%s), %s, %s, %s, %s, %s, %s)
+  """
+  notes = "x" * 200
+
+  for lo in range(start, stop, chunk):
+    hi = min(lo + chunk, stop)
+    rows = [((i % nusers) + 1, base + i, notes,
+             i % 10 + 1, (i * 3) % 10 + 1, (i * 7) % 10 + 1, (i * 5) % 10 + 1, (i * 11) % 10 + 1)
+            for i in range(lo, hi)]
+    with dbConn.cursor() as cur:
+      cur.executemany(sql, rows)
+    dbConn.commit()
+
+
+def time_query(dbConn, sql, uids):
+  """
+  Returns the median latency in milliseconds over uids
+  """
+  times = []
+
+  with dbConn.cursor() as cur:
+    for uid in uids:
+      start = time.perf_counter()
+      cur.execute(sql, [uid])
+      cur.fetchall()
+      times.append((time.perf_counter() - start) * 1000)
+
+  return statistics.median(times)
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--host", default="localhost")
+  parser.add_argument("--port", type=int, default=3306)
+  parser.add_argument("--user", default="root")
+  parser.add_argument("--pwd", default="")
+  parser.add_argument("--db", default="journalapp_bench")
+  parser.add_argument("--sizes", default="100000,1000000,3000000")
+  parser.add_argument("--users", type=int, default=10000)
+  parser.add_argument("--samples", type=int, default=200)
+  parser.add_argument("--no-index", action="store_true")
+  args = parser.parse_args()
+
+  sizes = [int(n) for n in args.sizes.split(",")]
+
+  dbConn = pymysql.connect(host=args.host, port=args.port, user=args.user, passwd=args.pwd)
+  create_schema(dbConn, args.db, not args.no_index)
+  seed_users(dbConn, args.users)
+
+  print("index:", "none" if args.no_index else "(uid, date)")
+  print("%12s %14s %14s" % ("rows", "recent (ms)", "history (ms)"))
+
+  seeded = 0
+  for size in sizes:
+    seed_entries(dbConn, seeded, size, args.users)
+    seeded = size
+
+    with dbConn.cursor() as cur:
+      cur.execute("ANALYZE TABLE entries")
+      cur.fetchall()
+
+    uids = [random.randint(1, args.users) for _ in range(args.samples)]
+    recent = time_query(dbConn, QUERIES["recent"], uids)
+    history = time_query(dbConn, QUERIES["history"], uids)
+
+    print("%12d %14.3f %14.3f" % (size, recent, history))
+
+  dbConn.close()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,172 @@
+#
+# local_s3.py
+#
+# A filesystem-backed stand-in for a boto3 S3 client, for
+# benchmarks and local testing of the lambdas without AWS.
+# Objects live under root/<bucket>/<key>. Only the calls the
+# lambdas make are implemented, with the same argument names
+# and return shapes as boto3.
+#
+# latency adds a fixed delay (seconds) to every request, to
+# mimic the round trip to S3 when measuring concurrency.
+#
+# The lambdas get their client from the layer's
+# storage.s3_client(), so a LocalS3 can be swapped in with
+# storage.set_s3_client(LocalS3(root)) before invoking
+# lambda_handler.
+#
+# Alternatively, run a local moto or minio server and set
+# [s3] endpoint_url in journalapp-config.ini (or the env var
+# JOURNALAPP_S3_ENDPOINT_URL); the lambdas then use a real
+# boto3 client against it.
+#
+
+import os
+import shutil
+import threading
+import time
+import urllib.parse
+
+try:
+  from botocore.exceptions import ClientError
+except ImportError:  # botocore not installed, mimic its shape
+  class ClientError(Exception):
+    def __init__(self, error_response, operation_name):
+      super().__init__(operation_name + ": " + error_response["Error"]["Code"])
+      self.response = error_response
+
+
+def _not_found(operation):
+  return ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, operation)
+
+
+class LocalS3:
+  def __init__(self, root, latency=0.0):
+    self.root = root
+    self.latency = latency
+    self._lock = threading.Lock()
+    self._uploads = {}
+    self._next_upload = 0
+    os.makedirs(root, exist_ok=True)
+
+  def _path(self, bucket, key):
+    path = os.path.normpath(os.path.join(self.root, bucket, key))
+    if not path.startswith(os.path.normpath(self.root) + os.sep):
+      raise ValueError("key escapes the bucket: " + key)
+    return path
+
+  def _wait(self):
+    if self.latency > 0:
+      time.sleep(self.latency)
+
+  def put_object(self, Bucket, Key, Body=b"", **kwargs):
+    self._wait()
+
+    path = self._path(Bucket, Key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "wb") as f:
+      if isinstance(Body, (bytes, bytearray)):
+        f.write(Body)
+      else:
+        shutil.copyfileobj(Body, f)
+
+    return {"ETag": '"%d"' % os.path.getsize(path)}
+
+  def get_object(self, Bucket, Key, **kwargs):
+    self._wait()
+
+    path = self._path(Bucket, Key)
+    if not os.path.isfile(path):
+      raise _not_found("GetObject")
+
+    return {"Body": open(path, "rb"), "ContentLength": os.path.getsize(path)}
+
+  def head_object(self, Bucket, Key, **kwargs):
+    self._wait()
+
+    path = self._path(Bucket, Key)
+    if not os.path.isfile(path):
+      raise _not_found("HeadObject")
+
+    return {"ContentLength": os.path.getsize(path)}
+
+  def delete_object(self, Bucket, Key, **kwargs):
+    self._wait()
+
+    path = self._path(Bucket, Key)
+    if os.path.isfile(path):
+      os.remove(path)
+
+    return {}
+
+  def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+    self.put_object(Bucket=Bucket, Key=Key, Body=Fileobj)
+
+  def download_fileobj(self, Bucket, Key, Fileobj, **kwargs):
+    body = self.get_object(Bucket=Bucket, Key=Key)["Body"]
+    with body:
+      shutil.copyfileobj(body, Fileobj)
+
+  def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+    params = Params or {}
+    path = self._path(params["Bucket"], params["Key"])
+    return "file://" + urllib.parse.quote(path) + "?method=" + ClientMethod
+
+  def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600):
+    return {
+      "url": "file://" + urllib.parse.quote(os.path.join(self.root, Bucket)),
+      "fields": dict(Fields or {}, key=Key),
+    }
+
+  #
+  # multipart uploads, each part is written to its own file under
+  # root/.multipart/<upload id>/ until complete_multipart_upload
+  # concatenates them, so large uploads are not held in memory:
+  #
+  def _part_path(self, UploadId, PartNumber):
+    return os.path.join(self.root, ".multipart", UploadId, "%05d" % PartNumber)
+
+  def create_multipart_upload(self, Bucket, Key, **kwargs):
+    with self._lock:
+      self._next_upload += 1
+      upload_id = str(self._next_upload)
+      self._uploads[upload_id] = (Bucket, Key)
+
+    os.makedirs(os.path.dirname(self._part_path(upload_id, 1)), exist_ok=True)
+
+    return {"UploadId": upload_id}
+
+  def upload_part(self, Bucket, Key, UploadId, PartNumber, Body, **kwargs):
+    self._wait()
+
+    if UploadId not in self._uploads:
+      raise ClientError({"Error": {"Code": "NoSuchUpload", "Message": "Not Found"}}, "UploadPart")
+
+    data = Body if isinstance(Body, (bytes, bytearray)) else Body.read()
+    with open(self._part_path(UploadId, PartNumber), "wb") as f:
+      f.write(data)
+
+    return {"ETag": '"%d-%d"' % (PartNumber, len(data))}
+
+  def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload, **kwargs):
+    self._wait()
+
+    self._uploads.pop(UploadId)
+    numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+
+    path = self._path(Bucket, Key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "wb") as f:
+      for n in numbers:
+        with open(self._part_path(UploadId, n), "rb") as part:
+          shutil.copyfileobj(part, f)
+
+    shutil.rmtree(os.path.dirname(self._part_path(UploadId, 1)), ignore_errors=True)
+    return {"Key": Key}
+
+  def abort_multipart_upload(self, Bucket, Key, UploadId, **kwargs):
+    self._uploads.pop(UploadId, None)
+    shutil.rmtree(os.path.dirname(self._part_path(UploadId, 1)), ignore_errors=True)
+    return {}
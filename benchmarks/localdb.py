@@ -0,0 +1,107 @@
+#
+# localdb.py
+#
+# Helpers for benchmarks that run the lambdas in-process
+# against a local MySQL server (no Docker needed, any mysqld
+# or mariadb will do).
+#
+# create_scratch_db builds a throwaway database from
+# createDB.sql, and use_local_db points the lambdas at it via
+# the JOURNALAPP_* environment overrides understood by
+# config.py.
+#
+
+import os
+import re
+import sys
+
+import pymysql
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+LAYER_DIR = os.path.join(ROOT, "lambda_layers", "journalapp_common", "python")
+
+#
+# statements in createDB.sql that are about the server rather
+# than the schema, and are skipped:
+#
+SKIP = ("CREATE DATABASE", "USE ", "DROP USER", "CREATE USER", "GRANT", "FLUSH")
+
+
+def schema_statements():
+  with open(os.path.join(ROOT, "createDB.sql")) as f:
+    text = f.read()
+
+  lines = [re.sub(r"--(\s.*)?$", "", line) for line in text.splitlines()]
+  statements = [stmt.strip() for stmt in "\n".join(lines).split(";")]
+
+  return [stmt for stmt in statements
+          if stmt != "" and not stmt.upper().startswith(SKIP)]
+
+
+def create_scratch_db(host, port, user, pwd, dbname):
+  """
+  Drops and recreates dbname from createDB.sql
+  """
+  dbConn = pymysql.connect(host=host, port=port, user=user, passwd=pwd)
+
+  with dbConn.cursor() as cur:
+    cur.execute("DROP DATABASE IF EXISTS " + dbname)
+    cur.execute("CREATE DATABASE " + dbname)
+    cur.execute("USE " + dbname)
+    for stmt in schema_statements():
+      cur.execute(stmt)
+
+  dbConn.commit()
+  dbConn.close()
+
+
+def use_local_db(host, port, user, pwd, dbname):
+  """
+  Points config.py (and so every lambda) at the local database
+  """
+  os.environ["JOURNALAPP_RDS_ENDPOINT"] = host
+  os.environ["JOURNALAPP_RDS_PORT_NUMBER"] = str(port)
+  os.environ["JOURNALAPP_RDS_USER_NAME"] = user
+  os.environ["JOURNALAPP_RDS_USER_PWD"] = pwd
+  os.environ["JOURNALAPP_RDS_DB_NAME"] = dbname
+
+  if LAYER_DIR not in sys.path:
+    sys.path.insert(0, LAYER_DIR)
+
+
+def load_handler(name):
+  """
+  Imports lambda_functions/<name>/lambda_function.py as a
+  module named <name>, so several handlers can be loaded side
+  by side
+  """
+  import importlib.util
+
+  handler_dir = os.path.join(ROOT, "lambda_functions", name)
+  if handler_dir not in sys.path:
+    sys.path.append(handler_dir)  # for the lambda's own modules
+
+  spec = importlib.util.spec_from_file_location(name, os.path.join(handler_dir, "lambda_function.py"))
+  module = importlib.util.module_from_spec(spec)
+  spec.loader.exec_module(module)
+
+  return module
+
+
+def add_users(host, port, user, pwd, dbname, count):
+  """
+  Inserts count users and returns their uids
+  """
+  dbConn = pymysql.connect(host=host, port=port, user=user, passwd=pwd, database=dbname)
+
+  with dbConn.cursor() as cur:
+    cur.executemany("INSERT INTO users(username) VALUES(%s)",
+                    [("bench_user_%d" % i,) for i in range(count)])
+    cur.execute("SELECT uid FROM users WHERE username LIKE 'bench_user_%%' ORDER BY uid")
+    uids = [row[0] for row in cur.fetchall()]
+
+  dbConn.commit()
+  dbConn.close()
+
+  return uids
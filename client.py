@@ -0,0 +1,500 @@
+#
+# client.py
+#
+# Python client for the JournalApp API.
+#
+#   from client import JournalClient
+#
+#   with JournalClient("https://xyz.execute-api.us-east-2.amazonaws.com/test") as api:
+#     api.upload_entry(80001, {"sleep": 7, "eat": 6, "water": 5,
+#                              "social": 8, "overall": 7, "notes": "..."})
+#     api.upload_entries(80001, backlog)      # batched, 500 per request
+#     print(api.quote(80001))
+#
+# or, from asyncio code, AsyncJournalClient with the same
+# methods as coroutines (needs aiohttp).
+#
+# What it does for you:
+#
+#  - keep-alive: one requests.Session (aiohttp.ClientSession)
+#    with a connection pool, so a sync job pays one TLS
+#    handshake per connection, not per entry;
+#  - batching: upload_entries splits a backlog into requests of
+#    up to batch_size entries (journal_upload's batch mode), and
+#    batcher() buffers entries and sends them as batches fill;
+#  - retries: connection errors, 429 and 5xx are retried with
+#    exponential backoff and jitter (honouring Retry-After). Every
+#    upload carries an Idempotency-Key, the same on each retry,
+#    so a retry of a request that did reach the server returns
+#    the first response instead of writing twice;
+#  - compression: with gzip_min_bytes set, bodies at least that
+#    long are sent gzipped with Content-Encoding: gzip. It is off
+#    by default, since API Gateway only passes a gzipped body on
+#    intact if the API lists it in binaryMediaTypes (see the
+#    README).
+#
+# Routes are relative to the base url and can be changed with
+# the routes argument, e.g. for a different API Gateway stage
+# layout.
+#
+
+import datetime
+import gzip
+import hashlib
+import json
+import random
+import time
+import uuid
+
+import requests
+import requests.adapters
+
+ROUTES = {
+  "upload": "upload-entry/{uid}",
+  "upload_image": "upload-image/{uid}",
+  "delete_image": "image/{uid}/{imageid}",
+  "quote": "quote",
+  "regression": "regression",
+  "trends": "trends",
+  "collage": "collage",
+}
+
+MAX_BATCH = 500  # journal_upload's limit
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class JournalError(Exception):
+  """
+  The API answered with an error status
+
+  Attributes
+  ----------
+  status : the HTTP status (integer),
+  body : the response body, parsed if JSON
+  """
+
+  def __init__(self, status, body):
+    super().__init__(str(status) + ": " + str(body))
+    self.status = status
+    self.body = body
+
+
+###################################################################
+#
+# helpers shared by the sync and async clients
+#
+def _entry_json(entry):
+  """
+  Copy of entry with a datetime "date" formatted for the API
+  """
+  entry = dict(entry)
+  if isinstance(entry.get("date"), datetime.datetime):
+    entry["date"] = entry["date"].strftime('%Y-%m-%d %H:%M:%S')
+  return entry
+
+
+def _encode(body, gzip_min_bytes):
+  """
+  Returns (data, headers) for a JSON request body
+  """
+  data = json.dumps(body).encode()
+  headers = {"Content-Type": "application/json"}
+
+  if gzip_min_bytes is not None and len(data) >= gzip_min_bytes:
+    data = gzip.compress(data, compresslevel=5)
+    headers["Content-Encoding"] = "gzip"
+
+  return data, headers
+
+
+def _decode(text):
+  try:
+    return json.loads(text)
+  except ValueError:
+    return text
+
+
+def _backoff(attempt, base, cap, retry_after=None):
+  """
+  Seconds to wait before retry # attempt (1, 2, ...)
+  """
+  if retry_after is not None:
+    try:
+      return min(cap, float(retry_after))
+    except ValueError:
+      pass
+
+  return random.uniform(0, min(cap, base * (2 ** (attempt - 1))))  # full jitter
+
+
+def _chunks(items, size):
+  for lo in range(0, len(items), size):
+    yield items[lo:lo + size]
+
+
+def _file_sha256(path):
+  digest = hashlib.sha256()
+  with open(path, "rb") as f:
+    for chunk in iter(lambda: f.read(1024 * 1024), b""):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+###################################################################
+#
+# JournalClient:
+#
+class JournalClient:
+  """
+  Synchronous client for the JournalApp API
+
+  Parameters
+  ----------
+  base_url : the API's url, e.g. the API Gateway stage url,
+  timeout : seconds per request (float),
+  retries : max retries of a failed request (integer),
+  backoff : base backoff in seconds, doubled per retry (float),
+  max_backoff : cap on one backoff (float),
+  batch_size : entries per upload request (integer, <= 500),
+  gzip_min_bytes : gzip bodies at least this long, e.g. 1024;
+                   None (the default) to never gzip. Needs
+                   binaryMediaTypes on the API (integer),
+  pool_size : max keep-alive connections (integer),
+  routes : overrides for ROUTES (dict)
+  """
+
+  def __init__(self, base_url, timeout=10.0, retries=4, backoff=0.25, max_backoff=8.0,
+               batch_size=MAX_BATCH, gzip_min_bytes=None, pool_size=10, routes=None):
+    self.base_url = base_url.rstrip("/")
+    self.timeout = timeout
+    self.retries = retries
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.batch_size = min(batch_size, MAX_BATCH)
+    self.gzip_min_bytes = gzip_min_bytes
+    self.routes = dict(ROUTES, **(routes or {}))
+
+    self.session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    self.session.mount("https://", adapter)
+    self.session.mount("http://", adapter)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def close(self):
+    self.session.close()
+
+  def url(self, route, uid=None, **fields):
+    return self.base_url + "/" + self.routes[route].format(uid=uid, **fields)
+
+  def request(self, method, url, body=None, params=None, idempotency_key=None):
+    """
+    Sends a request with retries, returns the parsed response
+    body; raises JournalError for an error status
+    """
+    headers = {}
+    data = None
+
+    if body is not None:
+      data, headers = _encode(body, self.gzip_min_bytes)
+    if idempotency_key is not None:
+      headers["Idempotency-Key"] = idempotency_key
+
+    attempt = 0
+    while True:
+      try:
+        res = self.session.request(method, url, data=data, params=params, headers=headers,
+                                   timeout=self.timeout)
+      except (requests.ConnectionError, requests.Timeout):
+        if attempt >= self.retries:
+          raise
+        attempt += 1
+        time.sleep(_backoff(attempt, self.backoff, self.max_backoff))
+        continue
+
+      if res.status_code in RETRY_STATUS and attempt < self.retries:
+        attempt += 1
+        time.sleep(_backoff(attempt, self.backoff, self.max_backoff,
+                            res.headers.get("Retry-After")))
+        continue
+
+      body = _decode(res.text)
+      if res.status_code >= 400:
+        raise JournalError(res.status_code, body)
+
+      return body
+
+  #
+  # entries:
+  #
+  def upload_entry(self, uid, entry, request_id=None):
+    """
+    Uploads one entry (dict with notes, sleep, eat, water,
+    social, overall and optionally date)
+    """
+    return self.request("POST", self.url("upload", uid), body=_entry_json(entry),
+                        idempotency_key=request_id or str(uuid.uuid4()))
+
+  def upload_entries(self, uid, entries):
+    """
+    Uploads a list of entries in batches, returns the number
+    of entries inserted. Every entry needs its own date: a batch
+    with an undated entry, or two entries with the same date, is
+    rejected
+    """
+    inserted = 0
+
+    for batch in _chunks([_entry_json(e) for e in entries], self.batch_size):
+      result = self.request("POST", self.url("upload", uid), body=batch,
+                            idempotency_key=str(uuid.uuid4()))
+      inserted += result.get("inserted", len(batch)) if isinstance(result, dict) else len(batch)
+
+    return inserted
+
+  def batcher(self, uid):
+    """
+    Returns a Batcher that uploads entries for uid as batches
+    fill; use it as a context manager to flush at the end
+    """
+    return Batcher(self, uid)
+
+  #
+  # images:
+  #
+  def reserve_image(self, uid, filename, content_type, date=None, request_id=None, sha256=None):
+    """
+    Starts an image upload, returns the reservation with the
+    presigned POST url and fields -- or "uploaded": true if the
+    server already has the content with that sha256
+    """
+    body = {"filename": filename, "content_type": content_type}
+    if date is not None:
+      body["date"] = _entry_json({"date": date})["date"]
+    if sha256 is not None:
+      body["sha256"] = sha256
+
+    return self.request("POST", self.url("upload_image", uid), body=body,
+                        idempotency_key=request_id or str(uuid.uuid4()))
+
+  def upload_image(self, uid, path, content_type="image/jpeg", date=None):
+    """
+    Reserves and uploads an image file, returns its imageid; the
+    file is not sent if the server already has its content
+    """
+    import os
+
+    reservation = self.reserve_image(uid, os.path.basename(path), content_type, date,
+                                     sha256=_file_sha256(path))
+    if reservation.get("uploaded"):
+      return reservation["imageid"]
+
+    with open(path, "rb") as f:
+      res = self.session.post(reservation["url"], data=reservation["fields"],
+                              files={"file": (os.path.basename(path), f, content_type)},
+                              timeout=max(self.timeout, 60))
+
+    if res.status_code >= 300:
+      raise JournalError(res.status_code, res.text)
+
+    return reservation["imageid"]
+
+  def delete_image(self, uid, imageid):
+    return self.request("DELETE", self.url("delete_image", uid, imageid=imageid))
+
+  #
+  # reads:
+  #
+  def quote(self, uid):
+    return self.request("GET", self.url("quote"), params={"uid": uid})
+
+  def regression(self, uid, **features):
+    return self.request("GET", self.url("regression"), params=dict(features, uid=uid))
+
+  def trends(self, uid, start, end, period="day"):
+    return self.request("GET", self.url("trends"),
+                        params={"uid": uid, "start": start, "end": end, "period": period})
+
+  def collage(self, uid, start, end, tile=256):
+    return self.request("GET", self.url("collage"),
+                        params={"uid": uid, "start": start, "end": end, "tile": tile})
+
+
+###################################################################
+#
+# Batcher:
+#
+# Buffers entries for one user and uploads them batch_size at a
+# time; flush() (or leaving the with block) sends the rest. Each
+# entry needs a date, as for upload_entries.
+#
+class Batcher:
+  def __init__(self, client, uid):
+    self.client = client
+    self.uid = uid
+    self.pending = []
+    self.inserted = 0
+
+  def add(self, entry):
+    self.pending.append(entry)
+    if len(self.pending) >= self.client.batch_size:
+      self.flush()
+
+  def flush(self):
+    if self.pending:
+      batch, self.pending = self.pending, []
+      self.inserted += self.client.upload_entries(self.uid, batch)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, *exc):
+    if exc_type is None:
+      self.flush()
+
+
+###################################################################
+#
+# AsyncJournalClient:
+#
+# The same API for asyncio code, over one aiohttp session. aiohttp
+# is only imported when the client is created.
+#
+class AsyncJournalClient:
+  """
+  Asynchronous client for the JournalApp API; parameters as for
+  JournalClient, plus concurrency, the max # of batches
+  upload_entries has in flight at once
+  """
+
+  def __init__(self, base_url, timeout=10.0, retries=4, backoff=0.25, max_backoff=8.0,
+               batch_size=MAX_BATCH, gzip_min_bytes=None, pool_size=10, routes=None,
+               concurrency=4):
+    import aiohttp
+
+    self._aiohttp = aiohttp
+    self.base_url = base_url.rstrip("/")
+    self.timeout = aiohttp.ClientTimeout(total=timeout)
+    self.retries = retries
+    self.backoff = backoff
+    self.max_backoff = max_backoff
+    self.batch_size = min(batch_size, MAX_BATCH)
+    self.gzip_min_bytes = gzip_min_bytes
+    self.routes = dict(ROUTES, **(routes or {}))
+    self.concurrency = concurrency
+    self._pool_size = pool_size
+    self.session = None
+
+  async def __aenter__(self):
+    return self
+
+  async def __aexit__(self, *exc):
+    await self.close()
+
+  async def close(self):
+    if self.session is not None:
+      await self.session.close()
+      self.session = None
+
+  def _session(self):
+    # created on first use, inside the running event loop:
+    if self.session is None:
+      connector = self._aiohttp.TCPConnector(limit=self._pool_size)
+      self.session = self._aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+    return self.session
+
+  def url(self, route, uid=None, **fields):
+    return self.base_url + "/" + self.routes[route].format(uid=uid, **fields)
+
+  async def request(self, method, url, body=None, params=None, idempotency_key=None):
+    import asyncio
+
+    headers = {}
+    data = None
+
+    if body is not None:
+      data, headers = _encode(body, self.gzip_min_bytes)
+    if idempotency_key is not None:
+      headers["Idempotency-Key"] = idempotency_key
+    if params is not None:
+      params = {k: str(v) for k, v in params.items()}
+
+    attempt = 0
+    while True:
+      try:
+        async with self._session().request(method, url, data=data, params=params,
+                                           headers=headers) as res:
+          status = res.status
+          text = await res.text()
+          retry_after = res.headers.get("Retry-After")
+      except (self._aiohttp.ClientConnectionError, asyncio.TimeoutError):
+        if attempt >= self.retries:
+          raise
+        attempt += 1
+        await asyncio.sleep(_backoff(attempt, self.backoff, self.max_backoff))
+        continue
+
+      if status in RETRY_STATUS and attempt < self.retries:
+        attempt += 1
+        await asyncio.sleep(_backoff(attempt, self.backoff, self.max_backoff, retry_after))
+        continue
+
+      body = _decode(text)
+      if status >= 400:
+        raise JournalError(status, body)
+
+      return body
+
+  async def upload_entry(self, uid, entry, request_id=None):
+    return await self.request("POST", self.url("upload", uid), body=_entry_json(entry),
+                              idempotency_key=request_id or str(uuid.uuid4()))
+
+  async def upload_entries(self, uid, entries):
+    """
+    Uploads a list of entries in batches, up to concurrency
+    batches at a time; returns the number inserted. Every entry
+    needs its own date, as for JournalClient.upload_entries
+    """
+    import asyncio
+
+    limit = asyncio.Semaphore(self.concurrency)
+
+    async def send(batch):
+      async with limit:
+        result = await self.request("POST", self.url("upload", uid), body=batch,
+                                    idempotency_key=str(uuid.uuid4()))
+        return result.get("inserted", len(batch)) if isinstance(result, dict) else len(batch)
+
+    batches = list(_chunks([_entry_json(e) for e in entries], self.batch_size))
+    return sum(await asyncio.gather(*[send(batch) for batch in batches]))
+
+  async def reserve_image(self, uid, filename, content_type, date=None, request_id=None, sha256=None):
+    body = {"filename": filename, "content_type": content_type}
+    if date is not None:
+      body["date"] = _entry_json({"date": date})["date"]
+    if sha256 is not None:
+      body["sha256"] = sha256
+
+    return await self.request("POST", self.url("upload_image", uid), body=body,
+                              idempotency_key=request_id or str(uuid.uuid4()))
+
+  async def delete_image(self, uid, imageid):
+    return await self.request("DELETE", self.url("delete_image", uid, imageid=imageid))
+
+  async def quote(self, uid):
+    return await self.request("GET", self.url("quote"), params={"uid": uid})
+
+  async def regression(self, uid, **features):
+    return await self.request("GET", self.url("regression"), params=dict(features, uid=uid))
+
+  async def trends(self, uid, start, end, period="day"):
+    return await self.request("GET", self.url("trends"),
+                              params={"uid": uid, "start": start, "end": end, "period": period})
+
+  async def collage(self, uid, start, end, tile=256):
+    return await self.request("GET", self.url("collage"),
+                              params={"uid": uid, "start": start, "end": end, "tile": tile})
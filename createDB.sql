@@ -4,9 +4,16 @@ CREATE DATABASE IF NOT EXISTS journalapp;
 USE journalapp;
 
 
+DROP TABLE IF EXISTS schema_version;
+DROP TABLE IF EXISTS idempotency_keys;
+DROP TABLE IF EXISTS user_models;
+DROP TABLE IF EXISTS daily_stats;
+DROP TABLE IF EXISTS user_stats;
 DROP TABLE IF EXISTS entries;
-DROP TABLE IF EXISTS users;
+DROP TABLE IF EXISTS image_variants;
+DROP TABLE IF EXISTS image_blobs;
 DROP TABLE IF EXISTS images;
+DROP TABLE IF EXISTS users;
 
 
 CREATE TABLE users
@@ -32,9 +39,12 @@ CREATE TABLE entries
     water	      int not null,
     social	      int not null,
     overall  	      int not null,
+    requestid         varchar(64),  -- idempotency key of queued uploads, else null
     PRIMARY KEY (entryid),
     FOREIGN KEY (uid) REFERENCES users(uid),
-    UNIQUE (date)
+    UNIQUE KEY entries_uid_date (uid, date),  -- per-user time-range lookups
+    UNIQUE KEY entries_uid_requestid (uid, requestid),
+    FULLTEXT INDEX entries_notes_ft (notes)  -- journal_search
 );
 
 
@@ -44,19 +54,173 @@ ALTER TABLE entries AUTO_INCREMENT = 1001;  -- starting value
 
 CREATE TABLE images
 (
-    imageid	    int not null,
+    imageid	    int not null AUTO_INCREMENT,
     uid		    int not null,
     date	    datetime not null,
     bucketkey	    varchar(256) not null,
+    status          varchar(16) not null,  -- 'pending' until the S3 upload is confirmed, then 'uploaded'
+    size            bigint,                -- bytes, set when confirmed
+    sha256          char(64),              -- content hash if stored as a blob, see image_blobs
     PRIMARY KEY (imageid),
     FOREIGN KEY (uid) REFERENCES users(uid),
-    UNIQUE (date),
+    UNIQUE KEY images_uid_date (uid, date),  -- per-user time-range lookups
+    INDEX images_bucketkey (bucketkey)       -- shared by the images of a blob
+);
+
+
+ALTER TABLE images AUTO_INCREMENT = 2001;  -- starting value
+
+
+--
+-- content-addressed image objects, shared by a user's images
+-- rows with the same sha256 (see imageblobs.py):
+--
+CREATE TABLE image_blobs
+(
+    uid             int not null,          -- blobs are per user, never shared
+    sha256          char(64) not null,
+    bucketkey       varchar(256) not null,
+    status          varchar(16) not null,  -- 'pending' until the upload is verified, then 'uploaded'
+    size            bigint,                -- bytes, set when verified
+    refcount        int not null,          -- # of images rows
+    PRIMARY KEY (uid, sha256),
+    FOREIGN KEY (uid) REFERENCES users(uid),
+    UNIQUE (bucketkey)
+);
+
+
+--
+-- downscaled renditions of each image object, made by
+-- journal_image_variants (see imagevariants.py):
+--
+CREATE TABLE image_variants
+(
+    source          varchar(256) not null,  -- images.bucketkey it was made from
+    variant         varchar(16) not null,   -- 'thumb', 'medium'
+    bucketkey       varchar(256) not null,
+    width           int not null,
+    height          int not null,
+    size            bigint not null,        -- bytes
+    PRIMARY KEY (source, variant),
     UNIQUE (bucketkey)
-)
+);
+
+
+--
+-- running per-user statistics, maintained by journal_upload:
+--
+CREATE TABLE user_stats
+(
+    uid                 int not null,
+    n                   bigint not null,  -- # of entries
+    last_entryid        int not null,     -- changes on every upload
+    s_sleep         bigint not null,  -- sum
+    s_eat           bigint not null,  -- sum
+    s_water         bigint not null,  -- sum
+    s_social        bigint not null,  -- sum
+    s_overall       bigint not null,  -- sum
+    ss_sleep_sleep      bigint not null,  -- sum of products
+    ss_sleep_eat        bigint not null,  -- sum of products
+    ss_sleep_water      bigint not null,  -- sum of products
+    ss_sleep_social     bigint not null,  -- sum of products
+    ss_sleep_overall    bigint not null,  -- sum of products
+    ss_eat_eat          bigint not null,  -- sum of products
+    ss_eat_water        bigint not null,  -- sum of products
+    ss_eat_social       bigint not null,  -- sum of products
+    ss_eat_overall      bigint not null,  -- sum of products
+    ss_water_water      bigint not null,  -- sum of products
+    ss_water_social     bigint not null,  -- sum of products
+    ss_water_overall    bigint not null,  -- sum of products
+    ss_social_social    bigint not null,  -- sum of products
+    ss_social_overall   bigint not null,  -- sum of products
+    ss_overall_overall  bigint not null,  -- sum of products
+    PRIMARY KEY (uid),
+    FOREIGN KEY (uid) REFERENCES users(uid)
+);
+
+
+--
+-- per-user, per-day rollup for journal_trends, maintained by
+-- the uploads (see dailystats.py):
+--
+CREATE TABLE daily_stats
+(
+    uid             int not null,
+    day             date not null,
+    n               int not null,  -- # of entries
+    s_sleep         bigint not null,  -- sum
+    s_eat           bigint not null,  -- sum
+    s_water         bigint not null,  -- sum
+    s_social        bigint not null,  -- sum
+    s_overall       bigint not null,  -- sum
+    min_sleep       int not null,
+    min_eat         int not null,
+    min_water       int not null,
+    min_social      int not null,
+    min_overall     int not null,
+    max_sleep       int not null,
+    max_eat         int not null,
+    max_water       int not null,
+    max_social      int not null,
+    max_overall     int not null,
+    PRIMARY KEY (uid, day),
+    FOREIGN KEY (uid) REFERENCES users(uid)
+);
+
+
+--
+-- cached regression fits, see journal_linear_regression:
+--
+CREATE TABLE user_models
+(
+    uid             int not null,
+    last_entryid    int not null,  -- user_stats.last_entryid when fitted
+    n               bigint not null,
+    intercept       double not null,
+    sleep           double not null,
+    eat             double not null,
+    water           double not null,
+    social          double not null,
+    r2              double,        -- null if overall never varied
+    fitted          datetime not null,
+    PRIMARY KEY (uid),
+    FOREIGN KEY (uid) REFERENCES users(uid)
+);
+
+
+--
+-- responses to requests that carried an idempotency key, see
+-- lambda_layers/journalapp_common/python/idempotency.py:
+--
+CREATE TABLE idempotency_keys
+(
+    uid             int not null,
+    endpoint        varchar(64) not null,  -- lambda name
+    requestid       varchar(64) not null,  -- the client's key
+    status          int not null,
+    response        mediumtext not null,
+    created         datetime not null,
+    PRIMARY KEY (uid, endpoint, requestid),
+    FOREIGN KEY (uid) REFERENCES users(uid)
+);
+
+
+--
+-- schema version, bumped by each script in migrations/:
+--
+CREATE TABLE schema_version
+(
+    version     int not null,
+    applied     datetime not null,
+    PRIMARY KEY (version)
+);
+
+
+INSERT INTO schema_version(version, applied) values(10, NOW());
 
 
 INSERT INTO users(username)  -- pwd = abc123!!
-            values('p_sarkar')
+            values('p_sarkar');
 
 
 
@@ -77,6 +241,9 @@ CREATE USER 'journalapp-read-write' IDENTIFIED BY 'def456!!';
 
 GRANT SELECT, SHOW VIEW ON journalapp.* 
       TO 'journalapp-read-only';
+-- lets datatier.RoutingConnection read replication lag on replicas:
+GRANT REPLICATION CLIENT ON *.*
+      TO 'journalapp-read-only';
 GRANT SELECT, SHOW VIEW, INSERT, UPDATE, DELETE, DROP, CREATE, ALTER ON journalapp.* 
       TO 'journalapp-read-write';
       
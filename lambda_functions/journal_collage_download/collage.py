@@ -0,0 +1,116 @@
+#
+# collage.py
+#
+# Builds a collage (one JPEG) from images stored in S3.
+#
+# Images are fetched concurrently by a bounded thread pool and
+# each one is downscaled to its tile size by the worker as soon
+# as it arrives; the main thread pastes finished tiles into the
+# canvas in whatever order they complete. At any moment only
+# max_workers compressed originals (and their decoded, already
+# reduced tiles) are in memory, never the full set of
+# full-resolution images. For JPEGs, Image.draft() lets the
+# decoder scale down while decoding, so even a single large
+# photo is never fully decoded.
+#
+# The S3 client is passed in, so anything with boto3's
+# get_object() works: a real client, one pointed at a local
+# endpoint (moto, minio), or benchmarks/local_s3.LocalS3.
+#
+
+import concurrent.futures
+import io
+import math
+
+from PIL import Image
+
+MAX_CANVAS = 4096  # pixels, either dimension
+BACKGROUND = (255, 255, 255)
+
+
+###################################################################
+#
+# layout:
+#
+# Returns (columns, rows, tile) for n images: a near-square grid
+# whose tiles are at most max_tile pixels and whose canvas is at
+# most MAX_CANVAS pixels on a side.
+#
+def layout(n, max_tile):
+  columns = max(1, math.ceil(math.sqrt(n)))
+  rows = max(1, math.ceil(n / columns))
+  tile = max(16, min(max_tile, MAX_CANVAS // columns))
+
+  return columns, rows, tile
+
+
+###################################################################
+#
+# fetch_tile:
+#
+# Downloads one object and returns it downscaled to fit in a
+# tile x tile box, as an RGB image.
+#
+def fetch_tile(s3, bucket, key, tile):
+  obj = s3.get_object(Bucket=bucket, Key=key)
+  data = obj["Body"].read()
+
+  with Image.open(io.BytesIO(data)) as img:
+    img.draft("RGB", (tile, tile))  # JPEG: decode at reduced scale
+    img.thumbnail((tile, tile))
+    return img.convert("RGB")
+
+
+###################################################################
+#
+# build_collage:
+#
+# Fetches the given keys from bucket and returns the collage as
+# JPEG bytes, plus a list of keys that could not be used.
+#
+def build_collage(s3, bucket, keys, max_tile=256, max_workers=8, quality=85):
+  """
+  Builds a collage of the images at keys
+
+  Parameters
+  ----------
+  s3 : S3 client (anything with get_object),
+  bucket : bucket name (string),
+  keys : list of object keys, in display order,
+  max_tile : largest tile size in pixels (integer),
+  max_workers : # of concurrent downloads (integer),
+  quality : JPEG quality of the result (integer)
+
+  Returns
+  -------
+  (jpeg bytes, list of keys that failed)
+  """
+  columns, rows, tile = layout(len(keys), max_tile)
+
+  canvas = Image.new("RGB", (columns * tile, rows * tile), BACKGROUND)
+  failed = []
+
+  with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+    futures = {pool.submit(fetch_tile, s3, bucket, key, tile): i
+               for i, key in enumerate(keys)}
+
+    for future in concurrent.futures.as_completed(futures):
+      i = futures.pop(future)
+
+      try:
+        img = future.result()
+      except Exception:
+        failed.append(keys[i])  # reported by the caller
+        continue
+
+      # center the tile in its cell:
+      x = (i % columns) * tile + (tile - img.width) // 2
+      y = (i // columns) * tile + (tile - img.height) // 2
+      canvas.paste(img, (x, y))
+      img.close()
+
+  out = io.BytesIO()
+  canvas.save(out, format="JPEG", quality=quality)
+  canvas.close()
+
+  return out.getvalue(), failed
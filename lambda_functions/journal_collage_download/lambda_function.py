@@ -1,5 +1,99 @@
-import boto3
-import json
-import os
-import requests
+#
+# Builds a collage of a user's images over a date range, stores
+# it in S3, and returns a presigned URL to download it.
+#
+#   GET ?uid=80001&start=2024-01-01&end=2024-01-31[&tile=256]
+#
+# start and end are inclusive dates. The images are fetched
+# from S3 in parallel and downscaled as they arrive; see
+# collage.py. Where journal_image_variants has made a rendition
+# at least a tile in size, that is fetched instead of the
+# original.
+#
+# boto3 and Pillow are imported by the code path that needs
+# them rather than at module import, to keep cold starts fast.
+#
+# datatier, config, storage, imagevariants, validation and
+# handler come from the journalapp_common layer (lambda_layers/).
+#
 
+import applog
+import datatier
+import imagevariants
+import storage
+import uuid
+
+from handler import lambda_entry, response
+from validation import BadRequest, date_check, query_param
+
+MAX_IMAGES = 500
+MAX_TILE = 512
+
+
+@lambda_entry("journal_collage_download")
+def lambda_handler(event, context, dbConn):
+  #
+  # get uid and date range from api gateway url parameters:
+  #
+  uid = query_param(event, "uid")
+  start = query_param(event, "start")
+  end = query_param(event, "end")
+
+  with applog.stage("validate"):
+    for value in [start, end]:
+      if date_check(value)[1] is not None:
+        raise BadRequest("start and end must be YYYY-MM-DD")
+
+    try:
+      tile = min(int(query_param(event, "tile", 256)), MAX_TILE)
+    except ValueError:
+      raise BadRequest("tile must be an integer")
+    if tile < 1:
+      raise BadRequest("tile must be positive")
+
+  applog.set_fields(uid=uid, start=start, end=end)
+
+  #
+  # look up the images, an index range scan on (uid, date), each
+  # as its smallest rendition that still fills a tile:
+  #
+  sql = """
+    SELECT """ + imagevariants.RENDITION_SQL + """ FROM images
+    WHERE uid = %s AND date >= %s AND date < DATE_ADD(%s, INTERVAL 1 DAY)
+      AND status = 'uploaded'
+    ORDER BY date
+    LIMIT %s
+  """
+
+  rows = datatier.retrieve_all_rows(dbConn, sql, [tile, uid, start, end, MAX_IMAGES])
+  keys = [row[0] for row in rows]
+
+  if len(keys) == 0:
+    raise BadRequest("no images in that date range...")
+
+  applog.set_fields(images=len(keys))
+
+  import collage
+
+  s3 = storage.s3_client()
+  bucket_name = storage.bucket_name()
+
+  with applog.stage("collage"):
+    data, failed = collage.build_collage(s3, bucket_name, keys, max_tile=tile)
+
+  if failed:
+    applog.warning("images skipped", failed=failed)
+
+  #
+  # store the collage and hand back a download link:
+  #
+  collage_key = "collages/" + str(uid) + "/" + str(uuid.uuid4()) + ".jpg"
+
+  with applog.stage("s3"):
+    s3.put_object(Bucket=bucket_name, Key=collage_key, Body=data, ContentType="image/jpeg")
+
+  url = s3.generate_presigned_url('get_object',
+                                  Params={'Bucket': bucket_name, 'Key': collage_key},
+                                  ExpiresIn=3600)
+
+  return response(200, {"url": url, "images": len(keys) - len(failed), "failed": failed})
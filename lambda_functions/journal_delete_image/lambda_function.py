@@ -0,0 +1,88 @@
+#
+# Deletes one of a user's images.
+#
+#   DELETE /image/{uid}/{imageid}
+#
+# The images row goes in one transaction with the bookkeeping of
+# what it points at (see imageblobs.release_actions): for a
+# content-addressed image the blob's reference count is
+# decremented, and the blob row is deleted with its last
+# reference; the variant rows go once no images row uses their
+# object. Only then, and only if this delete released the
+# object, are the object and its variants deleted from S3, so
+# the same photo in the user's other images is never touched.
+#
+# If the S3 deletes fail after the commit, the objects are
+# orphaned rather than referenced while missing; the error is
+# logged with their keys.
+#
+# datatier, config, storage, imageblobs, imagevariants,
+# validation and handler come from the journalapp_common layer
+# (lambda_layers/).
+#
+
+import applog
+import datatier
+import imageblobs
+import imagevariants
+import storage
+
+from handler import lambda_entry, response
+from validation import BadRequest, integer, path_param
+
+check_imageid = integer(1, 2 ** 31 - 1)
+
+
+def delete_objects(bucketkey):
+  """
+  Deletes an image object and its variants from S3
+  """
+  s3 = storage.s3_client()
+  bucket = storage.bucket_name()
+
+  keys = [bucketkey] + [imagevariants.variant_key(bucketkey, name)
+                        for name, size in imagevariants.VARIANTS]
+
+  try:
+    for key in keys:
+      s3.delete_object(Bucket=bucket, Key=key)  # missing keys are not an error
+  except Exception as err:
+    applog.error("could not delete objects", error=str(err), keys=keys)
+
+
+@lambda_entry("journal_delete_image")
+def lambda_handler(event, context, dbConn):
+  uid = path_param(event, "uid")
+
+  imageid, error = check_imageid(path_param(event, "imageid"))
+  if error is not None:
+    raise BadRequest("imageid " + error)
+
+  applog.set_fields(uid=uid, imageid=imageid)
+
+  row = datatier.retrieve_one_row(dbConn,
+                                  "SELECT bucketkey, sha256 FROM images WHERE imageid = %s AND uid = %s;",
+                                  [imageid, uid])
+  if row == ():
+    return response(404, "no such image...")
+
+  bucketkey, sha256 = row
+
+  counts = datatier.perform_transaction(dbConn,
+                                        imageblobs.release_actions(imageid, uid, bucketkey, sha256))
+
+  if sha256 is not None:
+    deleted, released = counts[1], counts[2] == 1
+  else:
+    deleted, released = counts[0], counts[0] == 1
+
+  if deleted == 0:  # deleted by a concurrent request
+    return response(404, "no such image...")
+
+  applog.set_fields(blob=sha256 is not None, released=released)
+
+  if released:
+    with applog.stage("s3"):
+      delete_objects(bucketkey)
+
+  return response(200, {"imageid": imageid, "deleted_object": released})
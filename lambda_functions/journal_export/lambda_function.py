@@ -0,0 +1,62 @@
+#
+# Exports all of a user's journal entries as one compressed
+# columnar file in S3, and returns a presigned URL to download it.
+#
+#   GET ?uid=80001[&format=parquet|csv]
+#
+# format defaults to Parquet (zstd), or gzipped CSV if pyarrow is
+# not in the deployment. The entries are streamed from the
+# database (from a read replica, if configured) and the file is
+# written to S3 by multipart upload as it is produced, so memory
+# stays bounded however many entries the user has; see
+# entryexport.py. Exports of every user's entries are too big for
+# a lambda's time limit: use analytics/export_entries.py.
+#
+# datatier, config, storage, entryexport, validation and handler
+# come from the journalapp_common layer (lambda_layers/).
+#
+
+import applog
+import entryexport
+import storage
+import uuid
+
+from handler import lambda_entry, require_user, response
+from validation import BadRequest, one_of, query_param
+
+check_format = one_of(entryexport.FORMATS)
+
+
+@lambda_entry("journal_export")
+def lambda_handler(event, context, dbConn):
+  uid = query_param(event, "uid")
+
+  fmt = query_param(event, "format", None)
+  if fmt is None:
+    fmt = entryexport.default_format()
+  else:
+    fmt, error = check_format(fmt)
+    if error is not None:
+      raise BadRequest("format " + error)
+    if fmt == "parquet" and entryexport.default_format() != "parquet":
+      raise BadRequest("parquet export is not available, use format=csv")
+
+  applog.set_fields(uid=uid, format=fmt)
+
+  require_user(dbConn, uid)
+
+  s3 = storage.s3_client()
+  bucket_name = storage.bucket_name()
+
+  key = "exports/" + str(uid) + "/" + str(uuid.uuid4()) + entryexport.FORMATS[fmt][0]
+
+  with applog.stage("export"):
+    result = entryexport.export_entries(dbConn, s3, bucket_name, key, uid=uid, fmt=fmt)
+
+  applog.set_fields(rows=result["rows"], bytes=result["bytes"])
+
+  url = s3.generate_presigned_url('get_object',
+                                  Params={'Bucket': bucket_name, 'Key': key},
+                                  ExpiresIn=3600)
+
+  return response(200, dict(result, url=url))
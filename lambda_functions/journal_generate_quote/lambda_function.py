@@ -1,85 +1,172 @@
+#
+# Returns a quote for a user based on their journal entries.
+#
+#   GET ?uid=80001
+#
+# The quote is picked by the user's recent mood: their last
+# [quote] window entries (default 14) are fetched newest first
+# with ORDER BY date DESC LIMIT N -- a backward range scan of
+# the (uid, date) index that reads only the metric columns --
+# and scored by mood.py. The quote corpus (quotes.json) is
+# loaded once per container and indexed by mood bucket.
+#
+# Results are cached per warm container until the user uploads
+# again: the user's user_stats.last_entryid, one primary-key
+# lookup, changes on every upload and is checked before the
+# entries are read.
+#
+# Only lightweight modules are imported at module level so
+# that cold starts stay fast; numpy comes in with mood.py on a
+# cache miss. datatier, config, userstats, validation and
+# handler come from the journalapp_common layer
+# (lambda_layers/).
+#
+
+import applog
+import collections
+import config
+import datatier
 import json
-import boto3
 import os
-import uuid
-import base64
-import pathlib
-import datatier
-import urllib.parse
-import string
-import requests
-from configparser import ConfigParser
-
-def lambda_handler(event, context):
-  try:
-    print("**STARTING**")
-    print("**lambda: journal_generate_quote**")
-    
-    #
-    # setup AWS based on config file:
-    #
-    config_file = 'benfordapp-config.ini'
-    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-    
-    configur = ConfigParser()
-    configur.read(config_file)
-    
-    #
-    # configure for RDS access
-    #
-    rds_endpoint = configur.get('rds', 'endpoint')
-    rds_portnum = int(configur.get('rds', 'port_number'))
-    rds_username = configur.get('rds', 'user_name')
-    rds_pwd = configur.get('rds', 'user_pwd')
-    rds_dbname = configur.get('rds', 'db_name')
-    
-    #
-    # get uid from api gateway url parameters:
-    #
-    uid = event['queryStringParameters']['uid']
-    print("uid:", uid)
-
-    #
-    # open connection to the database:
-    # then grab the most recent 
-    # sleep, eat, water, social, overall, and notes from the database
-    print("**Opening DB connection**")
-    #
-    dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
-    #
-    sql = """
-      SELECT notes, sleep, eat, water, social, overall
-      FROM entries where uid = %s
-    """
-    #
-    data = datatier.retrieve_all_rows(dbConn, sql, uid)
-    
-    print(data)
-
-    #
-    # done!
-    #
-    # respond in an HTTP-like way, i.e. with a status
-    # code and body in JSON format:
-    #
-    print("**DONE, returning success**")
-    
-    return {
-      'statusCode': 200,
-      'body': json.dumps("success")
-    }
-    
+import userstats
+import zlib
+
+from handler import lambda_entry, response
+from validation import BadRequest, query_param
+
+MAX_CACHED = 4096
+
+RECENT_SQL = """
+  SELECT sleep, eat, water, social, overall
+  FROM entries
+  WHERE uid = %s
+  ORDER BY date DESC
+  LIMIT %s;
+"""
+
+
+###################################################################
+#
+# the corpus, bucket name -> list of {"text", "author"}:
+#
+def load_quotes(path=None):
+  if path is None:
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "quotes.json")
+
+  with open(path) as f:
+    return json.load(f)
+
+
+QUOTES = load_quotes()
+
+_mood = None
+
+
+def mood_module():
+  """
+  Imports and returns the mood module on first call
+  """
+  global _mood
+
+  if _mood is None:
+    import mood
+    _mood = mood
+
+  return _mood
+
+
+#
+# per-user results, uid -> (last_entryid, result):
+#
+_cache = collections.OrderedDict()
+
+
+def cached(uid, last_entryid):
+  item = _cache.get(uid)
+  if item is None or item[0] != last_entryid:
+    return None
+
+  _cache.move_to_end(uid)
+  return item[1]
+
+
+def remember(uid, last_entryid, result):
+  _cache[uid] = (last_entryid, result)
+  _cache.move_to_end(uid)
+
+  while len(_cache) > MAX_CACHED:
+    _cache.popitem(last=False)
+
+
+#
+# quote_window:
+#
+# The number of recent entries the mood is computed from,
+# [quote] window; a window that is not positive is a
+# configuration error.
+#
+def quote_window():
+  window = int(config.get('quote', 'window', fallback='14'))
+
+  if window <= 0:
+    raise ValueError("journal_generate_quote: [quote] window must be positive, not " + str(window))
+
+  return window
+
+
+#
+# pick:
+#
+# Picks a quote from the bucket, the same one for the same user
+# and upload, a different one (usually) after the next upload.
+#
+def pick(bucket, uid, last_entryid):
+  quotes = QUOTES[bucket]
+  i = zlib.crc32((str(uid) + ":" + str(last_entryid)).encode()) % len(quotes)
+  return quotes[i]
+
+
+@lambda_entry("journal_generate_quote")
+def lambda_handler(event, context, dbConn):
+  #
+  # get uid from api gateway url parameters:
+  #
+  uid = query_param(event, "uid")
+  applog.set_fields(uid=uid)
+
   #
-  # on an error, try to upload error message to S3:
+  # the user's last_entryid tells whether a cached quote is
+  # still current:
   #
-  except Exception as err:
-    print("**ERROR**")
-    print(str(err))
-    
-    #
-    # done, return:
-    #    
-    return {
-      'statusCode': 500,
-      'body': json.dumps(str(err))
-    }
\ No newline at end of file
+  row = datatier.retrieve_one_row(dbConn, userstats.SELECT_SQL, [uid])
+  stats = userstats.parse(row)
+
+  if stats is None:
+    raise BadRequest("no entries for user...")
+
+  applog.set_fields(entries=stats["n"])
+
+  result = cached(uid, stats["last_entryid"])
+  if result is not None:
+    applog.set_fields(cache="hit")
+    return response(200, result)
+
+  rows = datatier.retrieve_all_rows(dbConn, RECENT_SQL, [uid, quote_window()])
+
+  with applog.stage("mood"):
+    signal = mood_module().mood(rows)
+
+  quote = pick(signal["bucket"], uid, stats["last_entryid"])
+
+  result = {
+    "quote": quote["text"],
+    "author": quote["author"],
+    "mood": signal,
+    "window": len(rows),
+  }
+
+  applog.set_fields(cache="miss", bucket=signal["bucket"])
+
+  remember(uid, stats["last_entryid"], result)
+
+  return response(200, result)
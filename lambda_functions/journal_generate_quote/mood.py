@@ -0,0 +1,83 @@
+#
+# mood.py
+#
+# The mood signal behind journal_generate_quote: a score in
+# [0, 1] from a user's most recent entries, computed with numpy
+# over the whole window at once.
+#
+# Each entry's metrics are scaled from 1..10 to 0..1 and
+# combined with WEIGHTS (overall counts most); entries are then
+# averaged with weights that halve every HALF_LIFE entries into
+# the past, so today's entry matters more than last week's. The
+# trend is the difference between the newer and older halves of
+# the window. With no entries the mood is NEUTRAL.
+#
+
+import numpy as np
+
+METRICS = ["sleep", "eat", "water", "social", "overall"]
+
+WEIGHTS = np.array([0.15, 0.1, 0.1, 0.15, 0.5])
+
+HALF_LIFE = 7.0  # entries
+
+#
+# upper bounds of the mood buckets, in order:
+#
+BUCKETS = [
+  (0.3, "low"),
+  (0.45, "down"),
+  (0.6, "steady"),
+  (0.75, "good"),
+  (1.01, "great"),
+]
+
+NEUTRAL = {"score": 0.5, "trend": 0.0, "bucket": "steady", "weakest": None}
+
+
+def bucket(score):
+  for upper, name in BUCKETS:
+    if score < upper:
+      return name
+
+  return BUCKETS[-1][1]
+
+
+def mood(rows):
+  """
+  Computes the mood signal from entries, newest first
+
+  Parameters
+  ----------
+  rows : list of (sleep, eat, water, social, overall) tuples,
+         the most recent entry first
+
+  Returns
+  -------
+  dict with score and trend (floats in [0, 1] and [-1, 1]),
+  bucket (string) and weakest (the metric with the lowest
+  recent average); NEUTRAL if there are no rows
+  """
+  if len(rows) == 0:
+    return dict(NEUTRAL)
+
+  X = (np.asarray(rows, dtype=float) - 1.0) / 9.0   # n x 5, in [0, 1]
+  n = X.shape[0]
+
+  recency = 0.5 ** (np.arange(n) / HALF_LIFE)
+  recency /= recency.sum()
+
+  scores = X @ WEIGHTS
+  score = float(recency @ scores)
+
+  half = n // 2
+  trend = float(scores[:n - half].mean() - scores[n - half:].mean()) if half > 0 else 0.0
+
+  weakest = METRICS[int(np.argmin(recency @ X[:, :4]))]  # overall is not actionable
+
+  return {
+    "score": round(score, 3),
+    "trend": round(trend, 3),
+    "bucket": bucket(score),
+    "weakest": weakest,
+  }
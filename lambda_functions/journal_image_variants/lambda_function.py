@@ -0,0 +1,122 @@
+#
+# Makes the thumbnail and medium renditions of uploaded images
+# (imagevariants.VARIANTS) and records them in image_variants,
+# so that collages and galleries can download those instead of
+# the originals.
+#
+# Takes an S3 ObjectCreated-shaped event for images/* objects:
+# journal_upload_image_finalize invokes it with the uploads it
+# has confirmed. Objects no 'uploaded' images row uses (not
+# finalized, or deleted since) are skipped, as are files Pillow
+# cannot read; both are reported in the logs.
+#
+# Memory stays bounded whatever the upload: the object is
+# streamed from S3 into a spooled temp file (in memory up to
+# SPOOL_BYTES, then /tmp) rather than read whole, and
+# renditions.py decodes it only at the size it needs.
+#
+# Variant keys are derived from the image's, and rows are
+# upserted, so a retried or repeated event rewrites the same
+# objects and rows.
+#
+# datatier, config, storage, imagevariants and handler come
+# from the journalapp_common layer (lambda_layers/).
+#
+
+import applog
+import datatier
+import imagevariants
+import shutil
+import storage
+import tempfile
+import urllib.parse
+
+from handler import lambda_entry, response
+
+MAX_BYTES = 25 * 1024 * 1024  # same limit as journal_upload_image
+SPOOL_BYTES = 4 * 1024 * 1024
+CHUNK = 1024 * 1024
+
+
+class Unreadable(Exception):
+  pass
+
+
+#
+# download:
+#
+# Streams an object into a spooled temp file, which the caller
+# closes.
+#
+def download(s3, bucket, bucketkey):
+  obj = s3.get_object(Bucket=bucket, Key=bucketkey)
+
+  if obj.get("ContentLength", 0) > MAX_BYTES:
+    obj["Body"].close()
+    raise Unreadable("object too large")
+
+  f = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+  with obj["Body"] as body:
+    shutil.copyfileobj(body, f, CHUNK)
+
+  f.seek(0)
+  return f
+
+
+def make_variants(dbConn, s3, bucket, bucketkey):
+  """
+  Renders and records the variants of one image; returns the #
+  of variants written
+  """
+  sql = "SELECT 1 FROM images WHERE bucketkey = %s AND status = 'uploaded' LIMIT 1;"
+
+  if datatier.retrieve_one_row(dbConn, sql, [bucketkey]) == ():
+    applog.warning("no uploaded images row", bucketkey=bucketkey)
+    return 0
+
+  import renditions
+  from PIL import Image
+
+  try:
+    with download(s3, bucket, bucketkey) as f:
+      try:
+        variants = renditions.render(f, imagevariants.VARIANTS)
+      except (Image.DecompressionBombError, OSError) as err:  # not an image Pillow can read
+        raise Unreadable(str(err))
+  except Unreadable as err:
+    # retrying will not help, so this is not an error:
+    applog.warning("cannot render image", bucketkey=bucketkey, error=str(err))
+    return 0
+
+  rows = []
+  for name, data, width, height in variants:
+    key = imagevariants.variant_key(bucketkey, name)
+    s3.put_object(Bucket=bucket, Key=key, Body=data, ContentType="image/jpeg")
+    rows.append([bucketkey, name, key, width, height, len(data)])
+
+  if rows:
+    datatier.perform_transaction(dbConn, [(imagevariants.UPSERT_SQL, rows, True)])
+
+  return len(rows)
+
+
+#
+# errors are re-raised so that the invocation is retried:
+#
+@lambda_entry("journal_image_variants", raise_errors=True)
+def lambda_handler(event, context, dbConn):
+  s3 = storage.s3_client()
+  records = event.get("Records", [])
+  written = 0
+
+  with applog.stage("render"):
+    for record in records:
+      bucket = record["s3"]["bucket"]["name"]
+      # keys in S3 events are url-encoded:
+      bucketkey = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
+
+      written += make_variants(dbConn, s3, bucket, bucketkey)
+
+  applog.set_fields(objects=len(records), variants=written)
+
+  return response(200, {"variants": written})
@@ -0,0 +1,65 @@
+#
+# renditions.py
+#
+# Makes the downscaled JPEG renditions of one image.
+#
+# The image is decoded once, at the largest size needed: for
+# JPEGs, Image.draft() has the decoder scale down by up to 8x
+# while decoding, so a 12 megapixel photo never exists in memory
+# at full resolution. Each smaller rendition is then made from
+# the previous (bigger) one rather than from the original.
+# Pillow's decompression bomb check (Image.MAX_IMAGE_PIXELS)
+# rejects images with absurd dimensions before decoding.
+#
+
+import io
+
+from PIL import Image, ImageOps
+
+
+###################################################################
+#
+# render:
+#
+# Returns [(name, jpeg bytes, width, height)] for each
+# (name, size) in sizes that is smaller than the image, scaled
+# to fit in a size x size box. Sizes the image already fits in
+# are skipped: the original is as small and serves as that
+# rendition.
+#
+def render(fileobj, sizes, quality=85):
+  """
+  Renders the variants of one image
+
+  Parameters
+  ----------
+  fileobj : the image file (seekable, binary),
+  sizes : list of (name, longest edge in pixels),
+  quality : JPEG quality (integer)
+
+  Returns
+  -------
+  list of (name, jpeg bytes, width, height), largest first
+  """
+  results = []
+
+  with Image.open(fileobj) as img:
+    longest = max(img.size)
+    wanted = sorted([(size, name) for name, size in sizes if size < longest], reverse=True)
+    if len(wanted) == 0:
+      return results
+
+    img.draft("RGB", (wanted[0][0], wanted[0][0]))  # JPEG: decode at reduced scale
+    current = ImageOps.exif_transpose(img).convert("RGB")  # phones store rotation in EXIF
+
+  try:
+    for size, name in wanted:
+      current.thumbnail((size, size), Image.LANCZOS)
+
+      out = io.BytesIO()
+      current.save(out, format="JPEG", quality=quality, optimize=True)
+      results.append((name, out.getvalue(), current.width, current.height))
+  finally:
+    current.close()
+
+  return results
@@ -1,6 +1,136 @@
-import sklearn
-import pandas as pd
-import numpy as np
-from sklearn.linear_model import LinearRegression
+#
+# Fits a linear model of a user's overall mood from their
+# sleep, eat, water and social scores, and returns the
+# coefficients (and optionally a prediction).
+#
+#   GET ?uid=80001                     => model for one user
+#   GET ?uid=80001&sleep=7&eat=5&...   => model + prediction
+#
+# The fit comes from the user's row in user_stats, so it costs
+# the same however many entries the user has. When invoked by a
+# scheduled event with {"mode": "all"}, fits every user's model
+# in one batched pass over user_stats.
+#
+# Fitted models are cached per warm container and in the
+# user_models table until the user uploads again; see
+# modelcache.py. numpy is only imported (with the regression
+# module) on a cache miss, to keep cold starts fast.
+#
+# datatier, userstats, validation and handler come from the
+# journalapp_common layer (lambda_layers/).
+#
 
+import applog
+import datatier
+import userstats
+import modelcache
 
+from handler import lambda_entry, response
+from validation import BadRequest, query_param
+
+FEATURES = ["sleep", "eat", "water", "social"]
+
+_regression = None
+
+
+def regression_module():
+  """
+  Imports and returns the regression module on first call
+  """
+  global _regression
+
+  if _regression is None:
+    import regression
+    _regression = regression
+
+  return _regression
+
+
+def model_dict(count, coef, r2):
+  model = {
+    "n": int(count),
+    "intercept": float(coef[0]),
+    "r2": None if r2 != r2 else float(r2),  # nan => null
+  }
+
+  for name, value in zip(FEATURES, coef[1:]):
+    model[name] = float(value)
+
+  return model
+
+
+def fit_from_stats(dbConn, uid):
+  #
+  # on a cache miss, the user's running statistics are all we
+  # need (see userstats.py):
+  #
+  regression = regression_module()
+
+  row = datatier.retrieve_one_row(dbConn, userstats.SELECT_SQL, [uid])
+  stats = row[1:]
+
+  if row == () or stats[0] == 0:
+    return None
+
+  coef, r2 = regression.solve(*regression.stats_moments(stats))
+  return model_dict(stats[0], coef, r2)
+
+
+def fit_user(dbConn, uid, params):
+  model, source = modelcache.get_model(dbConn, uid, fit_from_stats)
+
+  applog.set_fields(model_cache=source, model_cache_stats=modelcache.stats())
+
+  if model is None:
+    raise BadRequest("no entries for user...")
+
+  body = {"uid": uid, "entries": model["n"], "intercept": model["intercept"], "r2": model["r2"]}
+  for name in FEATURES:
+    body[name] = model[name]
+
+  if all(name in params for name in FEATURES):
+    try:
+      x = [float(params[name]) for name in FEATURES]
+    except ValueError:
+      raise BadRequest("sleep, eat, water and social must be numbers")
+
+    body["prediction"] = model["intercept"] \
+      + sum(model[name] * value for name, value in zip(FEATURES, x))
+
+  return response(200, body)
+
+
+def fit_everyone(dbConn):
+  #
+  # one batched solve over every user's running statistics,
+  # saving the results in the model cache:
+  #
+  regression = regression_module()
+
+  sql = "SELECT uid, last_entryid, " + ", ".join(userstats.STAT_COLUMNS) + " FROM user_stats"
+
+  data = regression.rows_to_array(datatier.stream_rows(dbConn, sql), 2 + len(userstats.STAT_COLUMNS))
+
+  coef, r2 = regression.solve(*regression.stats_moments(data[:, 2:]))
+
+  rows = []
+  for k in range(data.shape[0]):
+    model = model_dict(data[k, 2], coef[k], r2[k])
+    rows.append([int(data[k, 0]), int(data[k, 1])] + [model[c] for c in modelcache.MODEL_COLUMNS])
+
+  modelcache.store_all(dbConn, rows)
+
+  applog.set_fields(users=int(data.shape[0]), entries=int(data[:, 2].sum()))
+
+  return response(200, {"users": int(data.shape[0]), "entries": int(data[:, 2].sum())})
+
+
+@lambda_entry("journal_linear_regression")
+def lambda_handler(event, context, dbConn):
+  if event.get("mode") == "all":
+    return fit_everyone(dbConn)
+
+  uid = query_param(event, "uid")
+  applog.set_fields(uid=uid)
+
+  return fit_user(dbConn, uid, event.get("queryStringParameters") or {})
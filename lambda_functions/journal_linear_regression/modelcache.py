@@ -0,0 +1,163 @@
+#
+# modelcache.py
+#
+# Two-level cache of fitted per-user regression models.
+#
+#  1. an in-process LRU, which survives while the Lambda
+#     container is warm, and
+#  2. the user_models table, shared by every container.
+#
+# A cached model is keyed by uid and remembers the user's
+# user_stats.last_entryid at the time it was fitted; it is only
+# served while that still matches, so a new upload invalidates
+# both levels automatically (journal_upload also deletes the
+# user_models row in its transaction, with
+# userstats.INVALIDATE_MODEL_SQL). Hit/miss counters are
+# kept per container and logged by the handler.
+#
+
+import collections
+
+import datatier
+
+MODEL_COLUMNS = ["n", "intercept", "sleep", "eat", "water", "social", "r2"]
+
+VERSION_SQL = "SELECT last_entryid FROM user_stats WHERE uid = %s;"
+
+SELECT_SQL = """
+  SELECT """ + ", ".join(MODEL_COLUMNS) + """
+  FROM user_models WHERE uid = %s AND last_entryid = %s;
+"""
+
+UPSERT_SQL = """
+  INSERT INTO user_models(uid, last_entryid, """ + ", ".join(MODEL_COLUMNS) + """, fitted)
+       VALUES(%s, %s, """ + ", ".join(["%s"] * len(MODEL_COLUMNS)) + """, NOW())
+  ON DUPLICATE KEY UPDATE
+    last_entryid = VALUES(last_entryid),
+    """ + ",\n    ".join([c + " = VALUES(" + c + ")" for c in MODEL_COLUMNS]) + """,
+    fitted = VALUES(fitted);
+"""
+
+
+###################################################################
+#
+# LRUCache:
+#
+# Small least-recently-used map of uid -> (last_entryid, model).
+#
+class LRUCache:
+  def __init__(self, maxsize=1024):
+    self._maxsize = maxsize
+    self._items = collections.OrderedDict()
+
+  def get(self, uid, last_entryid):
+    """
+    Returns the model for uid if cached at last_entryid, else None
+    """
+    item = self._items.get(uid)
+    if item is None or item[0] != last_entryid:
+      return None
+
+    self._items.move_to_end(uid)
+    return item[1]
+
+  def put(self, uid, last_entryid, model):
+    self._items[uid] = (last_entryid, model)
+    self._items.move_to_end(uid)
+
+    while len(self._items) > self._maxsize:
+      self._items.popitem(last=False)
+
+  def __len__(self):
+    return len(self._items)
+
+
+_lru = LRUCache()
+
+counters = {"lru_hits": 0, "table_hits": 0, "misses": 0}
+
+
+###################################################################
+#
+# get_model:
+#
+# Returns (model, source) for uid, where model is a dict with
+# MODEL_COLUMNS as keys and source is "lru", "table" or "fit".
+# fit_fn(dbConn, uid) is called on a miss and must return such
+# a dict (or None if the user has no entries). Returns
+# (None, None) if the user has no entries.
+#
+def get_model(dbConn, uid, fit_fn):
+  """
+  Returns the user's fitted model, from cache when still valid
+
+  Parameters
+  ----------
+  dbConn : the database connection,
+  uid : the user id,
+  fit_fn : function (dbConn, uid) -> model dict or None
+
+  Returns
+  -------
+  (model, source), or (None, None) if the user has no entries
+  """
+  row = datatier.retrieve_one_row(dbConn, VERSION_SQL, [uid])
+  if row == ():
+    return None, None
+
+  last_entryid = row[0]
+  key = str(uid)
+
+  model = _lru.get(key, last_entryid)
+  if model is not None:
+    counters["lru_hits"] += 1
+    return model, "lru"
+
+  row = datatier.retrieve_one_row(dbConn, SELECT_SQL, [uid, last_entryid])
+  if row != ():
+    model = dict(zip(MODEL_COLUMNS, row))
+    counters["table_hits"] += 1
+    _lru.put(key, last_entryid, model)
+    return model, "table"
+
+  counters["misses"] += 1
+
+  model = fit_fn(dbConn, uid)
+  if model is None:
+    return None, None
+
+  store(dbConn, uid, last_entryid, model)
+  return model, "fit"
+
+
+###################################################################
+#
+# store:
+#
+# Saves a freshly fitted model in both cache levels.
+#
+def store(dbConn, uid, last_entryid, model):
+  datatier.perform_action(dbConn, UPSERT_SQL,
+                          [uid, last_entryid] + [model[c] for c in MODEL_COLUMNS])
+  _lru.put(str(uid), last_entryid, model)
+
+
+###################################################################
+#
+# store_all:
+#
+# Saves many models at once (e.g. from the nightly batch fit);
+# rows are [uid, last_entryid, n, intercept, ..., r2].
+#
+def store_all(dbConn, rows):
+  datatier.perform_batch_action(dbConn, UPSERT_SQL, rows)
+
+  for row in rows:
+    _lru.put(str(row[0]), row[1], dict(zip(MODEL_COLUMNS, row[2:])))
+
+
+def stats():
+  """
+  Returns the hit/miss counters plus current LRU size
+  """
+  return dict(counters, lru_size=len(_lru))
@@ -0,0 +1,203 @@
+#
+# regression.py
+#
+# Vectorized least-squares engine for the mood model
+#
+#   overall ~ b0 + b1*sleep + b2*eat + b3*water + b4*social
+#
+# Everything is computed from the sufficient statistics of the
+# data (the "moments": n, X'X, X'y and y'y, with X including a
+# column of 1s for the intercept), so one user or every user
+# can be fit with a handful of NumPy reductions and a batched
+# 5x5 solve, and no per-row Python objects. Rows are read from
+# the database straight into a float64 array.
+#
+# The moments are exactly what the user_stats table keeps up to
+# date on every upload (see userstats.py), so in the handler a
+# fit costs one single-row SELECT, however long the history.
+#
+
+import itertools
+
+import numpy as np
+
+import userstats
+
+FEATURES = ["sleep", "eat", "water", "social"]
+TARGET = "overall"
+
+assert userstats.METRICS == FEATURES + [TARGET]
+
+NCOEF = len(FEATURES) + 1  # + intercept
+
+
+###################################################################
+#
+# rows_to_array:
+#
+# Packs an iterable of equal-length numeric tuples (e.g. a
+# datatier.stream_rows generator) into an (n, ncols) float64
+# array without building intermediate lists.
+#
+def rows_to_array(rows, ncols):
+  flat = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.float64)
+  return flat.reshape(-1, ncols)
+
+
+###################################################################
+#
+# moments:
+#
+# Returns (n, XtX, Xty, yty) for features X (n, 4) and target
+# y (n,), where XtX and Xty include the intercept column.
+#
+def moments(X, y):
+  A = np.empty((X.shape[0], NCOEF))
+  A[:, 0] = 1.0
+  A[:, 1:] = X
+
+  return X.shape[0], A.T @ A, A.T @ y, float(y @ y)
+
+
+###################################################################
+#
+# grouped_moments:
+#
+# Like moments, but for many users at once: group is an (n,)
+# array of group indexes 0..ngroups-1, and the results have a
+# leading ngroups axis. Uses one bincount per distinct entry of
+# the symmetric X'X, so memory is O(n) rather than O(n * 25).
+#
+def grouped_moments(group, ngroups, X, y):
+  A = np.empty((X.shape[0], NCOEF))
+  A[:, 0] = 1.0
+  A[:, 1:] = X
+
+  n = np.bincount(group, minlength=ngroups).astype(np.float64)
+
+  XtX = np.empty((ngroups, NCOEF, NCOEF))
+  for i in range(NCOEF):
+    for j in range(i, NCOEF):
+      XtX[:, i, j] = np.bincount(group, weights=A[:, i] * A[:, j], minlength=ngroups)
+      XtX[:, j, i] = XtX[:, i, j]
+
+  Xty = np.empty((ngroups, NCOEF))
+  for i in range(NCOEF):
+    Xty[:, i] = np.bincount(group, weights=A[:, i] * y, minlength=ngroups)
+
+  yty = np.bincount(group, weights=y * y, minlength=ngroups)
+
+  return n, XtX, Xty, yty
+
+
+#
+# _AUGMENTED: for the augmented variables [1, sleep, eat, water,
+# social, overall], _AUGMENTED[i, j] is the index in
+# userstats.STAT_COLUMNS of the sum of variable i * variable j.
+#
+def _augmented_index():
+  names = [None] + userstats.METRICS
+  index = np.empty((len(names), len(names)), dtype=np.intp)
+
+  for i, a in enumerate(names):
+    for j, b in enumerate(names):
+      if a is None and b is None:
+        col = "n"
+      elif a is None or b is None:
+        col = "s_" + (a or b)
+      elif i <= j:
+        col = "ss_" + a + "_" + b
+      else:
+        col = "ss_" + b + "_" + a
+      index[i, j] = userstats.STAT_COLUMNS.index(col)
+
+  return index
+
+_AUGMENTED = _augmented_index()
+
+
+###################################################################
+#
+# stats_moments:
+#
+# Returns (n, XtX, Xty, yty) from user_stats values S, given in
+# userstats.STAT_COLUMNS order; S may be one row (k,) or many
+# users' rows (nusers, k), in which case the results have a
+# leading nusers axis.
+#
+def stats_moments(S):
+  M = np.asarray(S, dtype=np.float64)[..., _AUGMENTED]
+
+  return M[..., 0, 0], M[..., :NCOEF, :NCOEF], M[..., :NCOEF, NCOEF], M[..., NCOEF, NCOEF]
+
+
+###################################################################
+#
+# solve:
+#
+# Solves the normal equations XtX b = Xty (batched if XtX has a
+# leading axis) and returns (coefficients, r2). pinv is used so
+# that users with too few entries, or a metric that never
+# changes, still get the minimum-norm least-squares answer
+# instead of an error. r2 is nan when y has no variance.
+#
+def solve(n, XtX, Xty, yty):
+  coef = np.einsum('...ij,...j->...i', np.linalg.pinv(XtX), Xty)
+
+  # residual and total sums of squares, from the moments alone:
+  sse = yty - 2 * np.einsum('...i,...i->...', coef, Xty) \
+      + np.einsum('...i,...ij,...j->...', coef, XtX, coef)
+  ybar = Xty[..., 0] / np.maximum(n, 1)
+  sst = yty - n * ybar * ybar
+
+  with np.errstate(divide='ignore', invalid='ignore'):
+    r2 = np.where(sst > 1e-12, 1.0 - sse / sst, np.nan)
+
+  return coef, r2
+
+
+###################################################################
+#
+# fit:
+#
+# Fits one user's model from features X (n, 4) and target y.
+#
+def fit(X, y):
+  """
+  Returns (coefficients, r2) where coefficients is
+  [intercept, sleep, eat, water, social]
+  """
+  n, XtX, Xty, yty = moments(X, y)
+  coef, r2 = solve(n, XtX, Xty, yty)
+  return coef, float(r2)
+
+
+###################################################################
+#
+# fit_all:
+#
+# Fits every user's model in one batched pass. uids is an (n,)
+# array giving the user of each row of X and y.
+#
+def fit_all(uids, X, y):
+  """
+  Returns (unique_uids, coefficients, r2, counts) where
+  coefficients has shape (nusers, 5)
+  """
+  unique_uids, group = np.unique(uids, return_inverse=True)
+
+  n, XtX, Xty, yty = grouped_moments(group, len(unique_uids), X, y)
+  coef, r2 = solve(n, XtX, Xty, yty)
+
+  return unique_uids, coef, r2, n.astype(np.int64)
+
+
+###################################################################
+#
+# predict:
+#
+# Predicted overall for features x (4,) or (m, 4).
+#
+def predict(coef, x):
+  x = np.asarray(x, dtype=np.float64)
+  return coef[0] + x @ coef[1:]
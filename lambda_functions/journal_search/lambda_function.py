@@ -0,0 +1,237 @@
+#
+# Searches a user's journal notes.
+#
+#   GET ?uid=80001&q=beach+trip[&start=2024-01-01&end=2024-12-31]
+#       [&min_sleep=6&max_overall=4 ...][&limit=20][&page=<token>]
+#
+# Returns the matching entries best match first (ties: newest
+# first), limit at a time, with a "next" token for the following
+# page. start/end (inclusive dates) and min_<metric> /
+# max_<metric> (1-10) narrow the results.
+#
+# By default the query runs on the FULLTEXT index on
+# entries.notes (migrations/008_notes_fulltext.sql) in natural
+# language mode, ranked by MySQL's relevance score, instead of
+# LIKE '%x%' scans. With [search] backend = memory it instead
+# builds an in-process inverted index of the user's notes
+# (search_index.py), cached per warm container until the user
+# uploads again -- for local testing against databases without
+# the FULLTEXT index.
+#
+# Pages are keyset-paginated on (score, entryid), so later
+# pages cost the same as the first.
+#
+# datatier, config, userstats, validation and handler come from
+# the journalapp_common layer (lambda_layers/).
+#
+
+import applog
+import base64
+import collections
+import config
+import datatier
+import json
+import userstats
+
+from handler import lambda_entry, response
+from validation import BadRequest, date_check, integer, query_param, string
+
+COLUMNS = ["entryid", "date", "notes", "sleep", "eat", "water", "social", "overall"]
+
+MAX_LIMIT = 100
+MAX_INDEXED = 16  # users with an in-memory index, per container
+
+check_query = string(256)
+check_metric = integer(1, 10)
+
+MATCH = "MATCH(notes) AGAINST(%s IN NATURAL LANGUAGE MODE)"
+
+
+###################################################################
+#
+# page tokens: opaque (score, entryid) of the last result
+#
+def encode_page(score, entryid):
+  return base64.urlsafe_b64encode(json.dumps([score, entryid]).encode()).decode()
+
+
+def decode_page(token):
+  if token is None or token == "":
+    return None
+
+  try:
+    score, entryid = json.loads(base64.urlsafe_b64decode(token.encode()))
+    return float(score), int(entryid)
+  except Exception:
+    raise BadRequest("invalid page token")
+
+
+###################################################################
+#
+# filters:
+#
+# Parses the optional date range and metric bounds into a list
+# of (column, operator, value), operator ">=" or "<=". Date
+# bounds are YYYY-MM-DD strings and include the whole day.
+#
+def filters(event):
+  result = []
+
+  start = query_param(event, "start", None)
+  end = query_param(event, "end", None)
+
+  for name, value in [("start", start), ("end", end)]:
+    if value is not None and date_check(value)[1] is not None:
+      raise BadRequest(name + " must be YYYY-MM-DD")
+
+  if start is not None:
+    result.append(("date", ">=", start))
+  if end is not None:
+    result.append(("date", "<=", end))
+
+  for m in userstats.METRICS:
+    for bound, op in [("min_", ">="), ("max_", "<=")]:
+      value = query_param(event, bound + m, None)
+      if value is None:
+        continue
+
+      try:
+        value, error = check_metric(int(value))
+      except ValueError:
+        error = "must be an integer"
+      if error is not None:
+        raise BadRequest(bound + m + " " + error)
+
+      result.append((m, op, value))
+
+  return result
+
+
+###################################################################
+#
+# search_fulltext:
+#
+# One page of results from the FULLTEXT index, as
+# [(score, row)].
+#
+def search_fulltext(dbConn, uid, q, conditions, after, limit):
+  sql = "SELECT " + ", ".join(COLUMNS) + ", " + MATCH + " AS score FROM entries" + \
+        " WHERE uid = %s AND " + MATCH
+  params = [q, uid, q]
+
+  for column, op, value in conditions:
+    if column == "date" and op == "<=":
+      sql += " AND date < DATE_ADD(%s, INTERVAL 1 DAY)"
+    else:
+      sql += " AND " + column + " " + op + " %s"
+    params.append(value)
+
+  if after is not None:
+    sql += " HAVING score < %s OR (score = %s AND entryid < %s)"
+    params += [after[0], after[0], after[1]]
+
+  sql += " ORDER BY score DESC, entryid DESC LIMIT %s"
+  params.append(limit)
+
+  rows = datatier.retrieve_all_rows(dbConn, sql, params)
+
+  return [(float(row[-1]), row[:-1]) for row in rows]
+
+
+###################################################################
+#
+# search_memory:
+#
+# The same page from the user's in-process index.
+#
+_indexes = collections.OrderedDict()  # uid -> (last_entryid, SearchIndex)
+
+
+def user_index(dbConn, uid):
+  row = datatier.retrieve_one_row(dbConn, userstats.SELECT_SQL, [uid])
+  stats = userstats.parse(row)
+  last_entryid = None if stats is None else stats["last_entryid"]
+
+  item = _indexes.get(uid)
+  if item is not None and item[0] == last_entryid:
+    _indexes.move_to_end(uid)
+    applog.set_fields(index="cached")
+    return item[1]
+
+  import search_index
+
+  sql = "SELECT " + ", ".join(COLUMNS) + " FROM entries WHERE uid = %s ORDER BY entryid"
+
+  with applog.stage("index"):
+    index = search_index.SearchIndex(datatier.stream_rows(dbConn, sql, [uid]))
+
+  applog.set_fields(index="built", indexed=len(index))
+
+  _indexes[uid] = (last_entryid, index)
+  while len(_indexes) > MAX_INDEXED:
+    _indexes.popitem(last=False)
+
+  return index
+
+
+def search_memory(dbConn, uid, q, conditions, after, limit):
+  index = user_index(dbConn, uid)
+
+  def keep(row):
+    values = dict(zip(COLUMNS, row))
+    values["date"] = values["date"].strftime('%Y-%m-%d')
+    for column, op, value in conditions:
+      if (op == ">=" and values[column] < value) or (op == "<=" and values[column] > value):
+        return False
+    return True
+
+  return index.search(q, keep, after, limit)
+
+
+@lambda_entry("journal_search")
+def lambda_handler(event, context, dbConn):
+  uid = query_param(event, "uid")
+
+  with applog.stage("validate"):
+    q, error = check_query(query_param(event, "q"))
+    if error is not None:
+      raise BadRequest("q " + error)
+    if q.strip() == "":
+      raise BadRequest("q must not be empty")
+
+    try:
+      limit = min(int(query_param(event, "limit", 20)), MAX_LIMIT)
+    except ValueError:
+      raise BadRequest("limit must be an integer")
+    if limit < 1:
+      raise BadRequest("limit must be positive")
+
+    conditions = filters(event)
+    after = decode_page(query_param(event, "page", None))
+
+  backend = config.get('search', 'backend', fallback='fulltext')
+  applog.set_fields(uid=uid, backend=backend, filters=len(conditions))
+
+  #
+  # one extra row tells whether there is a next page:
+  #
+  if backend == "memory":
+    results = search_memory(dbConn, uid, q, conditions, after, limit + 1)
+  else:
+    results = search_fulltext(dbConn, uid, q, conditions, after, limit + 1)
+
+  next_page = None
+  if len(results) > limit:
+    results = results[:limit]
+    next_page = encode_page(results[-1][0], results[-1][1][0])
+
+  applog.set_fields(results=len(results))
+
+  entries = []
+  for score, row in results:
+    entry = dict(zip(COLUMNS, row))
+    entry["date"] = entry["date"].strftime('%Y-%m-%d %H:%M:%S')
+    entry["score"] = score
+    entries.append(entry)
+
+  return response(200, {"entries": entries, "next": next_page})
@@ -0,0 +1,104 @@
+#
+# search_index.py
+#
+# In-process inverted index over one user's entry notes: the
+# fallback behind journal_search when MySQL's FULLTEXT index is
+# not available ([search] backend = memory, e.g. for local
+# testing), and a baseline for benchmarks/bench_search.py.
+#
+# Notes are tokenized roughly the way InnoDB does it (lower
+# case, words of at least MIN_TOKEN characters, minus common
+# stopwords), and matches are ranked with BM25.
+#
+
+import heapq
+import math
+import re
+
+MIN_TOKEN = 3  # innodb_ft_min_token_size
+
+K1 = 1.2
+B = 0.75
+
+STOPWORDS = frozenset("""
+  about are com for from how that the this was what when where who will with und www
+  and but not you your have has had its it's our they them then than there these those
+""".split())
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text):
+  return [w for w in _WORD.findall(text.lower())
+          if len(w) >= MIN_TOKEN and w not in STOPWORDS]
+
+
+class SearchIndex:
+  """
+  Inverted index over a list of entries
+
+  Parameters
+  ----------
+  rows : iterable of (entryid, date, notes, sleep, eat, water,
+         social, overall) tuples
+  """
+
+  def __init__(self, rows):
+    self.docs = []       # (entryid, date, notes, metrics...) per doc
+    self.lengths = []    # # of tokens per doc
+    self.postings = {}   # term -> list of (doc #, term frequency)
+
+    for row in rows:
+      doc = len(self.docs)
+      tokens = tokenize(row[2])
+
+      counts = {}
+      for token in tokens:
+        counts[token] = counts.get(token, 0) + 1
+
+      for token, tf in counts.items():
+        self.postings.setdefault(token, []).append((doc, tf))
+
+      self.docs.append(tuple(row))
+      self.lengths.append(len(tokens))
+
+    self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+
+  def __len__(self):
+    return len(self.docs)
+
+  def search(self, query, keep=None, after=None, limit=None):
+    """
+    Returns [(score, doc row)] for docs matching any query term,
+    best first (ties broken by newest entryid); keep(row) can
+    filter the rows, after = (score, entryid) skips those up to
+    and including that result, and limit caps the count
+    """
+    n = len(self.docs)
+    scores = {}
+
+    for term in set(tokenize(query)):
+      postings = self.postings.get(term)
+      if not postings:
+        continue
+
+      idf = math.log(1.0 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+
+      for doc, tf in postings:
+        norm = K1 * (1.0 - B + B * self.lengths[doc] / self.avg_length)
+        scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1.0) / (tf + norm)
+
+    results = ((round(score, 6), self.docs[doc]) for doc, score in scores.items())
+
+    if after is not None:
+      results = (r for r in results
+                 if r[0] < after[0] or (r[0] == after[0] and r[1][0] < after[1]))
+    if keep is not None:
+      results = (r for r in results if keep(r[1]))
+
+    order = lambda r: (-r[0], -r[1][0])
+
+    if limit is not None:
+      return heapq.nsmallest(limit, results, key=order)  # no full sort
+
+    return sorted(results, key=order)
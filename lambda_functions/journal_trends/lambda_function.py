@@ -0,0 +1,134 @@
+#
+# Returns a user's metric trends for a dashboard: per day, week
+# or month in a date range, the number of entries and the
+# average, min and max of each metric.
+#
+#   GET ?uid=80001&start=2024-01-01&end=2024-12-31[&period=week]
+#
+# start and end are inclusive dates; period is day (default),
+# week (starting Mondays) or month. Each bucket is labelled
+# with the date it starts on.
+#
+# The aggregation runs in SQL, so only one row per bucket comes
+# back over the wire. It reads the daily_stats rollup (one row
+# per user and day, maintained by the uploads, see
+# dailystats.py) unless [rollup] daily is turned off, in which
+# case it groups the user's entries directly -- an index range
+# scan on (uid, date) that never touches the notes.
+#
+# datatier, config, validation and handler come from the
+# journalapp_common layer (lambda_layers/).
+#
+
+import applog
+import dailystats
+import datatier
+
+from handler import lambda_entry, response
+from userstats import METRICS
+from validation import BadRequest, date_check, one_of, query_param
+
+MAX_BUCKETS = 5000
+
+#
+# bucket label for a date expression, by period ("%%" since
+# the queries are parameterized):
+#
+PERIODS = {
+  "day": "DATE({d})",
+  "week": "DATE_SUB(DATE({d}), INTERVAL WEEKDAY({d}) DAY)",
+  "month": "DATE_FORMAT({d}, '%%Y-%%m-01')",
+}
+
+check_period = one_of(PERIODS)
+
+
+#
+# rollup_sql / entries_sql:
+#
+# The GROUP BY query for a period over daily_stats or entries;
+# both return (period, count, then avg, min, max per metric).
+#
+def rollup_sql(period):
+  columns = []
+  for m in METRICS:
+    columns += ["SUM(s_" + m + ") / SUM(n)", "MIN(min_" + m + ")", "MAX(max_" + m + ")"]
+
+  return "SELECT " + PERIODS[period].format(d="day") + " AS period, SUM(n), " + \
+         ", ".join(columns) + """
+    FROM daily_stats
+    WHERE uid = %s AND day >= %s AND day <= %s
+    GROUP BY period
+    ORDER BY period
+    LIMIT %s
+  """
+
+
+def entries_sql(period):
+  columns = []
+  for m in METRICS:
+    columns += ["AVG(" + m + ")", "MIN(" + m + ")", "MAX(" + m + ")"]
+
+  return "SELECT " + PERIODS[period].format(d="date") + " AS period, COUNT(*), " + \
+         ", ".join(columns) + """
+    FROM entries
+    WHERE uid = %s AND date >= %s AND date < DATE_ADD(%s, INTERVAL 1 DAY)
+    GROUP BY period
+    ORDER BY period
+    LIMIT %s
+  """
+
+
+#
+# bucket:
+#
+# Turns a result row into the response's dict for the bucket.
+#
+def bucket(row):
+  result = {"period": str(row[0])[:10], "count": int(row[1])}
+
+  for i, m in enumerate(METRICS):
+    avg, lo, hi = row[2 + 3 * i: 5 + 3 * i]
+    result[m] = {"avg": round(float(avg), 3), "min": int(lo), "max": int(hi)}
+
+  return result
+
+
+@lambda_entry("journal_trends")
+def lambda_handler(event, context, dbConn):
+  #
+  # get uid, date range and period from url parameters:
+  #
+  uid = query_param(event, "uid")
+  start = query_param(event, "start")
+  end = query_param(event, "end")
+  period = query_param(event, "period", "day")
+
+  with applog.stage("validate"):
+    for value in [start, end]:
+      if date_check(value)[1] is not None:
+        raise BadRequest("start and end must be YYYY-MM-DD")
+
+    if check_period(period)[1] is not None:
+      raise BadRequest("period must be day, week or month")
+
+  if dailystats.enabled():
+    source = "daily_stats"
+    sql = rollup_sql(period)
+  else:
+    source = "entries"
+    sql = entries_sql(period)
+
+  applog.set_fields(uid=uid, start=start, end=end, period=period, source=source)
+
+  rows = datatier.retrieve_all_rows(dbConn, sql, [uid, start, end, MAX_BUCKETS])
+
+  applog.set_fields(buckets=len(rows))
+
+  return response(200, {
+    "uid": uid,
+    "start": start,
+    "end": end,
+    "period": period,
+    "buckets": [bucket(row) for row in rows],
+  })
@@ -1,144 +1,308 @@
 #
 # Inserts a new entry record
-# in the JournalApp database
+# in the JournalApp database.
+#
+# The body is either a single entry (JSON object), or a batch
+# of entries (JSON array) from a client syncing an offline
+# backlog. A batch is validated up front and written with one
+# multi-row INSERT in a single transaction; if any entry is
+# invalid nothing is written and the per-entry errors are
+# returned with status 400. Every entry in a batch must have its
+# own "date", since (uid, date) is unique.
+#
+# The user's running statistics (user_stats) and daily rollup
+# (daily_stats) are updated in the same transaction as the
+# INSERT; see userstats.py and dailystats.py. The same
+# transaction invalidates the user's cached regression model.
+#
+# By default the uid is only checked to be an integer, not with
+# a SELECT: the INSERT goes straight to the database and a
+# violation of the entries.uid foreign key is reported as 400
+# "no such user...", saving a round trip per upload. Set
+# [upload] user_check = select to check first instead (answered
+# from a warm-container cache of known uids when possible).
+#
+# Retries: a client may send an idempotency key, as
+# "request_id" in a single entry or an Idempotency-Key header,
+# and its own timestamp for each entry as "date". A request
+# repeating a key gets the first response back, marked with an
+# Idempotent-Replayed header, and writes nothing; see
+# idempotency.py. A second entry for the same date is a 400.
+#
+# Asynchronous mode ([upload] mode = async, or ?mode=async on a
+# request) skips the database write: the validated entries are
+# sent to the entry queue (see entryqueue.py) and the response
+# is 202 with one request id per entry. The
+# journal_upload_consumer lambda writes them later. There is no
+# foreign key to catch an unknown uid before the 202, so the
+# user is checked first whatever user_check says (from the
+# known-user cache when possible, else with a SELECT). A client
+# may send its own "request_id" with each entry, or an
+# Idempotency-Key for the request, so that a retried upload is
+# not written twice.
+#
+# datatier, config, userstats, validation and handler come from
+# the journalapp_common layer (lambda_layers/).
 #
 
-import json
-import os
+import applog
+import dailystats
 import datatier
+import config
+import entryqueue
+import idempotency
+import userstats
 import time
+import uuid
 
-from configparser import ConfigParser
+from handler import forget_user, lambda_entry, remember_user, require_user, response
+from validation import BadRequest, decode_body, integer, path_param, query_param, string, validate_entry
+
+NAME = "journal_upload"
+
+FIELDS = ["notes", "sleep", "eat", "water", "social", "overall"]
+
+MAX_BATCH = 500  # entries per request
+
+check_uid = integer(1, 2 ** 31 - 1)
+
+INSERT_ENTRY_SQL = """
+  INSERT INTO entries(uid, date, notes, sleep, eat, water, social, overall)
+              VALUES(%s, %s, %s, %s, %s, %s, %s, %s);
+"""
+
+
+#
+# entry_row:
+#
+# Validates an entry and returns (row, None) where row is the
+# list of values for INSERT_ENTRY_SQL minus the uid, or
+# (None, error message). The optional "date" field
+# (YYYY-MM-DD hh:mm:ss) lets a client send the time the entry
+# was written; it defaults to now (and is required in a batch,
+# see validate_batch).
+#
+def entry_row(entry, now):
+  values, error = validate_entry(entry)
+  if error is not None:
+    return None, error
+
+  return [values.get("date", now)] + [values[field] for field in FIELDS], None
+
+
+#
+# request_ids:
+#
+# The idempotency key of each entry for the queue: the client's
+# "request_id" if given, else the request's key for a single
+# entry, else one derived from the request's key and the
+# entry's position in a batch, else a new uuid. Derived ids are
+# the same on every retry of the request, so the consumer writes
+# a retried batch once; they are uuids rather than key:i to fit
+# in entries.requestid whatever the key's length.
+#
+check_request_id = string(64)
+
+
+def request_ids(entries, key=None):
+  ids = []
+
+  for i, entry in enumerate(entries):
+    rid = entry.get("request_id")
+
+    if rid is None and key is not None and len(entries) == 1:
+      rid = key
+    elif rid is None and key is not None:
+      rid = str(uuid.uuid5(uuid.NAMESPACE_OID, key + ":" + str(i)))
+    elif rid is None:
+      rid = str(uuid.uuid4())
+    else:
+      rid, error = check_request_id(rid)
+      if error is not None:
+        raise BadRequest("entry " + str(i) + ": request_id " + error)
+
+    ids.append(rid)
+
+  return ids
+
+
+#
+# enqueue:
+#
+# Sends the validated rows to the entry queue, returning the
+# 202 response.
+#
+def enqueue(uid, entries, rows, key=None):
+  rids = request_ids(entries, key)
+
+  if len(set(rids)) != len(rids):
+    raise BadRequest("duplicate request_id within batch")
+
+  messages = [
+    {"uid": uid, "requestid": rid, "entry": dict(zip(["date"] + FIELDS, row))}
+    for rid, row in zip(rids, rows)
+  ]
+
+  with applog.stage("enqueue"):
+    entryqueue.get_queue().send(messages)
+
+  return response(202, {"message": "queued", "queued": len(messages), "request_ids": rids})
+
+
+#
+# validate_batch:
+#
+# Validates every entry in a batch, returning (rows, errors)
+# where errors is a list of {"index": i, "error": message}.
+# Entries without a "date" are errors: defaulting them all to
+# now would give them the same date, and only the first could
+# be written.
+#
+def validate_batch(entries, now):
+  rows = []
+  errors = []
+  dates = set()
+
+  for i, entry in enumerate(entries):
+    row, error = entry_row(entry, now)
+
+    if error is None and "date" not in entry:
+      error = "date is required in a batch"
+    elif error is None and row[0] in dates:
+      error = "duplicate date within batch"
+
+    if error is not None:
+      errors.append({"index": i, "error": error})
+    else:
+      dates.add(row[0])
+      rows.append(row)
+
+  return rows, errors
+
+
+@lambda_entry("journal_upload")
+def lambda_handler(event, context, dbConn):
+  #
+  # uid comes from the url path, the entry (or batch of
+  # entries) from the body of the request in JSON format:
+  #
+  #
+  # a uid that is not an integer would fail the INSERT with a
+  # data error rather than the foreign key:
+  #
+  uid, error = check_uid(path_param(event, "uid"))
+  if error is not None:
+    raise BadRequest("uid " + error)
+
+  applog.set_fields(uid=uid)
+
+  with applog.stage("validate"):
+    body = decode_body(event)
 
-def lambda_handler(event, context):
-  try:
-    print("**STARTING**")
-    print("**lambda: journal-app-upload**")
-    
-    #
-    # setup AWS based on config file:
-    #
-    config_file = 'journalapp-config.ini'
-    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-    
-    configur = ConfigParser()
-    configur.read(config_file)
-    
-    #
-    # configure for RDS access
-    #
-    rds_endpoint = configur.get('rds', 'endpoint')
-    rds_portnum = int(configur.get('rds', 'port_number'))
-    rds_username = configur.get('rds', 'user_name')
-    rds_pwd = configur.get('rds', 'user_pwd')
-    rds_dbname = configur.get('rds', 'db_name')
-    
-    
-  
-    #
-    # the user has sent us two parameters:
-    #  1. filename of their file
-    #  2. raw file data in base64 encoded string
-    #
-    # The parameters are coming through web server 
-    # (or API Gateway) in the body of the request
-    # in JSON format.
-    #
-    print("**Accessing request body**")
-    
-    if "uid" not in event["pathParameters"]:
-        raise Exception("event has no uid")
-        
-    uid = event["pathParameters"]["uid"]
-    print("uid:", uid)
-
-    if "body" not in event["queryStringParameters"]:
-      raise Exception("event has no body")
-      
-    body = json.loads(event["queryStringParameters"]["body"]) # parse the json
-    
-    if "notes" not in body:
-      raise Exception("event has a body but no notes")
-    if "sleep" not in body:
-      raise Exception("event has a body but no sleep")
-    if "eat" not in body:
-      raise Exception("event has a body but no eat")
-    if "water" not in body:
-      raise Exception("event has a body but no water")
-    if "social" not in body:
-      raise Exception("event has a body but no social")
-    if "overall" not in body:
-        raise Exception("event has a body but no overall")
-
-    notes = body["notes"]
-    sleep = body["sleep"]
-    eat = body["eat"]
-    water = body["water"]
-    social = body["social"]
-    overall = body["overall"]
     # get datetime sql format
-    date = time.strftime('%Y-%m-%d %H:%M:%S')
-
-    print("Got data from the client:")
-    print("notes:", notes)
-    print("sleep:", sleep)
-    print("eat:", eat)
-    print("water:", water)
-    print("social:", social)
-    print("overall:", overall)
-    
-    #
-    # open connection to the database:
-    #
-    print("**Opening connection**")
-    
-    dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
-
-    #
-    # first we need to make sure the uid is valid:
-    #
-    print("**Checking if uid is valid**")
-    
-    sql = "SELECT * FROM users WHERE uid = %s;"
-    
-    row = datatier.retrieve_one_row(dbConn, sql, [uid])
-    
-    if row == ():  # no such user
-      print("**No such user, returning...**")
-      return {
-        'statusCode': 400,
-        'body': json.dumps("no such user...")
-      }
-    
-    print(row)
-    print("**Adding entries row to database**")
-    
-    sql = """
-      INSERT INTO entries(uid, date, notes, sleep, eat, water, social, overall)
-                  VALUES(%s, %s, %s, %s, %s, %s, %s, %s);
-    """
-    
-    #
-    # Insert the entry into the database:
-    #
-    datatier.perform_action(dbConn, sql, [uid, date, notes, sleep, eat, water, social, overall])
-
-    #
-    # respond in an HTTP-like way, i.e. with a status
-    # code and body in JSON format:
-    #
-    print("**DONE, returning ok**")
-    
-    return {
+    now = time.strftime('%Y-%m-%d %H:%M:%S')
+
+    if isinstance(body, list):
+      #
+      # batch mode: validate every entry before touching the database
+      #
+      if len(body) == 0:
+        raise BadRequest("event has an empty batch")
+      if len(body) > MAX_BATCH:
+        raise BadRequest("batch too large, max is " + str(MAX_BATCH))
+
+      rows, errors = validate_batch(body, now)
+
+      if len(errors) > 0:
+        applog.info("invalid entries in batch", invalid=len(errors))
+        return response(400, {"message": "invalid entries", "errors": errors})
+    else:
+      row, error = entry_row(body, now)
+      if error is not None:
+        raise BadRequest(error)
+
+      rows = [row]
+
+    key = idempotency.request_key(event, body)
+
+  applog.set_fields(entries=len(rows))
+
+  mode = query_param(event, "mode", config.get('upload', 'mode', fallback='sync'))
+  if mode not in ("sync", "async"):
+    raise BadRequest("mode must be sync or async")
+
+  if mode == "async":
+    applog.set_fields(mode=mode)
+    require_user(dbConn, uid)
+    return enqueue(uid, body if isinstance(body, list) else [body], rows, key)
+
+  if key is not None:
+    stored = idempotency.remembered(uid, NAME, key)
+    if stored is not None:
+      applog.set_fields(idempotent="replay")
+      return idempotency.replay(stored)
+
+  #
+  # check the uid up front only if configured to, otherwise the
+  # foreign key on entries.uid does it for free:
+  #
+  if config.get('upload', 'user_check', fallback='fk') == 'select':
+    require_user(dbConn, uid)
+
+  if isinstance(body, list):
+    result = response(200, {"message": "success", "inserted": len(rows)})
+  else:
+    result = {
       'statusCode': 200,
       'body': "success"
     }
-    
+
+  #
+  # Insert the entries into the database, add them to the
+  # user's running statistics and drop the user's cached
+  # model, all in one transaction -- after storing the response
+  # under the idempotency key, if any, so that a repeat fails
+  # before writing anything:
+  #
+  params = [[uid] + row for row in rows]
+
+  if len(params) == 1:
+    insert = (INSERT_ENTRY_SQL, params[0])
+  else:
+    insert = (INSERT_ENTRY_SQL, params, True)
+
+  metrics = [row[2:] for row in rows]  # skip date and notes
+
+  actions = [
+    insert,
+    (userstats.UPSERT_SQL, userstats.upsert_params(uid, metrics)),
+    (userstats.INVALIDATE_MODEL_SQL, [uid]),
+  ]
+
+  rollup = dailystats.action(uid, [[row[0]] + row[2:] for row in rows])
+  if rollup is not None:
+    actions.append(rollup)
+
+  if key is not None:
+    actions.insert(0, idempotency.record(uid, NAME, key, result))
+
+  try:
+    datatier.perform_transaction(dbConn, actions)
   except Exception as err:
-    print("**ERROR**")
-    print(str(err))
-    
-    return {
-      'statusCode': 500,
-      'body': json.dumps(str(err))
-    }
+    if datatier.is_foreign_key_violation(err):  # no such user
+      forget_user(uid)
+      raise BadRequest("no such user...")
+    if datatier.is_duplicate_key(err):
+      stored = idempotency.lookup(dbConn, uid, NAME, key) if key is not None else None
+      if stored is not None:
+        applog.set_fields(idempotent="replay")
+        return idempotency.replay(stored)
+      raise BadRequest("an entry for this date already exists")
+    raise
+
+  remember_user(uid)
+
+  if key is not None:
+    idempotency.remember(uid, NAME, key, result)
+
+  return result
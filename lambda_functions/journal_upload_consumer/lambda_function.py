@@ -0,0 +1,234 @@
+#
+# Drains the entry queue filled by journal_upload's asynchronous
+# mode (see entryqueue.py): triggered by the queue's SQS event
+# source mapping with a batch of messages, each one entry.
+#
+# Messages are grouped by uid, and each user's entries are
+# written with one multi-row INSERT, the user_stats and
+# daily_stats upserts and the model invalidation in a single
+# transaction -- the same
+# writes journal_upload makes in synchronous mode.
+#
+# Delivery is at-least-once, so every message carries a request
+# id that is stored in entries.requestid (unique per uid):
+# messages whose request id is already in entries, or repeated
+# within the batch, are acknowledged without writing anything.
+#
+# Messages that can never be written -- malformed, no such user,
+# a second entry for the same date -- are sent to the
+# dead-letter queue with the reason. Messages that fail for
+# other reasons (e.g. the database is unavailable) are reported
+# in batchItemFailures so SQS redelivers only those; this needs
+# ReportBatchItemFailures on the event source mapping. Without a
+# configured dead-letter queue, bad messages are reported as
+# failures too and the queue's redrive policy moves them aside
+# after maxReceiveCount attempts.
+#
+
+import json
+
+import applog
+import dailystats
+import datatier
+import entryqueue
+import userstats
+
+from handler import lambda_entry
+from validation import validate_entry
+
+FIELDS = ["notes", "sleep", "eat", "water", "social", "overall"]
+
+INSERT_ENTRY_SQL = """
+  INSERT INTO entries(uid, date, notes, sleep, eat, water, social, overall, requestid)
+              VALUES(%s, %s, %s, %s, %s, %s, %s, %s, %s);
+"""
+
+
+class Unwritable(Exception):
+  """
+  A message that will never succeed, for the dead-letter queue
+  """
+  pass
+
+
+#
+# parse:
+#
+# Returns (uid, requestid, row) for a queued message body, row
+# being the values for INSERT_ENTRY_SQL after uid and before
+# requestid. Raises Unwritable.
+#
+def parse(text):
+  try:
+    body = json.loads(text)
+    uid = str(int(body["uid"]))
+    requestid = body["requestid"]
+    entry = body["entry"]
+  except (ValueError, TypeError, KeyError) as err:
+    raise Unwritable("malformed message: " + str(err))
+
+  if not isinstance(requestid, str) or not 0 < len(requestid) <= 64:
+    raise Unwritable("bad requestid")
+  if not isinstance(entry, dict) or "date" not in entry:
+    raise Unwritable("entry has no date")
+
+  values, error = validate_entry(entry)
+  if error is not None:
+    raise Unwritable(error)
+
+  return uid, requestid, [values["date"]] + [values[field] for field in FIELDS]
+
+
+#
+# existing_requestids:
+#
+# The request ids among requestids already written for uid.
+#
+def existing_requestids(dbConn, uid, requestids):
+  sql = "SELECT requestid FROM entries WHERE uid = %s AND requestid IN (" + \
+        ", ".join(["%s"] * len(requestids)) + ");"
+
+  rows = datatier.retrieve_all_rows(dbConn, sql, [uid] + requestids)
+
+  return {row[0] for row in rows}
+
+
+#
+# write:
+#
+# Inserts [(requestid, row)] for uid in one transaction.
+#
+def write(dbConn, uid, pending):
+  params = [[uid] + row + [requestid] for (requestid, row) in pending]
+  metrics = [row[2:] for (requestid, row) in pending]  # skip date and notes
+
+  actions = [
+    (INSERT_ENTRY_SQL, params, True),
+    (userstats.UPSERT_SQL, userstats.upsert_params(uid, metrics)),
+    (userstats.INVALIDATE_MODEL_SQL, [uid]),
+  ]
+
+  rollup = dailystats.action(uid, [[row[0]] + row[2:] for (requestid, row) in pending])
+  if rollup is not None:
+    actions.append(rollup)
+
+  datatier.perform_transaction(dbConn, actions)
+
+
+#
+# write_user:
+#
+# Writes one user's messages, [(messageId, requestid, row)].
+# Returns {messageId: None if done, else the exception}.
+#
+def write_user(dbConn, uid, messages):
+  outcome = {}
+
+  #
+  # acknowledge redeliveries and repeats without writing:
+  #
+  found = existing_requestids(dbConn, uid, sorted({rid for (msgid, rid, row) in messages}))
+
+  pending = []
+  seen = set(found)
+  for (msgid, rid, row) in messages:
+    if rid in seen:
+      outcome[msgid] = None
+    else:
+      seen.add(rid)
+      pending.append((msgid, rid, row))
+
+  if len(pending) == 0:
+    return outcome
+
+  try:
+    write(dbConn, uid, [(rid, row) for (msgid, rid, row) in pending])
+    outcome.update({msgid: None for (msgid, rid, row) in pending})
+    return outcome
+
+  except Exception as err:
+    if datatier.is_foreign_key_violation(err):
+      outcome.update({msgid: Unwritable("no such user") for (msgid, rid, row) in pending})
+      return outcome
+    if not datatier.is_duplicate_key(err):
+      outcome.update({msgid: err for (msgid, rid, row) in pending})
+      return outcome
+
+  #
+  # a duplicate key rejected the batch: write the entries one at
+  # a time to find the offending ones.
+  #
+  for (msgid, rid, row) in pending:
+    try:
+      write(dbConn, uid, [(rid, row)])
+      outcome[msgid] = None
+    except Exception as err:
+      if not datatier.is_duplicate_key(err):
+        outcome[msgid] = err
+      elif existing_requestids(dbConn, uid, [rid]):
+        outcome[msgid] = None  # written concurrently by another consumer
+      else:
+        outcome[msgid] = Unwritable("an entry for this date already exists")
+
+  return outcome
+
+
+#
+# dead_letter:
+#
+# Sends the unwritable messages to the dead-letter queue, and
+# returns the ones that could not be sent (to be retried).
+#
+def dead_letter(unwritable):
+  dlq = entryqueue.get_dead_letter_queue()
+
+  if dlq is None or len(unwritable) == 0:
+    return [msgid for (msgid, text, reason) in unwritable]
+
+  dlq.send([{"messageId": msgid, "body": text, "error": reason}
+            for (msgid, text, reason) in unwritable])
+
+  return []
+
+
+#
+# errors are re-raised so that the whole batch is retried:
+#
+@lambda_entry("journal_upload_consumer", raise_errors=True)
+def lambda_handler(event, context, dbConn):
+  records = event.get("Records", [])
+
+  failed = []      # messageIds to retry
+  unwritable = []  # (messageId, body text, reason)
+  by_user = {}     # uid -> [(messageId, requestid, row)]
+
+  with applog.stage("parse"):
+    for record in records:
+      try:
+        uid, rid, row = parse(record["body"])
+        by_user.setdefault(uid, []).append((record["messageId"], rid, row))
+      except Unwritable as err:
+        unwritable.append((record["messageId"], record["body"], str(err)))
+
+  texts = {record["messageId"]: record["body"] for record in records}
+
+  for uid, messages in by_user.items():
+    for msgid, err in write_user(dbConn, uid, messages).items():
+      if err is None:
+        continue
+      if isinstance(err, Unwritable):
+        unwritable.append((msgid, texts[msgid], str(err)))
+      else:
+        applog.warning("write failed, will retry", uid=uid, error=str(err))
+        failed.append(msgid)
+
+  if len(unwritable) > 0:
+    applog.warning("dead-lettering messages", count=len(unwritable),
+                   reasons=sorted({reason for (msgid, text, reason) in unwritable}))
+    with applog.stage("dead_letter"):
+      failed += dead_letter(unwritable)
+
+  applog.set_fields(messages=len(records), users=len(by_user),
+                    dead_lettered=len(unwritable), failed=len(failed))
+
+  return {"batchItemFailures": [{"itemIdentifier": msgid} for msgid in failed]}
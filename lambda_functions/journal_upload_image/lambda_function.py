@@ -1,151 +1,240 @@
 #
-# Uploads a PDF to S3 and then inserts a new job record
-# in the JournalApp database with a status of 'uploaded'.
-# Sends the job id back to the client.
+# Starts an image upload for a user.
+#
+# Images are not sent through this lambda (base64 in the body
+# inflates them by a third and runs into API Gateway / Lambda
+# payload limits). Instead this is the first of two phases:
+#
+#  1. here, we check the user, reserve an images row with
+#     status 'pending' and a fresh bucketkey, and return a
+#     presigned S3 POST that lets the client upload the file
+#     straight to S3 (size and content type are enforced by
+#     the POST policy);
+#  2. the S3 ObjectCreated event triggers
+#     journal_upload_image_finalize, which confirms the object
+#     and marks the row 'uploaded'.
+#
+# The request body is JSON:
+#   {"filename": "beach.jpg", "content_type": "image/jpeg",
+#    "date": "YYYY-MM-DD hh:mm:ss",   <= optional
+#    "sha256": "<hex digest of the file>",   <= optional
+#    "request_id": "<idempotency key>"}   <= optional
+#
+# The date is the client's timestamp for the image, else the
+# time of the request. With an idempotency key (the request_id,
+# or an Idempotency-Key header) a retried request gets the same
+# reservation back, with a fresh upload URL, instead of a second
+# images row; see idempotency.py. Otherwise a second image for
+# the same date is a 400.
+#
+# With the file's SHA-256 the image is stored content-addressed
+# (see imageblobs.py): if the user has already stored that
+# content, the images row points at the existing object and the
+# response says "uploaded": true with no upload URL -- the
+# client skips the upload. The finalizer checks the hash of what
+# is uploaded.
+#
+# datatier, config, storage, imageblobs, validation and handler
+# come from the journalapp_common layer (lambda_layers/).
 #
 
-import json
-import os
+import applog
 import datatier
+import idempotency
+import imageblobs
+import storage
 import time
+import uuid
 
-from configparser import ConfigParser
+from handler import lambda_entry, require_user, response
+from validation import BadRequest, compile_schema, datetime_check, decode_body, one_of, path_param, \
+  sha256_check, string
+
+NAME = "journal_upload_image"
+
+CONTENT_TYPES = {
+  "image/jpeg": ".jpg",
+  "image/png": ".png",
+  "image/gif": ".gif",
+  "image/webp": ".webp",
+  "image/heic": ".heic",
+}
+
+MAX_BYTES = 25 * 1024 * 1024
+URL_EXPIRES = 900  # seconds
+
+validate_request = compile_schema({
+  "filename": string(256),
+  "content_type": one_of(CONTENT_TYPES),
+  "date": datetime_check,
+  "sha256": sha256_check,
+}, optional=("date", "sha256"))
+
+
+#
+# upload_response:
+#
+# The response for a reservation {"imageid", "bucketkey",
+# "content_type", "status"}: a presigned POST straight to S3,
+# limited to the reserved key, type and size, unless the object
+# is already uploaded.
+#
+def upload_response(reservation, headers=None):
+  if reservation.get("status") == 'uploaded':
+    result = response(200, {
+      "imageid": reservation["imageid"],
+      "bucketkey": reservation["bucketkey"],
+      "uploaded": True,
+    })
+    if headers is not None:
+      result["headers"] = headers
+    return result
+
+  post = storage.s3_client().generate_presigned_post(
+    Bucket=storage.bucket_name(),
+    Key=reservation["bucketkey"],
+    Fields={"Content-Type": reservation["content_type"]},
+    Conditions=[
+      {"Content-Type": reservation["content_type"]},
+      ["content-length-range", 1, MAX_BYTES],
+    ],
+    ExpiresIn=URL_EXPIRES)
+
+  result = response(200, {
+    "imageid": reservation["imageid"],
+    "bucketkey": reservation["bucketkey"],
+    "url": post["url"],
+    "fields": post["fields"],
+    "expires_in": URL_EXPIRES,
+  })
+
+  if headers is not None:
+    result["headers"] = headers
+
+  return result
+
+
+#
+# replay:
+#
+# The response for a repeated request, from the reservation
+# stored under its key. Reservations stored in the database
+# lack the imageid (it is generated by the INSERT that follows
+# the key's) and, for blobs, the final bucketkey, so the images
+# row is looked up by (uid, date) -- or by bucketkey for keys
+# stored before dates were. Its current status also means a
+# retry after the upload went through is not asked to upload
+# again. If the image has since been deleted the replay is a
+# 404: the reservation it would return is gone.
+#
+def replay(dbConn, uid, stored):
+  reservation = idempotency.replay_json(stored)
+
+  if "imageid" not in reservation:
+    if "date" in reservation:
+      row = datatier.retrieve_one_row(dbConn,
+                                      "SELECT imageid, bucketkey, status FROM images WHERE uid = %s AND date = %s;",
+                                      [uid, reservation["date"]])
+    else:
+      row = datatier.retrieve_one_row(dbConn,
+                                      "SELECT imageid, bucketkey, status FROM images WHERE bucketkey = %s;",
+                                      [reservation["bucketkey"]])
+    if row == ():
+      applog.set_fields(idempotent="replay")
+      return response(404, "no such image...")
+    reservation.update(imageid=row[0], bucketkey=row[1], status=row[2])
+
+  applog.set_fields(idempotent="replay")
+
+  return upload_response(reservation, headers=dict(idempotency.REPLAY_HEADERS))
+
+
+@lambda_entry(NAME)
+def lambda_handler(event, context, dbConn):
+  #
+  # the user has sent us the name and type of their image;
+  # the parameters are coming through web server (or API
+  # Gateway) in the body of the request in JSON format.
+  #
+  uid = path_param(event, "uid")
+  applog.set_fields(uid=uid)
+
+  with applog.stage("validate"):
+    body = decode_body(event)
+    values, error = validate_request(body)
+    if error is not None:
+      raise BadRequest(error)
+
+    key = idempotency.request_key(event, body)
+
+  if key is not None:
+    stored = idempotency.remembered(uid, NAME, key)
+    if stored is not None:
+      return replay(dbConn, uid, stored)
+
+  content_type = values["content_type"]
+  date = values.get("date") or time.strftime('%Y-%m-%d %H:%M:%S')
+  sha256 = values.get("sha256")
+
+  applog.set_fields(content_type=content_type, blob=sha256 is not None)
+
+  #
+  # first we need to make sure the uid is valid:
+  #
+  require_user(dbConn, uid)
+
+  #
+  # reserve the images row before handing out the upload URL,
+  # so the finalizer always finds it:
+  #
+  if sha256 is not None:
+    bucketkey = imageblobs.blob_key(uid, sha256, CONTENT_TYPES[content_type])
+    actions = imageblobs.reserve_actions(uid, date, sha256, bucketkey)
+  else:
+    bucketkey = "images/" + str(uid) + "/" + str(uuid.uuid4()) + CONTENT_TYPES[content_type]
 
-def lambda_handler(event, context):
-  try:
-    print("**STARTING**")
-    print("**lambda: journal-app-upload**")
-    
-    #
-    # setup AWS based on config file:
-    #
-    config_file = 'journalapp-config.ini'
-    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
-    
-    configur = ConfigParser()
-    configur.read(config_file)
-    
-    #
-    # configure for RDS access
-    #
-    rds_endpoint = configur.get('rds', 'endpoint')
-    rds_portnum = int(configur.get('rds', 'port_number'))
-    rds_username = configur.get('rds', 'user_name')
-    rds_pwd = configur.get('rds', 'user_pwd')
-    rds_dbname = configur.get('rds', 'db_name')
-    
-    
-  
-    #
-    # the user has sent us two parameters:
-    #  1. filename of their file
-    #  2. raw file data in base64 encoded string
-    #
-    # The parameters are coming through web server 
-    # (or API Gateway) in the body of the request
-    # in JSON format.
-    #
-    print("**Accessing request body**")
-    
-    if "uid" in event:
-      uid = event["uid"]
-        
-    print("uid:", uid)
-
-    if "body" not in event:
-      raise Exception("event has no body")
-      
-    body = json.loads(event["body"]) # parse the json
-    
-    if "notes" not in body:
-      raise Exception("event has a body but no notes")
-    if "sleep" not in body:
-      raise Exception("event has a body but no sleep")
-    if "eat" not in body:
-      raise Exception("event has a body but no eat")
-    if "water" not in body:
-      raise Exception("event has a body but no water")
-    if "social" not in body:
-      raise Exception("event has a body but no social")
-    if "overall" not in body:
-        raise Exception("event has a body but no overall")
-
-    notes = body["notes"]
-    sleep = body["sleep"]
-    eat = body["eat"]
-    water = body["water"]
-    social = body["social"]
-    overall = body["overall"]
-    date = time.strftime('%Y-%m-%d %H:%M:%S')
-
-    print("Got data from the client:")
-    print("notes:", notes)
-    print("sleep:", sleep)
-    print("eat:", eat)
-    print("water:", water)
-    print("social:", social)
-    print("overall:", overall)
-    
-    #
-    # open connection to the database:
-    #
-    print("**Opening connection**")
-    
-    dbConn = datatier.get_dbConn(rds_endpoint, rds_portnum, rds_username, rds_pwd, rds_dbname)
-
-    #
-    # first we need to make sure the uid is valid:
-    #
-    print("**Checking if uid is valid**")
-    
-    sql = "SELECT * FROM users WHERE uid = %s;"
-    
-    row = datatier.retrieve_one_row(dbConn, sql, [uid])
-    
-    if row == ():  # no such user
-      print("**No such user, returning...**")
-      return {
-        'statusCode': 400,
-        'body': json.dumps("no such user...")
-      }
-    
-    print(row)
-
-    #
-    # Remember that the processing of the PDF is event-triggered,
-    # and that lambda function is going to update the database as
-    # is processes. So let's insert a job record into the database
-    # first, THEN upload the PDF to S3. The status column should 
-    # be set to 'uploaded':
-    #
-    print("**Adding entries row to database**")
-    
     sql = """
-      INSERT INTO jobs(uid, date, notes, sleep, eat, water, social, overall)
-                  VALUES(%s, %s, %s, %s, %s, %s, %s, %s);
+      INSERT INTO images(uid, date, bucketkey, status)
+                  VALUES(%s, %s, %s, 'pending');
     """
-    
-    #
-    # TODO #2 of 3: what values should we insert into the database?
-    #
-    datatier.perform_action(dbConn, sql, [uid, date, notes, sleep, eat, water, social, overall])
-
-    #
-    # respond in an HTTP-like way, i.e. with a status
-    # code and body in JSON format:
-    #
-    print("**DONE, returning jobid**")
-    
-    return {
-      'statusCode': 200,
-      'body': "success"
-    }
-    
+    actions = [(sql, [uid, date, bucketkey])]
+
+  reservation = {"bucketkey": bucketkey, "content_type": content_type, "date": date}
+
+  if key is not None:
+    actions.insert(0, idempotency.record(uid, NAME, key, response(200, reservation)))
+
+  try:
+    counts, imageid = datatier.perform_transaction(dbConn, actions, lastrowid=True)
   except Exception as err:
-    print("**ERROR**")
-    print(str(err))
-    
-    return {
-      'statusCode': 500,
-      'body': json.dumps(str(err))
-    }
+    if datatier.is_duplicate_key(err):
+      stored = idempotency.lookup(dbConn, uid, NAME, key) if key is not None else None
+      if stored is not None:
+        return replay(dbConn, uid, stored)
+      raise BadRequest("an image for this date already exists")
+    raise
+
+  reservation.update(imageid=imageid, status='pending')
+
+  #
+  # a blob's images row has the blob's key and status, which are
+  # the ones we gave only if the blob is new. The row is read
+  # back from the primary, which has it whatever the replicas'
+  # lag:
+  #
+  if sha256 is not None:
+    if isinstance(dbConn, datatier.RoutingConnection):
+      dbConn = dbConn.writer()
+
+    row = datatier.retrieve_one_row(dbConn,
+                                    "SELECT bucketkey, status FROM images WHERE imageid = %s;",
+                                    [imageid])
+    reservation.update(bucketkey=row[0], status=row[1])
+
+  if reservation["status"] == 'uploaded':
+    applog.set_fields(duplicate=True)
+
+  if key is not None:
+    idempotency.remember(uid, NAME, key, response(200, reservation))
+
+  return upload_response(reservation)
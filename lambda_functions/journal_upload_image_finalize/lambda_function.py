@@ -0,0 +1,177 @@
+#
+# Second phase of an image upload: triggered by the S3
+# ObjectCreated event for images/*, confirms that the object
+# the client uploaded with the presigned POST from
+# journal_upload_image is there, and marks its images row
+# 'uploaded' with the object's size.
+#
+# Objects that have no pending images row (the reservation was
+# never made, or was already finalized) are left alone and
+# reported in the logs.
+#
+# Content-addressed uploads (images/blobs/..., see
+# imageblobs.py) are also hashed, streaming, and only confirmed
+# if the content matches the SHA-256 the blob was reserved
+# under; all images rows sharing the blob are confirmed
+# together. An object that does not match a pending blob is
+# deleted and the blob stays 'pending', so the next upload of
+# that content (the honest client's retry) is asked for the file
+# again. A blob already 'uploaded' is never deleted or reset
+# here: a mismatch then is an overwrite through an unexpired
+# presigned POST, and is logged as an error. Blob objects whose
+# blob was released before the upload arrived are deleted.
+#
+# The confirmed objects are then passed on, as an S3 event of
+# their own, to journal_image_variants ([images]
+# variants_function) to make their thumbnails; S3 cannot send
+# the same images/ events to a second function. The invocation
+# is asynchronous, so this does not wait for the resizing.
+#
+
+import applog
+import datatier
+import imageblobs
+import imagevariants
+import json
+import storage
+import urllib.parse
+
+from handler import lambda_entry, response
+
+MAX_BYTES = 25 * 1024 * 1024  # same limit as journal_upload_image
+
+_lambda = None
+
+
+def lambda_client():
+  global _lambda
+
+  if _lambda is None:
+    import boto3
+    _lambda = boto3.client('lambda')
+
+  return _lambda
+
+
+def request_variants(bucket, bucketkeys):
+  """
+  Asks journal_image_variants to make the variants of the given
+  objects, unless variants are turned off. A failure is only
+  logged: the upload itself is confirmed, and the images are
+  read from their originals until the variants exist.
+  """
+  function = imagevariants.function_name()
+  if function is None or len(bucketkeys) == 0:
+    return
+
+  records = [{"s3": {"bucket": {"name": bucket},
+                     "object": {"key": urllib.parse.quote_plus(key)}}}
+             for key in bucketkeys]
+
+  try:
+    lambda_client().invoke(FunctionName=function, InvocationType="Event",
+                           Payload=json.dumps({"Records": records}).encode())
+  except Exception as err:
+    applog.warning("could not request variants", error=str(err), bucketkeys=bucketkeys)
+
+
+def finalize_blob(dbConn, s3, bucket, bucketkey, size):
+  """
+  Verifies and confirms one uploaded blob object; returns True
+  if the pending blob was marked uploaded
+  """
+  row = datatier.retrieve_one_row(dbConn,
+                                  "SELECT sha256, status FROM image_blobs WHERE bucketkey = %s;",
+                                  [bucketkey])
+
+  if row == ():
+    applog.warning("no image_blobs row, deleting", bucketkey=bucketkey)
+    s3.delete_object(Bucket=bucket, Key=bucketkey)
+    return False
+
+  sha256, status = row
+
+  if size > MAX_BYTES or imageblobs.hash_object(s3, bucket, bucketkey) != sha256:
+    #
+    # a blob that was already verified is never taken back: its
+    # images are in use, and this is an overwrite through a
+    # presigned POST that has not expired yet:
+    #
+    if status != 'pending':
+      applog.error("uploaded blob overwritten with other content", bucketkey=bucketkey, size=size)
+      return False
+
+    applog.warning("object does not match its blob, deleting", bucketkey=bucketkey, size=size)
+    s3.delete_object(Bucket=bucket, Key=bucketkey)
+    return False
+
+  counts = datatier.perform_transaction(dbConn, [
+    ("UPDATE image_blobs SET status = 'uploaded', size = %s WHERE bucketkey = %s AND status = 'pending';",
+     [size, bucketkey]),
+    ("UPDATE images SET status = 'uploaded', size = %s WHERE bucketkey = %s AND status = 'pending';",
+     [size, bucketkey]),
+  ])
+
+  if counts[0] == 0:
+    applog.warning("blob already uploaded", bucketkey=bucketkey)
+    return False
+
+  return True
+
+
+def finalize(dbConn, s3, bucket, bucketkey):
+  """
+  Confirms one uploaded object; returns True if a pending row
+  was marked uploaded
+  """
+  head = s3.head_object(Bucket=bucket, Key=bucketkey)
+  size = head["ContentLength"]
+
+  if imageblobs.is_blob_key(bucketkey):
+    return finalize_blob(dbConn, s3, bucket, bucketkey, size)
+
+  if size > MAX_BYTES:
+    applog.warning("object too large, deleting", bucketkey=bucketkey, size=size)
+    s3.delete_object(Bucket=bucket, Key=bucketkey)
+    datatier.perform_action(dbConn,
+                            "DELETE FROM images WHERE bucketkey = %s AND status = 'pending';",
+                            [bucketkey])
+    return False
+
+  sql = """
+    UPDATE images SET status = 'uploaded', size = %s
+    WHERE bucketkey = %s AND status = 'pending';
+  """
+
+  modified = datatier.perform_action(dbConn, sql, [size, bucketkey])
+
+  if modified == 0:
+    applog.warning("no pending images row", bucketkey=bucketkey)
+    return False
+
+  return True
+
+
+#
+# errors are re-raised so that S3 retries the event:
+#
+@lambda_entry("journal_upload_image_finalize", raise_errors=True)
+def lambda_handler(event, context, dbConn):
+  s3 = storage.s3_client()
+  confirmed = {}  # bucket -> keys
+
+  for record in event.get("Records", []):
+    bucket = record["s3"]["bucket"]["name"]
+    # keys in S3 events are url-encoded:
+    bucketkey = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
+
+    if finalize(dbConn, s3, bucket, bucketkey):
+      confirmed.setdefault(bucket, []).append(bucketkey)
+
+  for bucket, bucketkeys in confirmed.items():
+    request_variants(bucket, bucketkeys)
+
+  count = sum(len(keys) for keys in confirmed.values())
+  applog.set_fields(objects=len(event.get("Records", [])), confirmed=count)
+
+  return response(200, {"confirmed": count})
@@ -0,0 +1,275 @@
+#
+# applog.py
+#
+# Structured, low-overhead logging for the lambdas.
+#
+# Instead of many print() calls per request, each invocation
+# emits ONE JSON line when it finishes, e.g.
+#
+#   {"lambda": "journal_upload", "request_id": "...", "status": 200,
+#    "ms": 12.3, "stages": {"config": 0.0, "connect": 0.1,
+#    "validate": 0.2, "query": 9.8, "commit": 1.4},
+#    "queries": {"count": 2, "rows": 3, "slowest": [{"fp": "3fa2c1d0",
+#                "sql": "INSERT INTO entries(...) VALUES(?, ...", "ms": 9.1, "rows": 1}, ...]},
+#    "uid": "80001", "events": [...]}
+#
+# holding per-stage timings, a summary of every query run
+# through datatier (duration, row count and SQL fingerprint),
+# any fields set with set_fields(), and the messages logged with
+# debug()/info()/warning()/error() at or above the configured
+# level. Request data such as notes is never logged.
+#
+# Settings ([log] section, or JOURNALAPP_LOG_* env vars):
+#   level        DEBUG, INFO, WARNING or ERROR (default INFO)
+#   sample_rate  fraction of successful invocations whose line
+#                is written (default 1.0); failures and
+#                invocations with warnings are always written
+#
+# handler.py starts and finishes the invocation and installs
+# record_query as datatier's query hook.
+#
+
+import contextlib
+import functools
+import json
+import random
+import re
+import sys
+import time
+import zlib
+
+import pymysql
+
+import config
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+MAX_EVENTS = 50        # messages kept per invocation
+SLOWEST_QUERIES = 5    # queries listed individually
+
+_settings = None
+_current = None
+
+
+def _get_settings():
+  global _settings
+
+  if _settings is None:
+    level = config.get('log', 'level', fallback='INFO').upper()
+    _settings = {
+      "level": LEVELS.get(level, LEVELS["INFO"]),
+      "sample_rate": float(config.get('log', 'sample_rate', fallback='1.0')),
+    }
+
+  return _settings
+
+
+def _emit(line):
+  sys.stdout.write(json.dumps(line, default=str) + "\n")
+
+
+###################################################################
+#
+# fingerprint:
+#
+# Normalizes an SQL statement so that the same query always has
+# the same fingerprint: whitespace is collapsed, and literals
+# and placeholders become ?. Returns (id, text) where id is a
+# short hash of the normalized statement, for grouping in log
+# queries, and text its first SQL_TEXT characters. The SQL
+# strings are constants in the code, so results are cached.
+#
+SQL_TEXT = 80
+
+_LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+\b|%s")
+
+
+@functools.lru_cache(maxsize=256)
+def fingerprint(sql):
+  sql = _LITERALS.sub("?", " ".join(sql.split())).rstrip(";")
+  return "%08x" % zlib.crc32(sql.encode()), sql[:SQL_TEXT]
+
+
+###################################################################
+#
+# Invocation:
+#
+# What we know about the invocation in progress.
+#
+class Invocation:
+  def __init__(self, name, request_id):
+    self.name = name
+    self.request_id = request_id
+    self.start = time.perf_counter()
+    self.stages = {}
+    self.fields = {}
+    self.events = []
+    self.max_level = 0
+    self.nqueries = 0
+    self.nrows = 0
+    self.queries = []  # (ms, fingerprint, rows), slowest first
+
+  def add_time(self, stage, ms):
+    self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+  def add_query(self, sql, ms, rows):
+    self.nqueries += 1
+    self.nrows += max(rows, 0)
+    self.add_time("query", ms)
+
+    self.queries.append((ms, sql, rows))
+    if len(self.queries) > SLOWEST_QUERIES:
+      self.queries.sort(key=lambda q: q[0], reverse=True)
+      self.queries.pop()
+
+
+###################################################################
+#
+# begin / finish:
+#
+# Bracket an invocation; finish writes its line (subject to
+# sampling) and returns it.
+#
+def begin(name, context=None):
+  global _current
+
+  request_id = getattr(context, "aws_request_id", None)
+  _current = Invocation(name, request_id)
+  return _current
+
+
+def finish(status):
+  global _current
+
+  inv = _current
+  _current = None
+
+  if inv is None:
+    return None
+
+  settings = _get_settings()
+
+  line = {
+    "lambda": inv.name,
+    "request_id": inv.request_id,
+    "status": status,
+    "ms": round((time.perf_counter() - inv.start) * 1000, 3),
+    "stages": {stage: round(ms, 3) for stage, ms in inv.stages.items()},
+    "queries": {
+      "count": inv.nqueries,
+      "rows": inv.nrows,
+      "slowest": [dict(zip(("fp", "sql"), fingerprint(sql)), ms=round(ms, 3), rows=rows)
+                  for (ms, sql, rows) in sorted(inv.queries, key=lambda q: q[0], reverse=True)],
+    },
+  }
+  line.update(inv.fields)
+  if inv.events:
+    line["events"] = inv.events
+
+  always = (status is None or status >= 500 or inv.max_level >= LEVELS["WARNING"])
+
+  if always or random.random() < settings["sample_rate"]:
+    _emit(line)
+
+  return line
+
+
+###################################################################
+#
+# stage:
+#
+# with applog.stage("validate"): ...  adds the block's duration
+# to the named stage of the current invocation.
+#
+@contextlib.contextmanager
+def stage(name):
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    if _current is not None:
+      _current.add_time(name, (time.perf_counter() - start) * 1000)
+
+
+###################################################################
+#
+# set_fields:
+#
+# Adds fields to the invocation's line, e.g. set_fields(uid=uid).
+#
+def set_fields(**fields):
+  if _current is not None:
+    _current.fields.update(fields)
+
+
+###################################################################
+#
+# record_query:
+#
+# datatier's query hook: func is the datatier function, sql the
+# statement (None for a commit), ms its duration, rows the row
+# count, and err the exception if it failed.
+#
+# Integrity errors (duplicate keys, foreign keys) are logged at
+# INFO, not ERROR: the upload handlers rely on them to detect
+# retries, unknown users and duplicate dates, and answer 400 or
+# replay. As warnings or errors they would write the line of
+# every such request, whatever the sample rate. One a handler
+# does not expect still surfaces as its "unhandled error".
+#
+def record_query(func, sql, ms, rows, err=None):
+  inv = _current
+
+  if inv is not None:
+    if sql is not None:
+      inv.add_query(sql, ms, rows)
+    elif err is None:
+      inv.add_time("commit", ms)
+
+  if err is not None:
+    level = "INFO" if isinstance(err, pymysql.err.IntegrityError) else "ERROR"
+    log(level, "datatier." + func + "() failed", fp=None if sql is None else fingerprint(sql)[0],
+        error=str(err))
+
+
+###################################################################
+#
+# debug / info / warning / error:
+#
+# Log a message with optional fields. Inside an invocation the
+# message goes into its line; outside one it is written
+# immediately as its own line.
+#
+def log(level, msg, **fields):
+  levelno = LEVELS[level]
+
+  if levelno < _get_settings()["level"]:
+    return
+
+  event = {"level": level, "msg": msg}
+  event.update(fields)
+
+  inv = _current
+  if inv is None:
+    _emit(event)
+    return
+
+  inv.max_level = max(inv.max_level, levelno)
+  if len(inv.events) < MAX_EVENTS:
+    inv.events.append(event)
+
+
+def debug(msg, **fields):
+  log("DEBUG", msg, **fields)
+
+
+def info(msg, **fields):
+  log("INFO", msg, **fields)
+
+
+def warning(msg, **fields):
+  log("WARNING", msg, **fields)
+
+
+def error(msg, **fields):
+  log("ERROR", msg, **fields)
@@ -0,0 +1,173 @@
+#
+# config.py
+#
+# Loads the JournalApp settings once per container.
+#
+# The handlers used to re-read and re-parse journalapp-config.ini
+# (and reset AWS_SHARED_CREDENTIALS_FILE) on every invocation.
+# Lambda keeps this module loaded while the container is warm,
+# so the file is now parsed on first use only and the parsed
+# values are served from memory afterwards.
+#
+# Any setting can be overridden with an environment variable
+# named JOURNALAPP_<SECTION>_<OPTION>, e.g.
+#
+#   JOURNALAPP_RDS_ENDPOINT=mydb.xyz.rds.amazonaws.com
+#
+# which is handy for per-stage Lambda configuration and local
+# testing without editing the .ini file.
+#
+
+import os
+
+from configparser import ConfigParser
+
+CONFIG_FILE = 'journalapp-config.ini'
+
+_configur = None
+_rds = None
+_replicas = None
+
+
+###################################################################
+#
+# get_config:
+#
+# Returns the parsed ConfigParser, reading the file on first use.
+#
+def get_config():
+  """
+  Returns the ConfigParser for journalapp-config.ini, parsed once
+  per container
+  """
+  global _configur
+
+  if _configur is None:
+    config_file = os.environ.get('JOURNALAPP_CONFIG_FILE', CONFIG_FILE)
+
+    #
+    # setup AWS based on config file:
+    #
+    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = config_file
+
+    configur = ConfigParser()
+    configur.read(config_file)
+    _configur = configur
+
+  return _configur
+
+
+###################################################################
+#
+# get:
+#
+# Returns one setting, preferring the environment variable
+# JOURNALAPP_<SECTION>_<OPTION> over the config file. Raises
+# an exception if the setting is missing and no fallback is
+# given.
+#
+def get(section, option, fallback=None):
+  """
+  Returns the value of a setting as a string
+
+  Parameters
+  ----------
+  section : config file section, e.g. 'rds' (string),
+  option : option name, e.g. 'endpoint' (string),
+  fallback : value to return if the setting is missing
+
+  Returns
+  -------
+  the setting's value
+  """
+  env_name = 'JOURNALAPP_' + section.upper() + '_' + option.upper()
+
+  if env_name in os.environ:
+    return os.environ[env_name]
+
+  configur = get_config()
+
+  if configur.has_option(section, option):
+    return configur.get(section, option)
+
+  if fallback is not None:
+    return fallback
+
+  raise Exception("missing config setting [" + section + "] " + option)
+
+
+###################################################################
+#
+# rds_settings:
+#
+# Returns (endpoint, portnum, username, pwd, dbname) for RDS
+# access, in the order datatier.get_dbConn expects them.
+#
+def rds_settings():
+  """
+  Returns the RDS connection settings as a tuple
+  """
+  global _rds
+
+  if _rds is None:
+    _rds = (get('rds', 'endpoint'),
+            int(get('rds', 'port_number')),
+            get('rds', 'user_name'),
+            get('rds', 'user_pwd'),
+            get('rds', 'db_name'))
+
+  return _rds
+
+
+###################################################################
+#
+# replica_settings:
+#
+# Returns a list of (endpoint, portnum, username, pwd, dbname),
+# one per read replica in [rds] replica_endpoints (comma
+# separated), logging in as [rds] read_user_name and
+# read_user_pwd (the journalapp-read-only user). The list is
+# empty if no replicas are configured.
+#
+def replica_settings():
+  """
+  Returns the read replicas' connection settings as a list of
+  tuples
+  """
+  global _replicas
+
+  if _replicas is None:
+    endpoints = [e.strip() for e in get('rds', 'replica_endpoints', fallback='').split(',')]
+    endpoints = [e for e in endpoints if e != '']
+
+    if len(endpoints) == 0:
+      _replicas = []
+    else:
+      endpoint, portnum, username, pwd, dbname = rds_settings()
+      read_user = get('rds', 'read_user_name')
+      read_pwd = get('rds', 'read_user_pwd')
+      _replicas = [(e, portnum, read_user, read_pwd, dbname) for e in endpoints]
+
+  return _replicas
+
+
+###################################################################
+#
+# routing_options:
+#
+# Keyword arguments for datatier.RoutingConnection from the
+# optional [rds] replica_* settings.
+#
+def routing_options():
+  options = {
+    'sticky_seconds': float(get('rds', 'replica_sticky_seconds', fallback='5')),
+    'max_lag': float(get('rds', 'replica_max_lag', fallback='5')),
+    'check_interval': float(get('rds', 'replica_check_interval', fallback='5')),
+    'retry_seconds': float(get('rds', 'replica_retry_seconds', fallback='30')),
+  }
+
+  lag_sql = get('rds', 'replica_lag_sql', fallback='')
+  if lag_sql != '':
+    options['lag_sql'] = lag_sql
+
+  return options
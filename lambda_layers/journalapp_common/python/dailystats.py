@@ -0,0 +1,91 @@
+#
+# dailystats.py
+#
+# Per-user, per-day rollup of the metrics (see the daily_stats
+# table in createDB.sql): for each day with entries, the number
+# of entries and the sum, min and max of each metric. Counts and
+# sums add up and min/max combine with LEAST/GREATEST, so an
+# upload only folds its new rows into the days they fall on, and
+# journal_trends can answer daily, weekly or monthly averages
+# over years of history from one small row per day instead of
+# scanning entries.
+#
+# The rollup is optional: [rollup] daily = false stops the
+# uploads maintaining it, and journal_trends then aggregates
+# entries directly. Turning it back on needs a rebuild, as in
+# migrations/007_daily_stats.sql.
+#
+
+import config
+
+from userstats import METRICS
+
+SUM_COLUMNS = ["s_" + m for m in METRICS]
+MIN_COLUMNS = ["min_" + m for m in METRICS]
+MAX_COLUMNS = ["max_" + m for m in METRICS]
+
+COLUMNS = ["n"] + SUM_COLUMNS + MIN_COLUMNS + MAX_COLUMNS
+
+UPSERT_SQL = """
+  INSERT INTO daily_stats(uid, day, """ + ", ".join(COLUMNS) + """)
+       VALUES(%s, %s, """ + ", ".join(["%s"] * len(COLUMNS)) + """)
+  ON DUPLICATE KEY UPDATE
+    """ + ",\n    ".join(
+      [c + " = " + c + " + VALUES(" + c + ")" for c in ["n"] + SUM_COLUMNS] +
+      [c + " = LEAST(" + c + ", VALUES(" + c + "))" for c in MIN_COLUMNS] +
+      [c + " = GREATEST(" + c + ", VALUES(" + c + "))" for c in MAX_COLUMNS]) + """;
+"""
+
+
+###################################################################
+#
+# enabled:
+#
+# True unless [rollup] daily is turned off.
+#
+def enabled():
+  return config.get('rollup', 'daily', fallback='true').lower() not in ('false', 'off', 'no', '0')
+
+
+###################################################################
+#
+# upsert_rows:
+#
+# Given the rows being inserted for uid, each [date, m1, ..., m5]
+# with date a 'YYYY-MM-DD hh:mm:ss' string and the metrics in
+# METRICS order, returns one parameter list for UPSERT_SQL per
+# day, for an executemany.
+#
+def upsert_rows(uid, rows):
+  days = {}
+
+  for row in rows:
+    day = str(row[0])[:10]
+    values = row[1:]
+
+    if day not in days:
+      days[day] = [0] + [0] * len(METRICS) + list(values) + list(values)
+
+    acc = days[day]
+    acc[0] += 1
+
+    for i, v in enumerate(values):
+      acc[1 + i] += v
+      acc[1 + len(METRICS) + i] = min(acc[1 + len(METRICS) + i], v)
+      acc[1 + 2 * len(METRICS) + i] = max(acc[1 + 2 * len(METRICS) + i], v)
+
+  return [[uid, day] + acc for day, acc in sorted(days.items())]
+
+
+###################################################################
+#
+# action:
+#
+# The (sql, rows, True) action for datatier.perform_transaction,
+# or None if the rollup is turned off.
+#
+def action(uid, rows):
+  if not enabled():
+    return None
+
+  return (UPSERT_SQL, upsert_rows(uid, rows), True)
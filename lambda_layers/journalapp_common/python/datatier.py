@@ -0,0 +1,1046 @@
+#
+# datatier.py
+#
+# Executes SQL queries against a MySQL database.
+#
+# Original author:
+#   Prof. Joe Hummel
+#   Northwestern University
+#
+
+import pymysql
+import pymysql.cursors
+import base64
+import contextlib
+import datetime
+import queue
+import random
+import threading
+import time
+
+
+###################################################################
+#
+# Query hook:
+#
+# If set, hook(func, sql, ms, rows, err) is called after every
+# query run through this module (func is the datatier function
+# name, ms the duration, rows the row count, err the exception
+# or None) and after every commit (with sql None). The lambdas
+# install applog.record_query here to time each query; without
+# a hook, failures are printed as before.
+#
+_query_hook = None
+
+
+def set_query_hook(hook):
+  global _query_hook
+  _query_hook = hook
+
+
+def _report(func, sql, start, rows, err=None):
+  ms = (time.perf_counter() - start) * 1000
+
+  if _query_hook is not None:
+    _query_hook(func, sql, ms, rows, err)
+  elif err is not None:
+    print("datatier." + func + "() failed:")
+    print(str(err))
+
+
+###################################################################
+#
+# get_dbConn:
+#
+# Opens and returns a connection object for interacting with a
+# MySQL database.
+#
+def get_dbConn(endpoint, portnum, username, pwd, dbname):
+  """
+  Opens and returns a connection object for interacting 
+  with a MySQL database
+
+  Parameters
+  ----------
+  endpoint : machine name or IP address of server (string),
+  portnum : server port # (integer),
+  username : user name for login (string),
+  pwd : user password for login (string),
+  dbname : database name (string)
+
+  Returns
+  -------
+  a connection object
+  """
+  try:
+    dbConn = pymysql.connect(host=endpoint,
+                             port=portnum,
+                             user=username,
+                             passwd=pwd,
+                             database=dbname)
+
+    return dbConn
+
+  except Exception as err:
+    _report("get_dbConn", None, time.perf_counter(), 0, err)
+    raise
+
+
+###################################################################
+#
+# Warm-container connection reuse:
+#
+# Lambda keeps the module loaded between invocations of a warm
+# container, so a connection stored at module level survives and
+# can be reused by the next request. This avoids paying the TCP +
+# MySQL authentication handshake on every call, and keeps the
+# number of open connections on the server to one per container.
+#
+# A connection that has been idle longer than PING_INTERVAL
+# seconds (e.g. the container was frozen) is health-checked with
+# a ping before being handed out, and transparently replaced if
+# the server dropped it.
+#
+PING_INTERVAL = 5.0  # seconds
+
+_dbConn = None
+_dbConn_params = None
+_dbConn_last_used = 0.0
+
+
+def _is_alive(dbConn):
+  """
+  Cheap health check: returns True if the server answers a ping
+  """
+  try:
+    dbConn.ping(reconnect=False)
+    return True
+  except Exception:
+    return False
+
+
+def _close_quietly(dbConn):
+  try:
+    dbConn.close()
+  except Exception:
+    pass
+
+
+###################################################################
+#
+# get_cached_dbConn:
+#
+# Returns the module-level connection if one is open for the
+# same parameters and still alive, otherwise opens a new one
+# via get_dbConn. Connections returned from here run with
+# autocommit enabled so that a reused connection never sees a
+# stale read snapshot left over from a previous invocation;
+# perform_action still commits explicitly, which is harmless.
+#
+def get_cached_dbConn(endpoint, portnum, username, pwd, dbname):
+  """
+  Returns a connection object for interacting with a MySQL
+  database, reusing the connection from a previous invocation
+  of this container when possible
+
+  Parameters
+  ----------
+  endpoint : machine name or IP address of server (string),
+  portnum : server port # (integer),
+  username : user name for login (string),
+  pwd : user password for login (string),
+  dbname : database name (string)
+
+  Returns
+  -------
+  a connection object (do not close it, it is owned by datatier)
+  """
+  global _dbConn, _dbConn_params, _dbConn_last_used
+
+  params = (endpoint, portnum, username, pwd, dbname)
+  now = time.monotonic()
+
+  if _dbConn is not None and _dbConn_params == params:
+    if now - _dbConn_last_used < PING_INTERVAL or _is_alive(_dbConn):
+      _dbConn_last_used = now
+      return _dbConn
+
+  #
+  # no usable connection, drop whatever we had and reconnect:
+  #
+  if _dbConn is not None:
+    _close_quietly(_dbConn)
+    _dbConn = None
+
+  dbConn = get_dbConn(endpoint, portnum, username, pwd, dbname)
+  dbConn.autocommit(True)
+
+  _dbConn = dbConn
+  _dbConn_params = params
+  _dbConn_last_used = now
+  return dbConn
+
+
+###################################################################
+#
+# close_cached_dbConn:
+#
+# Closes the module-level connection and RoutingConnection, if
+# any, e.g. after an error that may have broken them.
+#
+def close_cached_dbConn():
+  global _dbConn, _dbConn_params, _router
+
+  if _dbConn is not None:
+    _close_quietly(_dbConn)
+
+  if _router is not None:
+    _router.close()
+
+  _dbConn = None
+  _dbConn_params = None
+  _router = None
+
+
+###################################################################
+#
+# ConnectionPool:
+#
+# A small bounded pool of connections for handlers that need to
+# run queries concurrently (e.g. from a thread pool). At most
+# maxsize connections are ever open; acquire() blocks up to
+# timeout seconds waiting for one to be released. Idle
+# connections are health-checked before being handed out.
+#
+class ConnectionPool:
+  """
+  Bounded pool of MySQL connections
+
+  Parameters
+  ----------
+  endpoint, portnum, username, pwd, dbname : as for get_dbConn,
+  maxsize : maximum # of open connections (integer),
+  timeout : seconds to wait for a free connection (float)
+  """
+
+  def __init__(self, endpoint, portnum, username, pwd, dbname,
+               maxsize=4, timeout=10.0):
+    self._params = (endpoint, portnum, username, pwd, dbname)
+    self._timeout = timeout
+    self._slots = threading.BoundedSemaphore(maxsize)
+    self._idle = queue.LifoQueue()  # most recently used first
+
+  def acquire(self):
+    """
+    Returns an open connection, blocking if the pool is exhausted
+    """
+    if not self._slots.acquire(timeout=self._timeout):
+      raise Exception("datatier.ConnectionPool: no connection available")
+
+    try:
+      while True:
+        try:
+          dbConn = self._idle.get_nowait()
+        except queue.Empty:
+          dbConn = get_dbConn(*self._params)
+          dbConn.autocommit(True)
+          return dbConn
+
+        if _is_alive(dbConn):
+          return dbConn
+
+        _close_quietly(dbConn)
+
+    except Exception:
+      self._slots.release()
+      raise
+
+  def release(self, dbConn, discard=False):
+    """
+    Returns a connection to the pool; pass discard=True if the
+    connection is known to be broken
+    """
+    if discard:
+      _close_quietly(dbConn)
+    else:
+      self._idle.put(dbConn)
+
+    self._slots.release()
+
+  @contextlib.contextmanager
+  def connection(self):
+    """
+    with pool.connection() as dbConn: ... acquires and releases
+    """
+    dbConn = self.acquire()
+    try:
+      yield dbConn
+    except pymysql.err.OperationalError:
+      self.release(dbConn, discard=True)
+      raise
+    except Exception:
+      self.release(dbConn)
+      raise
+    else:
+      self.release(dbConn)
+
+  def close(self):
+    """
+    Closes all idle connections
+    """
+    while True:
+      try:
+        _close_quietly(self._idle.get_nowait())
+      except queue.Empty:
+        break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+###################################################################
+#
+# get_pool:
+#
+# Returns the module-level ConnectionPool, creating it on first
+# use. Like the cached connection, it survives warm invocations.
+#
+def get_pool(endpoint, portnum, username, pwd, dbname, maxsize=4):
+  """
+  Returns a ConnectionPool shared across warm invocations
+
+  Parameters
+  ----------
+  endpoint, portnum, username, pwd, dbname : as for get_dbConn,
+  maxsize : maximum # of open connections (integer)
+
+  Returns
+  -------
+  a ConnectionPool object
+  """
+  global _pool
+
+  with _pool_lock:
+    if _pool is None or _pool._params != (endpoint, portnum, username, pwd, dbname):
+      if _pool is not None:
+        _pool.close()
+      _pool = ConnectionPool(endpoint, portnum, username, pwd, dbname, maxsize=maxsize)
+
+    return _pool
+
+
+###################################################################
+#
+# RoutingConnection:
+#
+# Read/write splitting over a primary and its read replicas.
+# A RoutingConnection can be passed to every function in this
+# module in place of a connection: the retrieve_* functions and
+# stream_rows run on a replica, perform_* on the primary.
+#
+#  - one replica connection is open at a time (like the cached
+#    connection, one per container), to a replica picked at
+#    random, logging in with the read-only credentials;
+#  - read-your-writes: for sticky_seconds after a write, reads
+#    go to the primary as well, so a handler (or the next
+#    request to this container) sees what it just wrote, and
+#    e.g. SELECT LAST_INSERT_ID() runs on the connection that
+#    did the INSERT;
+#  - every check_interval seconds the replica's lag is read
+#    with lag_sql; a replica more than max_lag seconds behind,
+#    or not replicating, is not used for retry_seconds, and
+#    neither is one whose connection or query fails. Reads fall
+#    back to the primary when no replica is usable, and a read
+#    that fails on a replica is retried on the primary.
+#
+# Connections are opened on first use, so an invocation that
+# only reads never connects to the primary.
+#
+class RoutingConnection:
+  """
+  Routes queries between a primary and read replicas
+
+  Parameters
+  ----------
+  primary : (endpoint, portnum, username, pwd, dbname) of the
+            primary, as for get_dbConn,
+  replicas : list of such tuples, one per replica,
+  sticky_seconds : reads go to the primary this long after a
+                   write (float),
+  max_lag : max replication lag in seconds (float),
+  check_interval : seconds between lag checks (float),
+  retry_seconds : how long a failed or lagging replica is
+                  avoided (float),
+  lag_sql : query returning the replica status, with a
+            Seconds_Behind_Source (or _Master) column
+  """
+
+  def __init__(self, primary, replicas, sticky_seconds=5.0, max_lag=5.0,
+               check_interval=5.0, retry_seconds=30.0,
+               lag_sql="SHOW REPLICA STATUS"):
+    self.params = (tuple(primary), tuple(tuple(r) for r in replicas))
+    self._primary_params = tuple(primary)
+    self._replicas = [tuple(r) for r in replicas]
+    self._sticky_seconds = sticky_seconds
+    self._max_lag = max_lag
+    self._check_interval = check_interval
+    self._retry_seconds = retry_seconds
+    self._lag_sql = lag_sql
+
+    self._primary = None
+    self._primary_last_used = 0.0
+    self._replica = None        # (params, connection)
+    self._replica_checked = 0.0
+    self._down_until = {}       # replica params -> monotonic time
+    self._wrote_at = None
+
+  def primary(self):
+    """
+    Returns the connection to the primary, (re)opening it if
+    needed
+    """
+    now = time.monotonic()
+
+    if self._primary is not None:
+      if now - self._primary_last_used < PING_INTERVAL or _is_alive(self._primary):
+        self._primary_last_used = now
+        return self._primary
+      _close_quietly(self._primary)
+      self._primary = None
+
+    dbConn = get_dbConn(*self._primary_params)
+    dbConn.autocommit(True)
+
+    self._primary = dbConn
+    self._primary_last_used = now
+    return dbConn
+
+  def writer(self):
+    """
+    The primary, for a write; reads stick to it for a while
+    """
+    self._wrote_at = time.monotonic()
+    return self.primary()
+
+  def replica(self):
+    """
+    Returns a connection to a usable replica, or None
+    """
+    now = time.monotonic()
+
+    if self._wrote_at is not None and now - self._wrote_at < self._sticky_seconds:
+      return None
+
+    if self._replica is not None:
+      params, dbConn = self._replica
+      if now - self._replica_checked < self._check_interval:
+        return dbConn
+      if self._lag_ok(dbConn):
+        self._replica_checked = now
+        return dbConn
+      self.replica_failed()
+
+    candidates = [r for r in self._replicas if self._down_until.get(r, 0.0) <= now]
+    random.shuffle(candidates)
+
+    for params in candidates:
+      try:
+        dbConn = get_dbConn(*params)
+        dbConn.autocommit(True)
+      except Exception:
+        self._down_until[params] = now + self._retry_seconds
+        continue
+
+      if self._lag_ok(dbConn):
+        self._replica = (params, dbConn)
+        self._replica_checked = now
+        return dbConn
+
+      _close_quietly(dbConn)
+      self._down_until[params] = now + self._retry_seconds
+
+    return None
+
+  def _lag_ok(self, dbConn):
+    """
+    True if the replica answers and is at most max_lag seconds
+    behind; a server that is not a replica (no status row)
+    counts as up to date
+    """
+    start = time.perf_counter()
+
+    try:
+      with dbConn.cursor() as dbCursor:
+        dbCursor.execute(self._lag_sql)
+        row = dbCursor.fetchone()
+        names = [d[0] for d in dbCursor.description or []]
+    except Exception as err:
+      _report("RoutingConnection", self._lag_sql, start, 0, err)
+      return False
+
+    _report("RoutingConnection", self._lag_sql, start, 0 if row is None else 1)
+
+    if row is None:
+      return True
+
+    status = dict(zip(names, row))
+    lag = status.get("Seconds_Behind_Source", status.get("Seconds_Behind_Master"))
+
+    return lag is not None and lag <= self._max_lag
+
+  def replica_failed(self):
+    """
+    Closes the replica connection and avoids that replica for
+    retry_seconds
+    """
+    if self._replica is not None:
+      params, dbConn = self._replica
+      _close_quietly(dbConn)
+      self._down_until[params] = time.monotonic() + self._retry_seconds
+      self._replica = None
+
+  def read(self, fn, *args):
+    """
+    Runs fn(connection, *args) on a replica if one is usable,
+    falling back to the primary if it fails
+    """
+    dbConn = self.replica()
+
+    if dbConn is not None:
+      try:
+        return fn(dbConn, *args)
+      except pymysql.err.OperationalError:
+        self.replica_failed()
+
+    return fn(self.primary(), *args)
+
+  def reader(self):
+    """
+    The connection the next read would use
+    """
+    dbConn = self.replica()
+    return dbConn if dbConn is not None else self.primary()
+
+  def close(self):
+    self.replica_failed()
+    self._down_until.clear()
+
+    if self._primary is not None:
+      _close_quietly(self._primary)
+      self._primary = None
+
+
+_router = None
+
+
+###################################################################
+#
+# get_routing_dbConn:
+#
+# Returns the module-level RoutingConnection for the given
+# primary and replicas, creating it on first use. Like the
+# cached connection, it survives warm invocations, and
+# close_cached_dbConn() closes it.
+#
+def get_routing_dbConn(primary, replicas, **options):
+  """
+  Returns a RoutingConnection shared across warm invocations
+
+  Parameters
+  ----------
+  primary : (endpoint, portnum, username, pwd, dbname),
+  replicas : list of such tuples,
+  options : as for RoutingConnection
+
+  Returns
+  -------
+  a RoutingConnection object (do not close it, it is owned by
+  datatier)
+  """
+  global _router
+
+  params = (tuple(primary), tuple(tuple(r) for r in replicas))
+
+  if _router is None or _router.params != params:
+    if _router is not None:
+      _router.close()
+    _router = RoutingConnection(primary, replicas, **options)
+
+  return _router
+
+
+##################################################################
+#
+# retrieve_one_row:
+#
+# Given a database connection and an SQL Select query,
+# executes this query against the database and returns
+# the first row (tuple) retrieved by the query (the tuple
+# can be empty if the SELECT retrieved no data). The query
+# can be parameterized using %s, in which case pass the
+# values as a list [value1, value2, ...]
+#
+def retrieve_one_row(dbConn, sql, parameters=[]):
+  """
+  Executes an sql SELECT query against the database connection
+  and returns the first row as a tuple
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL SELECT query (can be parameterized with %s),
+  parameters: optional list of values if parameterized
+
+  Returns
+  _______
+  First row as a tuple, or () if SELECT retrieves no data
+  """
+
+  if isinstance(dbConn, RoutingConnection):
+    return dbConn.read(retrieve_one_row, sql, parameters)
+
+  dbCursor = dbConn.cursor()
+  start = time.perf_counter()
+
+  try:
+    dbCursor.execute(sql, parameters)
+    row = dbCursor.fetchone()
+    _report("retrieve_one_row", sql, start, 0 if row is None else 1)
+    if row is None:  # executed successfully, but no data was retrieved
+      return ()
+    else:
+      return row
+
+  except Exception as err:
+    _report("retrieve_one_row", sql, start, 0, err)
+    raise
+
+  finally:
+    dbCursor.close()
+
+
+##################################################################
+#
+# retrieve_all_rows:
+#
+# Given a database connection and an SQL Select query,
+# executes this query against the database and returns
+# a list of rows (tuples) retrieved by the query. If the
+# query retrieves no data, the empty list [] is returned.
+# The query can be parameterized using %s, in which case
+# pass the values as a list [value1, value2, ...]
+#
+def retrieve_all_rows(dbConn, sql, parameters=[]):
+  """
+  Executes an sql SELECT query against the database connection
+  and returns all rows as a list of tuples
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL SELECT query (can be parameterized with %s),
+  parameters: optional list of values if parameterized
+
+  Returns
+  _______
+  All rows as a list of tuples, or [] if SELECT retrieves no
+  data
+  """
+
+  if isinstance(dbConn, RoutingConnection):
+    return dbConn.read(retrieve_all_rows, sql, parameters)
+
+  dbCursor = dbConn.cursor()
+  start = time.perf_counter()
+
+  try:
+    dbCursor.execute(sql, parameters)
+    rows = dbCursor.fetchall()
+    _report("retrieve_all_rows", sql, start, 0 if rows is None else len(rows))
+    if rows is None:  # executed successfully, but no data was retrieved
+      return []
+    else:
+      return rows
+
+  except Exception as err:
+    _report("retrieve_all_rows", sql, start, 0, err)
+    raise
+
+  finally:
+    dbCursor.close()
+
+
+##################################################################
+#
+# stream_rows:
+#
+# Given a database connection and an SQL Select query, returns
+# a generator that yields the rows (tuples) one at a time. The
+# query runs on a server-side (unbuffered) cursor and rows are
+# pulled fetch_size at a time, so memory use is bounded no
+# matter how many rows the query retrieves. The query can be
+# parameterized using %s, in which case pass the values as a
+# list [value1, value2, ...]
+#
+# NOTE: the connection cannot run any other query until the
+# generator is exhausted or closed (e.g. leave the for loop or
+# call .close() on the generator).
+#
+def stream_rows(dbConn, sql, parameters=[], fetch_size=1000):
+  """
+  Executes an sql SELECT query against the database connection
+  and yields the rows as tuples, fetching them in chunks
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL SELECT query (can be parameterized with %s),
+  parameters: optional list of values if parameterized,
+  fetch_size: # of rows to pull from the server at a time
+
+  Returns
+  _______
+  A generator of tuples (yields nothing if SELECT retrieves
+  no data)
+  """
+
+  if isinstance(dbConn, RoutingConnection):
+    # no fallback once rows have been yielded:
+    dbConn = dbConn.reader()
+
+  dbCursor = dbConn.cursor(pymysql.cursors.SSCursor)
+  start = time.perf_counter()
+  nrows = 0
+
+  try:
+    dbCursor.execute(sql, parameters)
+
+    while True:
+      rows = dbCursor.fetchmany(fetch_size)
+      if not rows:
+        break
+      nrows += len(rows)
+      for row in rows:
+        yield row
+
+    # the time reported includes the caller's processing
+    # between chunks, since the rows are consumed lazily:
+    _report("stream_rows", sql, start, nrows)
+
+  except Exception as err:
+    _report("stream_rows", sql, start, nrows, err)
+    raise
+
+  finally:
+    # closing an unbuffered cursor drains any unread rows:
+    dbCursor.close()
+
+
+##################################################################
+#
+# retrieve_page:
+#
+# Keyset ("seek") pagination over a per-user table such as
+# entries or images. Returns the page_size rows for uid that
+# come after the key after = (date, id) in (date, id) order,
+# plus the key to pass for the next page (None on the last
+# page). Each page is an index range scan on (uid, date), so
+# page N costs the same as page 1, unlike LIMIT/OFFSET.
+#
+# table, columns and id_column are interpolated into the SQL,
+# so they must come from code, never from the request.
+#
+def retrieve_page(dbConn, table, columns, uid, after=None,
+                  page_size=100, id_column="entryid"):
+  """
+  Retrieves one page of a user's rows ordered by (date, id)
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  table : table name, e.g. "entries" (string),
+  columns : list of column names to select,
+  uid : the user id,
+  after : (date, id) of the last row of the previous page, or
+          None for the first page,
+  page_size : max # of rows to return,
+  id_column : the table's primary key column (string)
+
+  Returns
+  _______
+  (rows, next_after) where rows is a list of tuples of the
+  requested columns, and next_after is the key for the next
+  page or None if there are no more rows
+  """
+
+  sql = "SELECT " + ", ".join(list(columns) + ["date", id_column]) \
+      + " FROM " + table + " WHERE uid = %s"
+  parameters = [uid]
+
+  if after is not None:
+    sql += " AND (date > %s OR (date = %s AND " + id_column + " > %s))"
+    parameters += [after[0], after[0], after[1]]
+
+  sql += " ORDER BY date, " + id_column + " LIMIT %s"
+  parameters.append(page_size + 1)  # one extra to detect the last page
+
+  rows = list(retrieve_all_rows(dbConn, sql, parameters))
+
+  next_after = None
+  if len(rows) > page_size:
+    rows = rows[:page_size]
+    next_after = (rows[-1][-2], rows[-1][-1])
+
+  return [row[:-2] for row in rows], next_after
+
+
+#
+# encode_page_key / decode_page_key:
+#
+# Convert a (date, id) page key to and from an opaque string
+# that can be handed to API clients as a "next page" token.
+#
+def encode_page_key(after):
+  if after is None:
+    return None
+
+  date, rowid = after
+  text = date.strftime('%Y-%m-%d %H:%M:%S') + "|" + str(rowid)
+  return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+def decode_page_key(token):
+  if token is None or token == "":
+    return None
+
+  try:
+    text = base64.urlsafe_b64decode(token.encode()).decode()
+    date, rowid = text.split("|")
+    return (datetime.datetime.strptime(date, '%Y-%m-%d %H:%M:%S'), int(rowid))
+  except Exception:
+    raise ValueError("invalid page token")
+
+
+###############################################################
+#
+# perform_action:
+#
+# Given a database connection and an SQL action query,
+# executes an ACTION query and returns the number of rows
+# modified; a return value of 0 means no rows were
+# modified. Action queries are typically "insert",
+# "update", "delete". The query can be parameterized
+# using %s, in which case pass the values as a list
+# [value1, value2, ...]
+#
+def perform_action(dbConn, sql, parameters=[]):
+  """
+  Executes an sql ACTION query against the database connection
+  and returns number of rows modified
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL SELECT query (can be parameterized with %s),
+  parameters: optional list of values if parameterized
+
+  Returns
+  _______
+  number of rows modified (0 is not an error but implies
+  the query made no modifications)
+  """
+
+  if isinstance(dbConn, RoutingConnection):
+    dbConn = dbConn.writer()
+
+  dbCursor = dbConn.cursor()
+  start = time.perf_counter()
+
+  try:
+    # try to execute, and if successful commit the changes
+    # and return the # of rows modified by the query:
+    dbCursor.execute(sql, parameters)
+    _report("perform_action", sql, start, dbCursor.rowcount)
+
+    start = time.perf_counter()
+    dbConn.commit()
+    _report("perform_action", None, start, 0)
+
+    return dbCursor.rowcount
+
+  except Exception as err:
+    # failed, rollback any possible changes and log error:
+    dbConn.rollback()
+    _report("perform_action", sql, start, 0, err)
+    raise
+
+  finally:
+    dbCursor.close()
+
+
+###############################################################
+#
+# perform_batch_action:
+#
+# Given a database connection, an SQL action query and a list
+# of parameter lists, executes the query once per parameter
+# list inside a single transaction, and returns the total
+# number of rows modified. For an "INSERT ... VALUES(%s, ...)"
+# query pymysql rewrites this into multi-row INSERTs, so N rows
+# cost a handful of round trips instead of N. Either every row
+# is written or, on failure, none are.
+#
+def perform_batch_action(dbConn, sql, rows):
+  """
+  Executes an sql ACTION query once for each parameter list in
+  rows, in one transaction, and returns number of rows modified
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  sql : the SQL ACTION query (parameterized with %s),
+  rows: list of parameter lists, one per row
+
+  Returns
+  _______
+  number of rows modified (0 if rows is empty)
+  """
+
+  if isinstance(dbConn, RoutingConnection):
+    dbConn = dbConn.writer()
+
+  if len(rows) == 0:
+    return 0
+
+  dbCursor = dbConn.cursor()
+  start = time.perf_counter()
+
+  try:
+    # explicit transaction, since the connection may be in
+    # autocommit mode and executemany may send several
+    # statements for large batches:
+    dbConn.begin()
+    dbCursor.executemany(sql, rows)
+    _report("perform_batch_action", sql, start, dbCursor.rowcount)
+
+    start = time.perf_counter()
+    dbConn.commit()
+    _report("perform_batch_action", None, start, 0)
+
+    return dbCursor.rowcount
+
+  except Exception as err:
+    # failed, rollback the whole batch and log error:
+    dbConn.rollback()
+    _report("perform_batch_action", sql, start, 0, err)
+    raise
+
+  finally:
+    dbCursor.close()
+
+
+###############################################################
+#
+# perform_transaction:
+#
+# Given a database connection and a list of ACTION queries,
+# executes them in order inside a single transaction and
+# returns the list of rows modified by each. Each action is a
+# tuple (sql, parameters), or (sql, rows, True) to execute sql
+# once per parameter list in rows as in perform_batch_action.
+# If any query fails, all of them are rolled back.
+#
+# With lastrowid=True it also returns the AUTO_INCREMENT id
+# generated by the last action, so that a handler can find the
+# row it inserted without a SELECT LAST_INSERT_ID(), which a
+# RoutingConnection might send to a replica.
+#
+def perform_transaction(dbConn, actions, lastrowid=False):
+  """
+  Executes several sql ACTION queries in one transaction and
+  returns the number of rows modified by each
+
+  Parameters
+  __________
+  dbConn : the database connection, 
+  actions : list of (sql, parameters) or (sql, rows, True)
+  lastrowid : also return the id generated by the last action
+
+  Returns
+  _______
+  list with the number of rows modified by each action, or
+  (that list, id generated by the last action) if lastrowid
+  """
+
+  if isinstance(dbConn, RoutingConnection):
+    dbConn = dbConn.writer()
+
+  dbCursor = dbConn.cursor()
+  sql = None
+  start = time.perf_counter()
+
+  try:
+    dbConn.begin()
+
+    counts = []
+    for action in actions:
+      sql = action[0]
+      start = time.perf_counter()
+      if len(action) == 3 and action[2]:
+        dbCursor.executemany(sql, action[1])
+      else:
+        dbCursor.execute(sql, action[1])
+      _report("perform_transaction", sql, start, dbCursor.rowcount)
+      counts.append(dbCursor.rowcount)
+
+    sql = None
+    start = time.perf_counter()
+    dbConn.commit()
+    _report("perform_transaction", None, start, 0)
+
+    if lastrowid:
+      return counts, dbCursor.lastrowid
+
+    return counts
+
+  except Exception as err:
+    # failed, rollback everything and log error:
+    dbConn.rollback()
+    _report("perform_transaction", sql, start, 0, err)
+    raise
+
+  finally:
+    dbCursor.close()
+
+
+###############################################################
+#
+# is_foreign_key_violation:
+#
+# True if err is MySQL error 1452, "cannot add or update a
+# child row: a foreign key constraint fails", e.g. an INSERT
+# into entries for a uid that is not in users. Lets a handler
+# rely on the foreign key instead of checking with a SELECT
+# first.
+#
+FOREIGN_KEY_VIOLATION = 1452
+
+def is_foreign_key_violation(err):
+  return isinstance(err, pymysql.err.IntegrityError) \
+    and len(err.args) > 0 and err.args[0] == FOREIGN_KEY_VIOLATION
+
+
+###############################################################
+#
+# is_duplicate_key:
+#
+# True if err is MySQL error 1062, "duplicate entry ... for
+# key", i.e. a UNIQUE key such as entries (uid, date) rejected
+# the row.
+#
+DUPLICATE_KEY = 1062
+
+def is_duplicate_key(err):
+  return isinstance(err, pymysql.err.IntegrityError) \
+    and len(err.args) > 0 and err.args[0] == DUPLICATE_KEY
@@ -0,0 +1,213 @@
+#
+# entryexport.py
+#
+# Bulk export of journal entries, one user's or everyone's, as a
+# compressed columnar file written straight to S3: Parquet
+# (zstd) when pyarrow is available, else gzipped CSV. Used by
+# the journal_export lambda and analytics/export_entries.py.
+#
+# Memory stays bounded whatever the number of entries:
+#
+#  - rows are streamed from MySQL with datatier.stream_rows
+#    (unbuffered cursor) and handled BATCH rows at a time; for
+#    Parquet each batch becomes one row group;
+#  - the file is never assembled in memory or on disk: it is
+#    written to an S3MultipartWriter, which uploads a part each
+#    time PART_BYTES have been written.
+#
+# So at any moment we hold at most one batch of rows and one
+# part, about PART_BYTES + BATCH rows.
+#
+# The S3 client is passed in, so anything with boto3's
+# multipart calls works, e.g. benchmarks/local_s3.LocalS3.
+#
+
+import csv
+import gzip
+import io
+
+import datatier
+
+COLUMNS = ["uid", "entryid", "date", "notes", "sleep", "eat", "water", "social", "overall"]
+
+BATCH = 50000
+PART_BYTES = 8 * 1024 * 1024  # S3's minimum part size is 5 MB
+
+FORMATS = {
+  "parquet": (".parquet", "application/vnd.apache.parquet"),
+  "csv": (".csv.gz", "text/csv"),
+}
+
+USER_SQL = "SELECT " + ", ".join(COLUMNS) + " FROM entries WHERE uid = %s ORDER BY date"
+ALL_SQL = "SELECT " + ", ".join(COLUMNS) + " FROM entries ORDER BY entryid"
+
+
+###################################################################
+#
+# S3MultipartWriter:
+#
+# A write-only file object whose contents go to an S3 object
+# through a multipart upload, PART_BYTES at a time. close()
+# completes the upload; leaving a with block by an exception
+# aborts it, so S3 does not keep the parts.
+#
+class S3MultipartWriter(io.RawIOBase):
+  def __init__(self, s3, bucket, key, content_type=None, part_bytes=PART_BYTES):
+    self.s3 = s3
+    self.bucket = bucket
+    self.key = key
+    self.part_bytes = part_bytes
+    self.parts = []
+    self.bytes_written = 0
+    self._buffer = bytearray()
+
+    extra = {"ContentType": content_type} if content_type else {}
+    self.upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key, **extra)["UploadId"]
+
+  def writable(self):
+    return True
+
+  def write(self, data):
+    self._buffer += data
+    self.bytes_written += len(data)
+
+    while len(self._buffer) >= self.part_bytes:
+      self._upload_part(bytes(self._buffer[:self.part_bytes]))
+      del self._buffer[:self.part_bytes]
+
+    return len(data)
+
+  def tell(self):
+    return self.bytes_written
+
+  def _upload_part(self, data):
+    number = len(self.parts) + 1
+    result = self.s3.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                 PartNumber=number, Body=data)
+    self.parts.append({"PartNumber": number, "ETag": result["ETag"]})
+
+  def close(self):
+    if self.closed:
+      return
+
+    if self._buffer or not self.parts:  # the last part may be small
+      self._upload_part(bytes(self._buffer))
+      self._buffer = bytearray()
+
+    self.s3.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                      MultipartUpload={"Parts": self.parts})
+    super().close()
+
+  def abort(self):
+    if self.closed:
+      return
+
+    self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+    self._buffer = bytearray()
+    super().close()
+
+  def __exit__(self, exc_type, exc, tb):
+    if exc_type is not None:
+      self.abort()
+    else:
+      self.close()
+
+
+###################################################################
+#
+# default_format:
+#
+# "parquet" if pyarrow can be imported, else "csv".
+#
+def default_format():
+  try:
+    import pyarrow.parquet  # noqa: F401
+    return "parquet"
+  except ImportError:
+    return "csv"
+
+
+def _batches(rows):
+  batch = []
+  for row in rows:
+    batch.append(row)
+    if len(batch) == BATCH:
+      yield batch
+      batch = []
+  if batch:
+    yield batch
+
+
+def _write_parquet(batches, out):
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+
+  schema = pa.schema([
+    ("uid", pa.int32()), ("entryid", pa.int32()), ("date", pa.timestamp("s")),
+    ("notes", pa.string()),
+  ] + [(m, pa.int8()) for m in COLUMNS[4:]])
+
+  with pq.ParquetWriter(out, schema, compression="zstd") as writer:
+    for batch in batches:
+      columns = list(zip(*batch))
+      writer.write_batch(pa.record_batch(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+        schema=schema))
+
+
+def _write_csv(batches, out):
+  with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=6) as gz:
+    text = io.TextIOWrapper(gz, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(COLUMNS)
+
+    for batch in batches:
+      writer.writerows(batch)  # str(datetime) is YYYY-MM-DD hh:mm:ss
+
+    text.flush()
+    text.detach()  # leave closing gz to the with
+
+
+###################################################################
+#
+# export_entries:
+#
+def export_entries(dbConn, s3, bucket, key, uid=None, fmt=None):
+  """
+  Streams entries into a compressed columnar file at bucket/key
+
+  Parameters
+  ----------
+  dbConn : the database connection,
+  s3 : S3 client (anything with the multipart upload calls),
+  bucket, key : where to write the file (strings),
+  uid : the user whose entries to export, or None for all,
+  fmt : "parquet", "csv" or None for default_format()
+
+  Returns
+  -------
+  dict with the format, # of rows and # of bytes written
+  """
+  fmt = fmt or default_format()
+  if fmt not in FORMATS:
+    raise ValueError("unknown export format " + str(fmt))
+
+  if uid is None:
+    rows = datatier.stream_rows(dbConn, ALL_SQL, [], fetch_size=5000)
+  else:
+    rows = datatier.stream_rows(dbConn, USER_SQL, [uid], fetch_size=5000)
+
+  count = 0
+
+  def batches():
+    nonlocal count
+    for batch in _batches(rows):
+      count += len(batch)
+      yield batch
+
+  write = _write_parquet if fmt == "parquet" else _write_csv
+
+  with S3MultipartWriter(s3, bucket, key, content_type=FORMATS[fmt][1]) as out:
+    write(batches(), out)
+
+  return {"format": fmt, "rows": count, "bytes": out.bytes_written}
@@ -0,0 +1,218 @@
+#
+# entryqueue.py
+#
+# The queue behind journal_upload's asynchronous (write-behind)
+# mode. journal_upload validates entries and sends them here
+# instead of writing to RDS; the journal_upload_consumer lambda
+# drains the queue in batches.
+#
+# A message body is JSON:
+#   {"uid": "80001", "requestid": "<idempotency key>",
+#    "entry": {"date": ..., "notes": ..., "sleep": ..., ...}}
+#
+# Two implementations with the same interface:
+#
+#   SQSQueue   : Amazon SQS (or anything SQS-compatible at
+#                [queue] endpoint_url); the consumer lambda is
+#                triggered by the queue's event source mapping.
+#   LocalQueue : an in-memory queue, or a directory of message
+#                files if a path is given, for local testing;
+#                drain() feeds it to a consumer handler in
+#                SQS-shaped events.
+#
+# Settings ([queue] section, or JOURNALAPP_QUEUE_* env vars):
+#   backend     sqs (default) or local
+#   url         the SQS queue URL
+#   dlq_url     the dead-letter queue URL (optional)
+#   local_path, dlq_local_path
+#               directories for file-backed LocalQueues,
+#               else they are in memory
+#
+
+import json
+import os
+import threading
+import time
+import uuid
+
+import config
+
+SQS_BATCH = 10  # max messages per SendMessageBatch
+
+
+class SQSQueue:
+  def __init__(self, url, client=None):
+    self.url = url
+    self._client = client
+
+  def client(self):
+    if self._client is None:
+      import boto3
+
+      endpoint_url = config.get('queue', 'endpoint_url', fallback='')
+      self._client = boto3.client('sqs', endpoint_url=endpoint_url or None)
+
+    return self._client
+
+  def send(self, bodies):
+    """
+    Sends a list of message bodies (dicts); returns their ids
+    """
+    ids = []
+
+    for lo in range(0, len(bodies), SQS_BATCH):
+      chunk = bodies[lo:lo + SQS_BATCH]
+      entries = [{"Id": str(i), "MessageBody": json.dumps(body)} for i, body in enumerate(chunk)]
+
+      result = self.client().send_message_batch(QueueUrl=self.url, Entries=entries)
+
+      if result.get("Failed"):
+        raise Exception("entryqueue: failed to send " + str(len(result["Failed"])) + " messages")
+
+      ids += [msg["MessageId"] for msg in sorted(result["Successful"], key=lambda m: int(m["Id"]))]
+
+    return ids
+
+
+class LocalQueue:
+  def __init__(self, path=None):
+    self.path = path
+    self._lock = threading.Lock()
+    self._messages = []  # (id, body text), in memory mode
+
+    if path is not None:
+      os.makedirs(path, exist_ok=True)
+
+  def send(self, bodies):
+    ids = []
+
+    with self._lock:
+      for body in bodies:
+        msgid = str(uuid.uuid4())
+        text = json.dumps(body)
+
+        if self.path is None:
+          self._messages.append((msgid, text))
+        else:
+          # name files so that listing them sorts in send order:
+          name = "%020d-%s.json" % (time.time_ns(), msgid)
+          with open(os.path.join(self.path, name), "w") as f:
+            f.write(text)
+
+        ids.append(msgid)
+
+    return ids
+
+  def receive(self, max_messages=10):
+    """
+    Returns up to max_messages (id, body text) pairs, oldest
+    first, without removing them
+    """
+    with self._lock:
+      if self.path is None:
+        return list(self._messages[:max_messages])
+
+      received = []
+      for name in sorted(os.listdir(self.path))[:max_messages]:
+        with open(os.path.join(self.path, name)) as f:
+          received.append((name.split("-", 1)[1][:-len(".json")], f.read()))
+
+      return received
+
+  def delete(self, ids):
+    ids = set(ids)
+
+    with self._lock:
+      if self.path is None:
+        self._messages = [m for m in self._messages if m[0] not in ids]
+        return
+
+      for name in os.listdir(self.path):
+        if name.split("-", 1)[1][:-len(".json")] in ids:
+          os.remove(os.path.join(self.path, name))
+
+  def __len__(self):
+    if self.path is None:
+      return len(self._messages)
+    return len(os.listdir(self.path))
+
+  def drain(self, handler, batch_size=10):
+    """
+    Feeds all messages to handler(event, context) in SQS-shaped
+    events, deleting the ones it does not report as failed.
+    Returns (# processed, # failed); stops when a batch makes
+    no progress.
+    """
+    processed = failed = 0
+
+    while True:
+      received = self.receive(batch_size)
+      if not received:
+        break
+
+      event = {"Records": [{"messageId": msgid, "body": text, "eventSource": "local"}
+                           for (msgid, text) in received]}
+
+      result = handler(event, None) or {}
+      failures = {f["itemIdentifier"] for f in result.get("batchItemFailures", [])}
+
+      self.delete([msgid for (msgid, text) in received if msgid not in failures])
+
+      processed += len(received) - len(failures)
+      failed += len(failures)
+
+      if len(failures) == len(received):
+        break
+
+    return processed, failed
+
+
+_queues = {}
+
+
+###################################################################
+#
+# get_queue / get_dead_letter_queue:
+#
+# The configured queues, created once per container. The
+# dead-letter queue is optional: without one, get_dead_letter_queue
+# returns None and the consumer leaves bad messages to the
+# queue's own redrive policy.
+#
+def get_queue():
+  if 'queue' not in _queues:
+    _queues['queue'] = _configured('url', 'local_path', required=True)
+
+  return _queues['queue']
+
+
+def get_dead_letter_queue():
+  if 'dlq' not in _queues:
+    _queues['dlq'] = _configured('dlq_url', 'dlq_local_path', required=False)
+
+  return _queues['dlq']
+
+
+def _configured(url_option, path_option, required):
+  backend = config.get('queue', 'backend', fallback='sqs')
+
+  if backend == 'local':
+    path = config.get('queue', path_option, fallback='')
+    return LocalQueue(path or None)
+
+  if backend != 'sqs':
+    raise ValueError("entryqueue: unknown [queue] backend " + backend)
+
+  if required:
+    return SQSQueue(config.get('queue', url_option))
+
+  url = config.get('queue', url_option, fallback='')
+  return SQSQueue(url) if url else None
+
+
+def set_queues(queue, dead_letter_queue=None):
+  """
+  Replaces the configured queues, e.g. with LocalQueues in tests
+  """
+  _queues['queue'] = queue
+  _queues['dlq'] = dead_letter_queue
@@ -0,0 +1,179 @@
+#
+# handler.py
+#
+# The @lambda_entry decorator wraps each lambda's handler with
+# the steps every one of them used to repeat:
+#
+#  - load settings (once per container, see config.py),
+#  - get the warm-container database connection (a
+#    RoutingConnection if read replicas are configured),
+#  - time the invocation and write its single structured log
+#    line (see applog.py),
+#  - map errors to responses: BadRequest => 400, anything else
+#    => 500 (or re-raise, for event-triggered lambdas that
+#    should be retried).
+#
+# The wrapped function is called as fn(event, context, dbConn)
+# and returns the response dict, e.g. built with response().
+#
+
+import functools
+import json
+import time
+
+import pymysql
+
+import applog
+import config
+import datatier
+
+from validation import BadRequest
+
+#
+# time every datatier query in the invocation's log line:
+#
+datatier.set_query_hook(applog.record_query)
+
+
+###################################################################
+#
+# response:
+#
+# An API Gateway style response with a JSON body.
+#
+def response(statusCode, body):
+  return {
+    'statusCode': statusCode,
+    'body': json.dumps(body)
+  }
+
+
+###################################################################
+#
+# Known-user cache:
+#
+# uids that were recently seen to exist, with the time until
+# which we trust that, kept while the container is warm. Users
+# are never deleted by the app, so a stale entry can at worst
+# let a write reach the database, where the uid foreign key
+# still rejects it. The TTL is [cache] user_ttl seconds.
+#
+MAX_KNOWN_USERS = 10000
+
+_known_users = {}
+
+
+def _user_ttl():
+  return float(config.get('cache', 'user_ttl', fallback='300'))
+
+
+def remember_user(uid):
+  """
+  Records that uid exists
+  """
+  if len(_known_users) >= MAX_KNOWN_USERS:
+    _known_users.clear()
+
+  _known_users[str(uid)] = time.monotonic() + _user_ttl()
+
+
+def forget_user(uid):
+  _known_users.pop(str(uid), None)
+
+
+def is_known_user(uid):
+  """
+  True if uid was seen to exist within the TTL
+  """
+  expires = _known_users.get(str(uid))
+  return expires is not None and expires > time.monotonic()
+
+
+###################################################################
+#
+# require_user:
+#
+# Raises BadRequest("no such user...") unless uid exists,
+# consulting the known-user cache before the database.
+#
+def require_user(dbConn, uid):
+  if is_known_user(uid):
+    return
+
+  row = datatier.retrieve_one_row(dbConn, "SELECT uid FROM users WHERE uid = %s;", [uid])
+
+  if row == ():
+    raise BadRequest("no such user...")
+
+  remember_user(uid)
+
+
+###################################################################
+#
+# lambda_entry:
+#
+def lambda_entry(name, db=True, raise_errors=False):
+  """
+  Decorator for a lambda's handler function
+
+  Parameters
+  ----------
+  name : the lambda's name, for the logs (string),
+  db : open (or reuse) the database connection (boolean),
+  raise_errors : re-raise unexpected errors instead of
+                 returning a 500 response (boolean)
+
+  Returns
+  -------
+  a decorator producing lambda_handler(event, context)
+  """
+  def decorate(fn):
+    @functools.wraps(fn)
+    def lambda_handler(event, context):
+      applog.begin(name, context)
+      status = None
+
+      try:
+        dbConn = None
+        if db:
+          with applog.stage("config"):
+            rds = config.rds_settings()
+            replicas = config.replica_settings()
+          with applog.stage("connect"):
+            if replicas:
+              # connections open on first query, see datatier:
+              dbConn = datatier.get_routing_dbConn(rds, replicas, **config.routing_options())
+            else:
+              dbConn = datatier.get_cached_dbConn(*rds)
+
+        result = fn(event, context, dbConn)
+        status = result.get("statusCode", 200) if isinstance(result, dict) else 200
+        return result
+
+      except BadRequest as err:
+        status = 400
+        applog.info("bad request", error=str(err))
+        return response(400, str(err))
+
+      except Exception as err:
+        status = 500
+        applog.error("unhandled error", error=str(err), type=type(err).__name__)
+
+        #
+        # a lost connection should not be reused by the next
+        # invocation of this container:
+        #
+        if isinstance(err, pymysql.err.OperationalError):
+          datatier.close_cached_dbConn()
+
+        if raise_errors:
+          raise
+
+        return response(500, str(err))
+
+      finally:
+        applog.finish(status)
+
+    return lambda_handler
+
+  return decorate
@@ -0,0 +1,151 @@
+#
+# idempotency.py
+#
+# Idempotency keys for the upload lambdas, so that a client can
+# retry a request that timed out without writing twice.
+#
+# The client sends a key with the request, in an
+# "Idempotency-Key" header or as "request_id" in a JSON object
+# body. The handler computes its response before writing, and
+# adds record(...) as the FIRST action of its write transaction:
+# a row in idempotency_keys holding that response, keyed by
+# (uid, endpoint, key). A retry then fails the transaction on
+# the primary key before any other write, and the handler
+# returns the stored response with replay(...) instead -- also
+# when two copies of a request race, since only one INSERT can
+# win. So a first request costs one more INSERT in a
+# transaction it makes anyway, not an extra round trip.
+#
+# Responses are also remembered while the container is warm, so
+# most retries are answered without touching the database.
+#
+# Keys are meant to be random (uuids); they are not expired.
+#
+
+import collections
+import json
+
+import datatier
+
+from validation import BadRequest, header, string
+
+MAX_KEY = 64
+MAX_REMEMBERED = 4096
+
+REPLAY_HEADERS = {"Idempotent-Replayed": "true"}
+
+INSERT_SQL = """
+  INSERT INTO idempotency_keys(uid, endpoint, requestid, status, response, created)
+                       VALUES(%s, %s, %s, %s, %s, NOW());
+"""
+
+SELECT_SQL = """
+  SELECT status, response FROM idempotency_keys
+  WHERE uid = %s AND endpoint = %s AND requestid = %s;
+"""
+
+_check_key = string(MAX_KEY)
+
+_remembered = collections.OrderedDict()  # (uid, endpoint, key) -> (status, body)
+
+
+###################################################################
+#
+# request_key:
+#
+# Returns the request's idempotency key, or None if it has none.
+# Raises BadRequest if the key is malformed.
+#
+def request_key(event, body=None):
+  key = header(event, "idempotency-key")
+
+  if key is None and isinstance(body, dict):
+    key = body.get("request_id")
+
+  if key is None:
+    return None
+
+  key, error = _check_key(key)
+  if error is None and len(key) == 0:
+    error = "must not be empty"
+  if error is not None:
+    raise BadRequest("idempotency key " + error)
+
+  return key
+
+
+###################################################################
+#
+# record:
+#
+# The (sql, parameters) action storing result, the response
+# dict the handler is about to return, under the key.
+#
+def record(uid, endpoint, key, result):
+  return (INSERT_SQL, [uid, endpoint, key, result["statusCode"], result["body"]])
+
+
+###################################################################
+#
+# remember / remembered:
+#
+# The warm-container copy of stored responses.
+#
+def remember(uid, endpoint, key, result):
+  _remembered[(str(uid), endpoint, key)] = (result["statusCode"], result["body"])
+  _remembered.move_to_end((str(uid), endpoint, key))
+
+  while len(_remembered) > MAX_REMEMBERED:
+    _remembered.popitem(last=False)
+
+
+def remembered(uid, endpoint, key):
+  """
+  Returns (status, body) stored for the key in this container,
+  or None
+  """
+  return _remembered.get((str(uid), endpoint, key))
+
+
+###################################################################
+#
+# lookup:
+#
+# Returns (status, body) stored for the key, or None.
+#
+def lookup(dbConn, uid, endpoint, key):
+  stored = remembered(uid, endpoint, key)
+  if stored is not None:
+    return stored
+
+  row = datatier.retrieve_one_row(dbConn, SELECT_SQL, [uid, endpoint, key])
+  if row == () or row is None:
+    return None
+
+  remember(uid, endpoint, key, {"statusCode": row[0], "body": row[1]})
+
+  return (row[0], row[1])
+
+
+###################################################################
+#
+# replay:
+#
+# The response for a repeated request: the stored one, marked
+# with an Idempotent-Replayed header.
+#
+def replay(stored):
+  status, body = stored
+
+  return {
+    'statusCode': status,
+    'headers': dict(REPLAY_HEADERS),
+    'body': body
+  }
+
+
+def replay_json(stored):
+  """
+  The stored body as parsed JSON
+  """
+  return json.loads(stored[1])
@@ -0,0 +1,143 @@
+#
+# imageblobs.py
+#
+# Content-addressed image storage. When the client sends the
+# SHA-256 of the file with its upload request, the image is
+# stored once per user and distinct content as a blob: an
+# image_blobs row, keyed by (uid, hash), that owns the S3 object
+# and counts the images rows referencing it. Uploading a photo
+# the user has already stored (a re-sync from the phone, the
+# same picture on two days) then only inserts an images row
+# pointing at the existing object and bumps the count; the
+# client is told there is nothing to upload.
+#
+# Blobs are never shared between users: a hash is not proof of
+# having the file, so a client that only knows the hash of
+# another user's photo must not get that photo attached to its
+# own images.
+#
+# Life of a blob:
+#
+#  - reserve: journal_upload_image upserts the blob (new:
+#    'pending', refcount 1; existing: refcount + 1) and inserts
+#    the images row with the blob's key and status, in one
+#    transaction;
+#  - verify: journal_upload_image_finalize hashes the object S3
+#    received and only marks the blob and its images rows
+#    'uploaded' if it matches, so a client cannot store other
+#    content under a hash;
+#  - release: journal_delete_image deletes the images row and
+#    decrements the count in one transaction; whoever takes it
+#    to 0 deletes the blob row and then its objects.
+#
+# Blob keys are images/blobs/<uid>/<sha256>/<uuid><ext>: the uuid
+# makes each incarnation of a blob a different object, so a
+# delete that is cleaning up the previous incarnation can never
+# remove the object of one that was uploaded again since.
+#
+# Images uploaded without a hash (and those uploaded before
+# migration 010) keep their own object as before, with a NULL
+# images.sha256.
+#
+
+import hashlib
+import uuid
+
+PREFIX = "images/blobs/"
+CHUNK = 1024 * 1024
+
+RESERVE_SQL = """
+  INSERT INTO image_blobs(uid, sha256, bucketkey, status, refcount)
+       VALUES(%s, %s, %s, 'pending', 1)
+  ON DUPLICATE KEY UPDATE refcount = refcount + 1;
+"""
+
+#
+# the images row takes the blob's key, status and size, so a
+# duplicate of an uploaded blob is uploaded right away:
+#
+INSERT_IMAGE_SQL = """
+  INSERT INTO images(uid, date, bucketkey, status, size, sha256)
+       SELECT %s, %s, bucketkey, status, size, sha256
+         FROM image_blobs WHERE uid = %s AND sha256 = %s;
+"""
+
+
+def blob_key(uid, sha256, ext):
+  return PREFIX + str(uid) + "/" + sha256 + "/" + str(uuid.uuid4()) + ext
+
+
+def is_blob_key(bucketkey):
+  return bucketkey.startswith(PREFIX)
+
+
+###################################################################
+#
+# reserve_actions:
+#
+# The transaction actions that add an images row for uid at
+# date with the given content hash, using uid's blob of that
+# content; bucketkey (from blob_key) is used if the blob is new.
+#
+def reserve_actions(uid, date, sha256, bucketkey):
+  return [
+    (RESERVE_SQL, [uid, sha256, bucketkey]),
+    (INSERT_IMAGE_SQL, [uid, date, uid, sha256]),
+  ]
+
+
+###################################################################
+#
+# release_actions:
+#
+# The transaction actions that delete image imageid of uid,
+# stored at bucketkey (with content hash sha256, or None):
+#
+#   [0] (blobs only) decrement the blob's refcount, joined on
+#       the images row so that it only happens if the row is
+#       still there (and locks it against a concurrent delete);
+#   [1] delete the images row: 0 rows means it was not there;
+#   [2] (blobs only) delete the blob row if that was the last
+#       reference: 1 row means the object is now unreferenced;
+#   [3] delete the variants of the object if no images row uses
+#       it any more.
+#
+def release_actions(imageid, uid, bucketkey, sha256):
+  actions = []
+
+  if sha256 is not None:
+    actions.append(("""
+      UPDATE image_blobs b JOIN images i ON i.uid = b.uid AND i.sha256 = b.sha256
+         SET b.refcount = b.refcount - 1
+       WHERE i.imageid = %s AND i.uid = %s;
+    """, [imageid, uid]))
+
+  actions.append(("DELETE FROM images WHERE imageid = %s AND uid = %s;", [imageid, uid]))
+
+  if sha256 is not None:
+    actions.append(("DELETE FROM image_blobs WHERE uid = %s AND sha256 = %s AND refcount = 0;",
+                    [uid, sha256]))
+
+  actions.append(("""
+    DELETE FROM image_variants
+     WHERE source = %s AND NOT EXISTS (SELECT 1 FROM images WHERE bucketkey = %s);
+  """, [bucketkey, bucketkey]))
+
+  return actions
+
+
+###################################################################
+#
+# hash_object:
+#
+# The SHA-256 (hex) of an S3 object, streamed in CHUNK-sized
+# reads rather than loaded whole.
+#
+def hash_object(s3, bucket, bucketkey):
+  digest = hashlib.sha256()
+
+  with s3.get_object(Bucket=bucket, Key=bucketkey)["Body"] as body:
+    for chunk in iter(lambda: body.read(CHUNK), b""):
+      digest.update(chunk)
+
+  return digest.hexdigest()
@@ -0,0 +1,67 @@
+#
+# imagevariants.py
+#
+# Downscaled renditions ("variants") of uploaded images. After
+# journal_upload_image_finalize confirms an upload, it hands the
+# object to journal_image_variants, which writes a JPEG per
+# entry of VARIANTS -- the image scaled to fit in a size x size
+# box -- and records each in the image_variants table, keyed
+# by the object it was made from (images with the same content
+# share an object, see imageblobs.py, and so its variants). Reads
+# that show many images at once (collages, galleries) then pick
+# the smallest rendition at least as big as they need with
+# RENDITION_SQL, and only fall back to the original when no
+# variant is big enough (or none was made yet).
+#
+# Variants live under variants/, outside the images/ prefix
+# that triggers the finalizer, so writing them does not trigger
+# it again.
+#
+
+import config
+
+VARIANTS = [("thumb", 256), ("medium", 1024)]  # (name, longest edge in pixels), smallest first
+
+UPSERT_SQL = """
+  INSERT INTO image_variants(source, variant, bucketkey, width, height, size)
+       VALUES(%s, %s, %s, %s, %s, %s)
+  ON DUPLICATE KEY UPDATE
+    bucketkey = VALUES(bucketkey), width = VALUES(width),
+    height = VALUES(height), size = VALUES(size);
+"""
+
+#
+# the key of the smallest rendition of images.* whose longest
+# edge is at least %s pixels, else the original's; a primary
+# key lookup per image:
+#
+RENDITION_SQL = """
+  COALESCE((SELECT v.bucketkey FROM image_variants v
+            WHERE v.source = images.bucketkey AND GREATEST(v.width, v.height) >= %s
+            ORDER BY GREATEST(v.width, v.height)
+            LIMIT 1),
+           images.bucketkey)
+"""
+
+
+###################################################################
+#
+# variant_key:
+#
+# The object key of a variant of the image at bucketkey, e.g.
+# images/80001/<uuid>.jpg -> variants/80001/<uuid>/thumb.jpg
+#
+def variant_key(bucketkey, name):
+  base = bucketkey.split("/", 1)[-1].rsplit(".", 1)[0]
+  return "variants/" + base + "/" + name + ".jpg"
+
+
+###################################################################
+#
+# function_name:
+#
+# The lambda that makes the variants ([images] variants_function),
+# or None if variants are turned off.
+#
+def function_name():
+  return config.get('images', 'variants_function', fallback='') or None
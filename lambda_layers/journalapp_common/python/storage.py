@@ -0,0 +1,44 @@
+#
+# storage.py
+#
+# The S3 client shared by the lambdas that touch S3.
+#
+# boto3 is slow to import, so it is only imported (and the
+# client created) on first use; the client is then reused while
+# the container is warm. If [s3] endpoint_url is configured
+# (e.g. a local moto or minio server), the client talks to it
+# instead of AWS. Tests and benchmarks can install any object
+# with the same methods, e.g. benchmarks/local_s3.LocalS3, with
+# set_s3_client().
+#
+
+import config
+
+_s3 = None
+
+
+def s3_client():
+  """
+  Returns the S3 client, created on first call
+  """
+  global _s3
+
+  if _s3 is None:
+    import boto3
+
+    endpoint_url = config.get('s3', 'endpoint_url', fallback='')
+    _s3 = boto3.client('s3', endpoint_url=endpoint_url or None)
+
+  return _s3
+
+
+def set_s3_client(client):
+  """
+  Replaces the S3 client, e.g. with a local stand-in
+  """
+  global _s3
+  _s3 = client
+
+
+def bucket_name():
+  return config.get('s3', 'bucket_name')
@@ -0,0 +1,124 @@
+#
+# userstats.py
+#
+# Running per-user sufficient statistics (see the user_stats
+# table in createDB.sql). For each user we keep the number of
+# entries, the sum of each metric and the sum of every pairwise
+# product of metrics. These are additive, so an upload only has
+# to add the contribution of its new rows, and averages,
+# variances and regression fits can be computed from one row
+# regardless of how long the user's history is.
+#
+
+METRICS = ["sleep", "eat", "water", "social", "overall"]
+
+PAIRS = [(METRICS[i], METRICS[j])
+         for i in range(len(METRICS)) for j in range(i, len(METRICS))]
+
+SUM_COLUMNS = ["s_" + m for m in METRICS]
+PRODUCT_COLUMNS = ["ss_" + a + "_" + b for (a, b) in PAIRS]
+
+STAT_COLUMNS = ["n"] + SUM_COLUMNS + PRODUCT_COLUMNS
+
+#
+# Adds a delta to the user's row, creating it on first upload.
+# last_entryid is taken from the rows just inserted by this
+# connection: LAST_INSERT_ID() is the first id of the latest
+# INSERT, so this is a short primary-key range scan.
+#
+UPSERT_SQL = """
+  INSERT INTO user_stats(uid, last_entryid, """ + ", ".join(STAT_COLUMNS) + """)
+       VALUES(%s, (SELECT MAX(entryid) FROM entries
+                   WHERE entryid >= LAST_INSERT_ID() AND uid = %s),
+              """ + ", ".join(["%s"] * len(STAT_COLUMNS)) + """)
+  ON DUPLICATE KEY UPDATE
+    last_entryid = GREATEST(last_entryid, VALUES(last_entryid)),
+    """ + ",\n    ".join([c + " = " + c + " + VALUES(" + c + ")" for c in STAT_COLUMNS]) + """;
+"""
+
+SELECT_SQL = """
+  SELECT last_entryid, """ + ", ".join(STAT_COLUMNS) + """
+  FROM user_stats WHERE uid = %s;
+"""
+
+#
+# Drops the user's cached regression model (the user_models
+# table, see journal_linear_regression/modelcache.py); run in
+# the same transaction as UPSERT_SQL by every writer of entries.
+#
+INVALIDATE_MODEL_SQL = "DELETE FROM user_models WHERE uid = %s;"
+
+
+###################################################################
+#
+# delta:
+#
+# Given the rows being inserted, each a dict or list of metric
+# values in METRICS order, returns the list of values to add
+# to STAT_COLUMNS.
+#
+def delta(rows):
+  """
+  Returns [n, sums..., products...] for the given rows
+
+  Parameters
+  ----------
+  rows : list of [sleep, eat, water, social, overall] lists
+
+  Returns
+  -------
+  list of integers in STAT_COLUMNS order
+  """
+  n = 0
+  sums = [0] * len(METRICS)
+  products = [0] * len(PAIRS)
+
+  for row in rows:
+    values = [int(v) for v in row]
+    n += 1
+
+    for i, v in enumerate(values):
+      sums[i] += v
+
+    k = 0
+    for i in range(len(METRICS)):
+      for j in range(i, len(METRICS)):
+        products[k] += values[i] * values[j]
+        k += 1
+
+  return [n] + sums + products
+
+
+###################################################################
+#
+# upsert_params:
+#
+# Parameters for UPSERT_SQL for uid and the rows being inserted.
+#
+def upsert_params(uid, rows):
+  return [uid, uid] + delta(rows)
+
+
+###################################################################
+#
+# parse:
+#
+# Turns a row retrieved with SELECT_SQL into a dict with keys
+# last_entryid, n, sums (metric -> sum) and products
+# ((metric, metric) -> sum of products). Returns None for ().
+#
+def parse(row):
+  if row == () or row is None:
+    return None
+
+  last_entryid, n = row[0], int(row[1])
+  sums = row[2:2 + len(METRICS)]
+  products = row[2 + len(METRICS):]
+
+  return {
+    "last_entryid": last_entryid,
+    "n": n,
+    "sums": dict(zip(METRICS, [int(v) for v in sums])),
+    "products": dict(zip(PAIRS, [int(v) for v in products])),
+  }
+
@@ -0,0 +1,266 @@
+#
+# validation.py
+#
+# Request decoding and validation shared by the lambdas.
+#
+# A schema is a dict of field name -> check, where a check is a
+# function value -> (value, error). compile_schema turns it into
+# a single validate(obj) function once, at import time, so each
+# request only runs a flat loop over precompiled checks instead
+# of a chain of "if field not in body" tests.
+#
+# Handlers raise BadRequest for anything the client got wrong;
+# the handler decorator (handler.py) turns it into a 400.
+#
+
+import base64
+import binascii
+import json
+import time
+import zlib
+
+
+class BadRequest(Exception):
+  """
+  The request is invalid; reported to the client with status 400
+  """
+  pass
+
+
+###################################################################
+#
+# decode_body:
+#
+# Returns the parsed JSON body of an API Gateway event. The body
+# normally arrives in event["body"] (base64 encoded if
+# isBase64Encoded is set); for older clients of journal_upload
+# it may instead be in the "body" query string parameter.
+#
+# Clients may gzip large bodies and say so with a
+# "Content-Encoding: gzip" header (the API must then pass the
+# body through as binary, i.e. base64 encoded). The body is
+# inflated up to MAX_BODY bytes, so that a small compressed
+# request cannot blow up the lambda's memory.
+#
+MAX_BODY = 6 * 1024 * 1024  # the Lambda payload limit
+
+
+def header(event, name):
+  """
+  Returns a request header by lower-case name, or None
+  """
+  for key, value in (event.get("headers") or {}).items():
+    if key.lower() == name:
+      return value
+
+  return None
+
+
+def _gunzip(data):
+  inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)  # gzip framing
+
+  try:
+    body = inflater.decompress(data, MAX_BODY)
+  except zlib.error:
+    raise BadRequest("body is not valid gzip")
+
+  if inflater.unconsumed_tail:
+    raise BadRequest("body too large, max is " + str(MAX_BODY) + " bytes")
+
+  return body
+
+
+def decode_body(event):
+  """
+  Returns the request body parsed as JSON, or raises BadRequest
+  """
+  body = event.get("body")
+
+  if body is None:
+    body = (event.get("queryStringParameters") or {}).get("body")
+
+  if body is None:
+    raise BadRequest("event has no body")
+
+  if event.get("isBase64Encoded"):
+    try:
+      body = base64.b64decode(body)
+    except binascii.Error:
+      raise BadRequest("body is not valid base64")
+
+  encoding = header(event, "content-encoding")
+
+  if encoding is not None and encoding.lower() == "gzip":
+    if not isinstance(body, bytes):
+      #
+      # a gzipped body that arrived as text must have been passed
+      # through byte for byte, i.e. as latin-1:
+      #
+      try:
+        body = body.encode("latin-1")
+      except UnicodeEncodeError:
+        raise BadRequest("body is not valid gzip")
+    body = _gunzip(body)
+
+  try:
+    return json.loads(body)
+  except ValueError:
+    raise BadRequest("body is not valid JSON")
+
+
+###################################################################
+#
+# path_param / query_param:
+#
+# Return a path or query string parameter, raising BadRequest
+# if a required one is missing.
+#
+_REQUIRED = object()
+
+
+def path_param(event, name, default=_REQUIRED):
+  params = event.get("pathParameters") or {}
+
+  if name in params:
+    return params[name]
+  if default is _REQUIRED:
+    raise BadRequest("event has no " + name)
+
+  return default
+
+
+def query_param(event, name, default=_REQUIRED):
+  params = event.get("queryStringParameters") or {}
+
+  if name in params:
+    return params[name]
+  if default is _REQUIRED:
+    raise BadRequest("event has no " + name)
+
+  return default
+
+
+###################################################################
+#
+# checks: each returns a function value -> (value, error)
+#
+def integer(lo, hi):
+  def check(value):
+    if isinstance(value, bool):
+      return None, "must be an integer"
+    try:
+      value = int(value)
+    except (TypeError, ValueError):
+      return None, "must be an integer"
+    if value < lo or value > hi:
+      return None, "must be between " + str(lo) + " and " + str(hi)
+    return value, None
+
+  return check
+
+
+def string(max_length):
+  def check(value):
+    if not isinstance(value, str):
+      return None, "must be a string"
+    if len(value) > max_length:
+      return None, "must be at most " + str(max_length) + " characters"
+    return value, None
+
+  return check
+
+
+def one_of(choices):
+  choices = frozenset(choices)
+
+  def check(value):
+    if value not in choices:
+      return None, "must be one of " + ", ".join(sorted(choices))
+    return value, None
+
+  return check
+
+
+def date_format(fmt):
+  def check(value):
+    try:
+      time.strptime(value, fmt)
+    except (TypeError, ValueError):
+      return None, "must be in " + fmt.replace('%Y', 'YYYY').replace('%m', 'MM') \
+        .replace('%d', 'DD').replace('%H', 'hh').replace('%M', 'mm').replace('%S', 'ss') + " format"
+    return value, None
+
+  return check
+
+
+def hex_digest(length):
+  digits = frozenset("0123456789abcdef")
+
+  def check(value):
+    if not isinstance(value, str) or len(value) != length or not digits.issuperset(value.lower()):
+      return None, "must be " + str(length) + " hex digits"
+    return value.lower(), None
+
+  return check
+
+
+datetime_check = date_format('%Y-%m-%d %H:%M:%S')
+date_check = date_format('%Y-%m-%d')
+sha256_check = hex_digest(64)
+
+
+###################################################################
+#
+# compile_schema:
+#
+# Returns validate(obj) -> (values, error) where values is a
+# dict of the checked fields (optional ones only if present)
+# and error is None or a message naming the offending field.
+#
+def compile_schema(fields, optional=()):
+  """
+  Compiles a schema into a validation function
+
+  Parameters
+  ----------
+  fields : dict of field name -> check function,
+  optional : names of fields that may be missing
+
+  Returns
+  -------
+  function obj -> (dict of values, None) or (None, error)
+  """
+  items = tuple((name, check, name in optional) for name, check in fields.items())
+
+  def validate(obj):
+    if not isinstance(obj, dict):
+      return None, "entry is not a JSON object"
+
+    values = {}
+    for name, check, is_optional in items:
+      if name not in obj:
+        if is_optional:
+          continue
+        return None, "event has a body but no " + name
+
+      value, error = check(obj[name])
+      if error is not None:
+        return None, name + " " + error
+
+      values[name] = value
+
+    return values, None
+
+  return validate
+
+
+#
+# a journal entry, as sent to journal_upload:
+#
+ENTRY_METRICS = ["sleep", "eat", "water", "social", "overall"]
+
+validate_entry = compile_schema(
+  dict([("notes", string(512))] +
+       [(name, integer(1, 10)) for name in ENTRY_METRICS] +
+       [("date", datetime_check)]),
+  optional=("date",))
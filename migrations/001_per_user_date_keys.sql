@@ -0,0 +1,38 @@
+--
+-- 001_per_user_date_keys.sql
+--
+-- Replaces the global UNIQUE (date) keys on entries and images
+-- with per-user (uid, date) unique keys. Lookups such as
+-- "WHERE uid = %s ORDER BY date" become index range scans
+-- instead of full table scans, and two users can now write in
+-- the same second. The composite key also serves the uid
+-- foreign key, so the separate uid index is dropped.
+--
+-- Apply with migrations/migrate.py, or by hand against a
+-- database created from the original createDB.sql.
+--
+
+USE journalapp;
+
+
+CREATE TABLE IF NOT EXISTS schema_version
+(
+    version     int not null,
+    applied     datetime not null,
+    PRIMARY KEY (version)
+);
+
+
+ALTER TABLE entries
+    ADD UNIQUE KEY entries_uid_date (uid, date),
+    DROP INDEX date,
+    DROP INDEX uid;
+
+
+ALTER TABLE images
+    ADD UNIQUE KEY images_uid_date (uid, date),
+    DROP INDEX date,
+    DROP INDEX uid;
+
+
+INSERT INTO schema_version(version, applied) values(1, NOW());
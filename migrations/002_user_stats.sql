@@ -0,0 +1,78 @@
+--
+-- 002_user_stats.sql
+--
+-- Adds user_stats, one row per user holding running sufficient
+-- statistics over all of the user's entries: the count, the sum
+-- of each metric, and the sum of every pairwise product of
+-- sleep, eat, water, social and overall. journal_upload updates
+-- the row in the same transaction as the entries INSERT, so
+-- averages, variances and regression coefficients can be
+-- computed in O(1) per request instead of rescanning history.
+--
+-- The table is backfilled from the existing entries.
+--
+
+USE journalapp;
+
+
+CREATE TABLE user_stats
+(
+    uid                 int not null,
+    n                   bigint not null,  -- # of entries
+    last_entryid        int not null,     -- changes on every upload
+    s_sleep             bigint not null,  -- sum
+    s_eat               bigint not null,  -- sum
+    s_water             bigint not null,  -- sum
+    s_social            bigint not null,  -- sum
+    s_overall           bigint not null,  -- sum
+    ss_sleep_sleep      bigint not null,  -- sum of products
+    ss_sleep_eat        bigint not null,  -- sum of products
+    ss_sleep_water      bigint not null,  -- sum of products
+    ss_sleep_social     bigint not null,  -- sum of products
+    ss_sleep_overall    bigint not null,  -- sum of products
+    ss_eat_eat          bigint not null,  -- sum of products
+    ss_eat_water        bigint not null,  -- sum of products
+    ss_eat_social       bigint not null,  -- sum of products
+    ss_eat_overall      bigint not null,  -- sum of products
+    ss_water_water      bigint not null,  -- sum of products
+    ss_water_social     bigint not null,  -- sum of products
+    ss_water_overall    bigint not null,  -- sum of products
+    ss_social_social    bigint not null,  -- sum of products
+    ss_social_overall   bigint not null,  -- sum of products
+    ss_overall_overall  bigint not null,  -- sum of products
+    PRIMARY KEY (uid),
+    FOREIGN KEY (uid) REFERENCES users(uid)
+);
+
+
+INSERT INTO user_stats(uid, n, last_entryid,
+                       s_sleep, s_eat, s_water, s_social, s_overall,
+                       ss_sleep_sleep, ss_sleep_eat, ss_sleep_water, ss_sleep_social, ss_sleep_overall,
+                       ss_eat_eat, ss_eat_water, ss_eat_social, ss_eat_overall, ss_water_water,
+                       ss_water_social, ss_water_overall, ss_social_social, ss_social_overall, ss_overall_overall)
+    SELECT uid, COUNT(*), MAX(entryid),
+           SUM(sleep),
+           SUM(eat),
+           SUM(water),
+           SUM(social),
+           SUM(overall),
+           SUM(sleep * sleep),
+           SUM(sleep * eat),
+           SUM(sleep * water),
+           SUM(sleep * social),
+           SUM(sleep * overall),
+           SUM(eat * eat),
+           SUM(eat * water),
+           SUM(eat * social),
+           SUM(eat * overall),
+           SUM(water * water),
+           SUM(water * social),
+           SUM(water * overall),
+           SUM(social * social),
+           SUM(social * overall),
+           SUM(overall * overall)
+    FROM entries
+    GROUP BY uid;
+
+
+INSERT INTO schema_version(version, applied) values(2, NOW());
@@ -0,0 +1,31 @@
+--
+-- 003_user_models.sql
+--
+-- Adds user_models, the persisted cache of each user's fitted
+-- mood regression (see journal_linear_regression/modelcache.py).
+-- A row is valid while its last_entryid matches the user's
+-- user_stats.last_entryid; journal_upload also deletes the row
+-- when it inserts new entries for the user.
+--
+
+USE journalapp;
+
+
+CREATE TABLE user_models
+(
+    uid             int not null,
+    last_entryid    int not null,  -- user_stats.last_entryid when fitted
+    n               bigint not null,
+    intercept       double not null,
+    sleep           double not null,
+    eat             double not null,
+    water           double not null,
+    social          double not null,
+    r2              double,        -- null if overall never varied
+    fitted          datetime not null,
+    PRIMARY KEY (uid),
+    FOREIGN KEY (uid) REFERENCES users(uid)
+);
+
+
+INSERT INTO schema_version(version, applied) values(3, NOW());
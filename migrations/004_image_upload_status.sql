@@ -0,0 +1,28 @@
+--
+-- 004_image_upload_status.sql
+--
+-- Supports the two-phase image upload: journal_upload_image
+-- reserves an images row with status 'pending' and hands the
+-- client a presigned S3 POST, then the S3-triggered
+-- journal_upload_image_finalize lambda marks the row 'uploaded'
+-- and records the object's size. Existing rows are uploaded.
+-- imageid is now generated by the database.
+--
+
+USE journalapp;
+
+
+ALTER TABLE images
+    MODIFY imageid int not null AUTO_INCREMENT,
+    ADD COLUMN status varchar(16) not null DEFAULT 'uploaded',
+    ADD COLUMN size bigint;
+
+
+ALTER TABLE images
+    ALTER COLUMN status DROP DEFAULT;
+
+
+ALTER TABLE images AUTO_INCREMENT = 2001;
+
+
+INSERT INTO schema_version(version, applied) values(4, NOW());
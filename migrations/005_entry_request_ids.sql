@@ -0,0 +1,19 @@
+--
+-- 005_entry_request_ids.sql
+--
+-- Supports journal_upload's asynchronous mode: entries written
+-- by journal_upload_consumer from the entry queue record the
+-- upload's request id, unique per user, so that a message the
+-- queue delivers more than once is written only once. Entries
+-- uploaded synchronously have a null request id.
+--
+
+USE journalapp;
+
+
+ALTER TABLE entries
+    ADD COLUMN requestid varchar(64),
+    ADD UNIQUE KEY entries_uid_requestid (uid, requestid);
+
+
+INSERT INTO schema_version(version, applied) values(5, NOW());
@@ -0,0 +1,26 @@
+--
+-- 006_idempotency_keys.sql
+--
+-- Adds idempotency_keys: journal_upload and journal_upload_image
+-- store their response under the client's idempotency key in the
+-- same transaction as their writes, so a retried request gets
+-- the stored response instead of writing again.
+--
+
+USE journalapp;
+
+
+CREATE TABLE idempotency_keys
+(
+    uid             int not null,
+    endpoint        varchar(64) not null,
+    requestid       varchar(64) not null,
+    status          int not null,
+    response        mediumtext not null,
+    created         datetime not null,
+    PRIMARY KEY (uid, endpoint, requestid),
+    FOREIGN KEY (uid) REFERENCES users(uid)
+);
+
+
+INSERT INTO schema_version(version, applied) values(6, NOW());
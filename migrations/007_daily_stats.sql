@@ -0,0 +1,70 @@
+--
+-- 007_daily_stats.sql
+--
+-- Adds daily_stats, one row per user and day with entries: the
+-- count and the sum, min and max of each metric. The uploads
+-- fold new entries into it in the same transaction as the
+-- INSERT, and journal_trends aggregates it by day, week or
+-- month instead of scanning entries.
+--
+-- The table is backfilled from the existing entries. The same
+-- DELETE + INSERT rebuilds it after running with [rollup] daily
+-- turned off.
+--
+
+USE journalapp;
+
+
+CREATE TABLE daily_stats
+(
+    uid             int not null,
+    day             date not null,
+    n               int not null,  -- # of entries
+    s_sleep         bigint not null,  -- sum
+    s_eat           bigint not null,  -- sum
+    s_water         bigint not null,  -- sum
+    s_social        bigint not null,  -- sum
+    s_overall       bigint not null,  -- sum
+    min_sleep       int not null,
+    min_eat         int not null,
+    min_water       int not null,
+    min_social      int not null,
+    min_overall     int not null,
+    max_sleep       int not null,
+    max_eat         int not null,
+    max_water       int not null,
+    max_social      int not null,
+    max_overall     int not null,
+    PRIMARY KEY (uid, day),
+    FOREIGN KEY (uid) REFERENCES users(uid)
+);
+
+
+DELETE FROM daily_stats;
+
+
+INSERT INTO daily_stats(uid, day, n,
+                        s_sleep, s_eat, s_water, s_social, s_overall,
+                        min_sleep, min_eat, min_water, min_social, min_overall,
+                        max_sleep, max_eat, max_water, max_social, max_overall)
+    SELECT uid, DATE(date), COUNT(*),
+           SUM(sleep),
+           SUM(eat),
+           SUM(water),
+           SUM(social),
+           SUM(overall),
+           MIN(sleep),
+           MIN(eat),
+           MIN(water),
+           MIN(social),
+           MIN(overall),
+           MAX(sleep),
+           MAX(eat),
+           MAX(water),
+           MAX(social),
+           MAX(overall)
+    FROM entries
+    GROUP BY uid, DATE(date);
+
+
+INSERT INTO schema_version(version, applied) values(7, NOW());
@@ -0,0 +1,17 @@
+--
+-- 008_notes_fulltext.sql
+--
+-- Adds a FULLTEXT index on entries.notes for journal_search, so
+-- that searching notes is an index lookup instead of a
+-- LIKE '%x%' scan over every user's entries. Building the index
+-- rewrites the table; run it off-peak on large databases.
+--
+
+USE journalapp;
+
+
+ALTER TABLE entries
+    ADD FULLTEXT INDEX entries_notes_ft (notes);
+
+
+INSERT INTO schema_version(version, applied) values(8, NOW());
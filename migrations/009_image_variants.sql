@@ -0,0 +1,32 @@
+--
+-- 009_image_variants.sql
+--
+-- Adds image_variants, the downscaled renditions of each
+-- uploaded image (a thumbnail and a medium size) made by
+-- journal_image_variants after the upload is finalized, so that
+-- collages and galleries fetch the smallest rendition that is
+-- big enough instead of the original.
+--
+-- Images uploaded before this have no variants and are read
+-- from their originals until journal_image_variants is run on
+-- them.
+--
+
+USE journalapp;
+
+
+CREATE TABLE image_variants
+(
+    imageid         int not null,
+    variant         varchar(16) not null,   -- 'thumb', 'medium'
+    bucketkey       varchar(256) not null,
+    width           int not null,
+    height          int not null,
+    size            bigint not null,        -- bytes
+    PRIMARY KEY (imageid, variant),
+    FOREIGN KEY (imageid) REFERENCES images(imageid),
+    UNIQUE (bucketkey)
+);
+
+
+INSERT INTO schema_version(version, applied) values(9, NOW());
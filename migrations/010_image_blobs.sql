@@ -0,0 +1,55 @@
+--
+-- 010_image_blobs.sql
+--
+-- Content-addressed image storage (see imageblobs.py): uploads
+-- that come with a SHA-256 are stored once per user and
+-- distinct content as an image_blobs row that owns the S3
+-- object and counts the images rows pointing at it.
+--
+--  - images.sha256 links a row to its blob (NULL for images
+--    with an object of their own, e.g. all existing ones);
+--  - images.bucketkey is no longer unique, since the images
+--    rows of a blob share its key;
+--  - image_variants belong to an object rather than an images
+--    row, so that duplicates share them: they are re-keyed on
+--    source, the bucketkey of the object they were made from.
+--
+
+USE journalapp;
+
+
+CREATE TABLE image_blobs
+(
+    uid             int not null,          -- blobs are per user, never shared
+    sha256          char(64) not null,
+    bucketkey       varchar(256) not null,
+    status          varchar(16) not null,  -- 'pending' until the upload is verified, then 'uploaded'
+    size            bigint,                -- bytes, set when verified
+    refcount        int not null,          -- # of images rows
+    PRIMARY KEY (uid, sha256),
+    FOREIGN KEY (uid) REFERENCES users(uid),
+    UNIQUE (bucketkey)
+);
+
+
+ALTER TABLE images
+    ADD COLUMN sha256 char(64),
+    DROP INDEX bucketkey,
+    ADD INDEX images_bucketkey (bucketkey);
+
+
+ALTER TABLE image_variants
+    ADD COLUMN source varchar(256);
+
+UPDATE image_variants v JOIN images i ON i.imageid = v.imageid
+   SET v.source = i.bucketkey;
+
+ALTER TABLE image_variants
+    DROP FOREIGN KEY image_variants_ibfk_1,
+    DROP PRIMARY KEY,
+    DROP COLUMN imageid,
+    MODIFY source varchar(256) not null,
+    ADD PRIMARY KEY (source, variant);
+
+
+INSERT INTO schema_version(version, applied) values(10, NOW());
@@ -0,0 +1,105 @@
+#
+# migrate.py
+#
+# Applies the versioned SQL scripts in this directory, in order,
+# to the journalapp database. Scripts are named NNN_name.sql;
+# every script whose number is greater than the current
+# MAX(version) in schema_version is applied, and each script
+# records its own version when it finishes.
+#
+# Usage:
+#   python migrate.py [config_file]
+#
+# where config_file has the same [rds] section as the lambdas'
+# journalapp-config.ini (default: journalapp-config.ini).
+#
+
+import os
+import re
+import sys
+
+import pymysql
+
+from configparser import ConfigParser
+
+
+def script_versions(dirname):
+  """
+  Returns a sorted list of (version, path) for NNN_*.sql scripts
+  """
+  scripts = []
+
+  for filename in os.listdir(dirname):
+    m = re.match(r"^(\d+)_.*\.sql$", filename)
+    if m:
+      scripts.append((int(m.group(1)), os.path.join(dirname, filename)))
+
+  return sorted(scripts)
+
+
+def split_statements(text):
+  """
+  Splits a script into statements, dropping -- comments
+  """
+  lines = [line for line in text.splitlines() if not line.strip().startswith("--")]
+  statements = "\n".join(lines).split(";")
+
+  return [stmt.strip() for stmt in statements if stmt.strip() != ""]
+
+
+def current_version(dbConn):
+  dbCursor = dbConn.cursor()
+
+  try:
+    dbCursor.execute("SHOW TABLES LIKE 'schema_version'")
+    if dbCursor.fetchone() is None:
+      return 0
+
+    dbCursor.execute("SELECT MAX(version) FROM schema_version")
+    row = dbCursor.fetchone()
+    return row[0] or 0
+
+  finally:
+    dbCursor.close()
+
+
+def main():
+  config_file = sys.argv[1] if len(sys.argv) > 1 else 'journalapp-config.ini'
+
+  configur = ConfigParser()
+  configur.read(config_file)
+
+  dbConn = pymysql.connect(host=configur.get('rds', 'endpoint'),
+                           port=int(configur.get('rds', 'port_number')),
+                           user=configur.get('rds', 'user_name'),
+                           passwd=configur.get('rds', 'user_pwd'),
+                           database=configur.get('rds', 'db_name'))
+
+  version = current_version(dbConn)
+  print("current schema version:", version)
+
+  for script_version, path in script_versions(os.path.dirname(os.path.abspath(__file__))):
+    if script_version <= version:
+      continue
+
+    print("applying", os.path.basename(path))
+
+    with open(path) as f:
+      statements = split_statements(f.read())
+
+    dbCursor = dbConn.cursor()
+    try:
+      for stmt in statements:
+        if stmt.upper().startswith("USE "):
+          continue  # stay on the configured database
+        dbCursor.execute(stmt)
+      dbConn.commit()
+    finally:
+      dbCursor.close()
+
+  print("schema version now:", current_version(dbConn))
+  dbConn.close()
+
+
+if __name__ == "__main__":
+  main()
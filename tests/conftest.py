@@ -0,0 +1,90 @@
+#
+# conftest.py
+#
+# Puts the journalapp_common layer and benchmarks/ (for
+# LocalS3) on the path, as the lambdas and benchmarks see them,
+# and provides:
+#
+#   load_lambda  imports a lambda's lambda_function.py;
+#   lambda_env   runs handlers against a fakedb connection (see
+#                fakedb.py) and a LocalS3, with empty settings
+#                and empty warm-container caches.
+#
+# Run from the repository root:
+#   python -m pytest -q tests
+#
+
+import collections
+import configparser
+import importlib.util
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+
+sys.path.insert(0, os.path.join(ROOT, "lambda_layers", "journalapp_common", "python"))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+sys.path.insert(0, HERE)
+
+import config
+import datatier
+import fakedb
+import handler
+import idempotency
+import storage
+from local_s3 import LocalS3
+
+
+@pytest.fixture
+def load_lambda():
+  """
+  load_lambda(name) imports lambda_functions/<name>/lambda_function.py
+  """
+  def load(name):
+    path = os.path.join(ROOT, "lambda_functions", name, "lambda_function.py")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+  return load
+
+
+class LambdaEnv:
+  """
+  What a handler under test talks to: db, the fakedb connection
+  it gets (replace it per test), and s3, a LocalS3 with bucket
+  "b"
+  """
+  def __init__(self, s3):
+    self.s3 = s3
+    self.db = fakedb.Connection()
+
+  def put(self, key, data):
+    self.s3.put_object(Bucket="b", Key=key, Body=data)
+
+  def exists(self, key):
+    try:
+      self.s3.head_object(Bucket="b", Key=key)
+      return True
+    except Exception:
+      return False
+
+
+@pytest.fixture
+def lambda_env(monkeypatch, tmp_path):
+  env = LambdaEnv(LocalS3(str(tmp_path / "s3")))
+
+  monkeypatch.setattr(config, "_configur", configparser.ConfigParser())
+  monkeypatch.setattr(config, "rds_settings", lambda: ("host", 3306, "user", "pwd", "db"))
+  monkeypatch.setattr(config, "replica_settings", lambda: [])
+  monkeypatch.setattr(datatier, "get_cached_dbConn", lambda *params: env.db)
+  monkeypatch.setattr(storage, "_s3", env.s3)
+  monkeypatch.setattr(storage, "bucket_name", lambda: "b")
+  monkeypatch.setattr(handler, "_known_users", {})
+  monkeypatch.setattr(idempotency, "_remembered", collections.OrderedDict())
+
+  return env
@@ -0,0 +1,101 @@
+#
+# fakedb.py
+#
+# A stand-in for a pymysql connection, for tests of datatier and
+# the handlers without a MySQL server. Every statement is logged
+# as (sql with whitespace collapsed, parameters); what it returns
+# comes from respond(sql, parameters):
+#
+#   - a list of row tuples, for queries;
+#   - an int, the rowcount of an action (default 1);
+#   - an exception instance, which is raised.
+#
+
+import re
+
+
+def normalize(sql):
+  return re.sub(r"\s+", " ", sql).strip()
+
+
+class Cursor:
+  def __init__(self, conn):
+    self.conn = conn
+    self.rowcount = 0
+    self.lastrowid = None
+    self._rows = []
+
+  def _run(self, sql, parameters):
+    self.conn.log.append((normalize(sql), parameters))
+
+    result = self.conn.respond(normalize(sql), parameters)
+    if isinstance(result, Exception):
+      raise result
+
+    if isinstance(result, int):
+      self._rows, self.rowcount = [], result
+    else:
+      self._rows, self.rowcount = list(result or []), len(result or [])
+
+    if normalize(sql).upper().startswith("INSERT") and self.rowcount > 0:
+      self.conn.lastrowid += 1
+      self.lastrowid = self.conn.lastrowid
+
+  def execute(self, sql, parameters=None):
+    self._run(sql, parameters)
+
+  def executemany(self, sql, rows):
+    self._run(sql, list(rows))
+
+  def fetchone(self):
+    return self._rows.pop(0) if self._rows else None
+
+  def fetchall(self):
+    rows, self._rows = self._rows, []
+    return rows
+
+  def fetchmany(self, size):
+    rows, self._rows = self._rows[:size], self._rows[size:]
+    return rows
+
+  def close(self):
+    pass
+
+
+class Connection:
+  def __init__(self, respond=None, lastrowid=2000):
+    self.respond = respond or (lambda sql, parameters: 1 if _is_action(sql) else [])
+    self.log = []
+    self.lastrowid = lastrowid
+    self.closed = False
+    self.alive = True
+    self.transactions = []  # "commit" or "rollback"
+
+  def cursor(self, cursor_class=None):
+    return Cursor(self)
+
+  def begin(self):
+    pass
+
+  def commit(self):
+    self.transactions.append("commit")
+
+  def rollback(self):
+    self.transactions.append("rollback")
+
+  def autocommit(self, value):
+    pass
+
+  def ping(self, reconnect=False):
+    if not self.alive:
+      raise Exception("server has gone away")
+
+  def close(self):
+    self.closed = True
+
+  def statements(self):
+    return [sql for sql, parameters in self.log]
+
+
+def _is_action(sql):
+  return not sql.upper().startswith("SELECT")
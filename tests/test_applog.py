@@ -0,0 +1,88 @@
+import json
+
+import pymysql
+import pytest
+
+import applog
+
+
+@pytest.fixture
+def sampled_out(monkeypatch):
+  """
+  Settings under which successful invocations are never written
+  """
+  monkeypatch.setattr(applog, "_settings", {"level": applog.LEVELS["INFO"], "sample_rate": 0.0})
+
+
+def lines(capsys):
+  return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_success_is_sampled(sampled_out, capsys):
+  applog.begin("t")
+  applog.info("fine")
+  line = applog.finish(200)
+
+  assert line["status"] == 200 and line["events"][0]["msg"] == "fine"
+  assert lines(capsys) == []
+
+
+@pytest.mark.parametrize("status, level", [(500, None), (None, None), (200, "warning"), (400, "error")])
+def test_failures_and_warnings_are_always_written(sampled_out, capsys, status, level):
+  applog.begin("t")
+  if level is not None:
+    getattr(applog, level)("something")
+  applog.finish(status)
+
+  assert len(lines(capsys)) == 1
+
+
+def test_sample_rate_one_writes_everything(monkeypatch, capsys):
+  monkeypatch.setattr(applog, "_settings", {"level": applog.LEVELS["INFO"], "sample_rate": 1.0})
+
+  for _ in range(3):
+    applog.begin("t")
+    applog.finish(200)
+
+  assert len(lines(capsys)) == 3
+
+
+def test_level_filters_events(monkeypatch, capsys):
+  monkeypatch.setattr(applog, "_settings", {"level": applog.LEVELS["WARNING"], "sample_rate": 1.0})
+
+  applog.begin("t")
+  applog.info("dropped")
+  applog.warning("kept")
+  applog.finish(200)
+
+  (line,) = lines(capsys)
+
+  assert [event["msg"] for event in line["events"]] == ["kept"]
+
+
+def test_integrity_errors_do_not_force_the_line(sampled_out, capsys):
+  applog.begin("t")
+  applog.record_query("perform_transaction", "INSERT INTO entries VALUES(%s)", 1.0, 0,
+                      pymysql.err.IntegrityError(1062, "Duplicate entry"))
+  line = applog.finish(400)
+
+  assert line["events"][0]["level"] == "INFO"
+  assert line["queries"]["count"] == 1
+  assert lines(capsys) == []
+
+
+def test_other_query_errors_are_errors(sampled_out, capsys):
+  applog.begin("t")
+  applog.record_query("retrieve_all_rows", "SELECT 1", 1.0, 0,
+                      pymysql.err.OperationalError(2013, "Lost connection"))
+  applog.finish(200)
+
+  (line,) = lines(capsys)
+  assert line["events"][0]["level"] == "ERROR"
+
+
+def test_fingerprint_ignores_literals():
+  a = applog.fingerprint("SELECT * FROM entries WHERE uid = 80001  AND date > '2024-01-01'")
+  b = applog.fingerprint("SELECT * FROM entries WHERE uid = %s AND date > %s")
+
+  assert a[0] == b[0]
@@ -0,0 +1,31 @@
+import pytest
+
+
+@pytest.fixture
+def collage_download(load_lambda):
+  return load_lambda("journal_collage_download")
+
+
+def request(tile):
+  return {"queryStringParameters": {"uid": "80001", "start": "2024-01-01", "end": "2024-01-31",
+                                    "tile": tile}}
+
+
+@pytest.mark.parametrize("tile, error", [
+  ("0", "tile must be positive"),
+  ("-5", "tile must be positive"),
+  ("big", "tile must be an integer"),
+])
+def test_invalid_tile(collage_download, lambda_env, tile, error):
+  result = collage_download.lambda_handler(request(tile), None)
+
+  assert result["statusCode"] == 400 and error in result["body"]
+  assert lambda_env.db.log == []
+
+
+def test_tile_is_capped(collage_download, lambda_env):
+  result = collage_download.lambda_handler(request("100000"), None)
+
+  assert result["statusCode"] == 400 and "no images" in result["body"]
+  (sql, parameters), = lambda_env.db.log
+  assert parameters[0] == collage_download.MAX_TILE
@@ -0,0 +1,60 @@
+import datetime
+
+import pytest
+
+import datatier
+import fakedb
+
+DAY = datetime.datetime(2024, 1, 1, 8, 0, 0)
+
+
+def page_of(n):
+  """
+  n (notes, date, entryid) rows, as the page query returns them
+  """
+  return [("note " + str(i), DAY + datetime.timedelta(days=i), 3000 + i) for i in range(n)]
+
+
+def test_first_page():
+  dbConn = fakedb.Connection(lambda sql, parameters: page_of(4))
+
+  rows, after = datatier.retrieve_page(dbConn, "entries", ["notes"], 80001, page_size=3)
+
+  assert rows == [("note 0",), ("note 1",), ("note 2",)]
+  assert after == (DAY + datetime.timedelta(days=2), 3002)
+
+  sql, parameters = dbConn.log[0]
+  assert sql == "SELECT notes, date, entryid FROM entries WHERE uid = %s ORDER BY date, entryid LIMIT %s"
+  assert parameters == [80001, 4]  # one extra row tells whether there is a next page
+
+
+def test_next_and_last_page():
+  dbConn = fakedb.Connection(lambda sql, parameters: page_of(2))
+  after = (DAY, 3000)
+
+  rows, next_after = datatier.retrieve_page(dbConn, "images", ["bucketkey"], 80001, after=after,
+                                            page_size=3, id_column="imageid")
+
+  assert len(rows) == 2 and next_after is None
+
+  sql, parameters = dbConn.log[0]
+  assert "AND (date > %s OR (date = %s AND imageid > %s)) ORDER BY date, imageid" in sql
+  assert parameters == [80001, DAY, DAY, 3000, 4]
+
+
+def test_page_key_round_trip():
+  after = (DAY, 3002)
+
+  token = datatier.encode_page_key(after)
+
+  assert isinstance(token, str)
+  assert datatier.decode_page_key(token) == after
+  assert datatier.encode_page_key(None) is None
+  assert datatier.decode_page_key(None) is None
+  assert datatier.decode_page_key("") is None
+
+
+@pytest.mark.parametrize("token", ["not a token", "MjAyNC0wMS0wMQ==", "eHwx"])  # -, no id, x|1
+def test_invalid_page_key(token):
+  with pytest.raises(ValueError):
+    datatier.decode_page_key(token)
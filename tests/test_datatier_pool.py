@@ -0,0 +1,93 @@
+import pymysql
+import pytest
+
+import datatier
+import fakedb
+
+PARAMS = ("host", 3306, "user", "pwd", "db")
+
+
+@pytest.fixture
+def opened(monkeypatch):
+  """
+  The connections datatier.get_dbConn has opened, in order
+  """
+  connections = []
+
+  def get_dbConn(*params):
+    assert params == PARAMS
+    connections.append(fakedb.Connection())
+    return connections[-1]
+
+  monkeypatch.setattr(datatier, "get_dbConn", get_dbConn)
+  return connections
+
+
+def test_reuses_released_connections(opened):
+  pool = datatier.ConnectionPool(*PARAMS, maxsize=2)
+
+  a = pool.acquire()
+  pool.release(a)
+
+  assert pool.acquire() is a
+  assert len(opened) == 1
+
+
+def test_bounded(opened):
+  pool = datatier.ConnectionPool(*PARAMS, maxsize=2, timeout=0.05)
+
+  a, b = pool.acquire(), pool.acquire()
+  assert a is not b
+
+  with pytest.raises(Exception, match="no connection available"):
+    pool.acquire()
+
+  pool.release(b)
+  assert pool.acquire() is b
+  assert len(opened) == 2
+
+
+def test_replaces_dead_connections(opened):
+  pool = datatier.ConnectionPool(*PARAMS, maxsize=1)
+
+  a = pool.acquire()
+  pool.release(a)
+  a.alive = False
+
+  b = pool.acquire()
+
+  assert b is not a and a.closed
+  assert len(opened) == 2
+
+
+def test_connection_context(opened):
+  pool = datatier.ConnectionPool(*PARAMS, maxsize=1, timeout=0.05)
+
+  with pytest.raises(ValueError):
+    with pool.connection() as a:
+      raise ValueError("not the connection's fault")
+
+  with pool.connection() as b:
+    assert b is a  # kept
+
+  with pytest.raises(pymysql.err.OperationalError):
+    with pool.connection():
+      raise pymysql.err.OperationalError(2013, "Lost connection")
+
+  assert a.closed  # discarded
+
+  with pool.connection() as c:
+    assert c is not a
+
+
+def test_get_pool_per_settings(opened, monkeypatch):
+  monkeypatch.setattr(datatier, "_pool", None)
+
+  pool = datatier.get_pool(*PARAMS)
+  assert datatier.get_pool(*PARAMS) is pool
+
+  a = pool.acquire()
+  pool.release(a)
+
+  other = datatier.get_pool("other", *PARAMS[1:])
+  assert other is not pool and a.closed  # the old pool's idle connections are closed
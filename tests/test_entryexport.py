@@ -0,0 +1,117 @@
+import csv
+import datetime
+import gzip
+import io
+
+import pytest
+
+import entryexport
+from local_s3 import LocalS3
+
+ROWS = [
+  (80001, i, datetime.datetime(2024, 1, 1, 8) + datetime.timedelta(days=i),
+   'notes, "quoted" ' + str(i), 1 + i % 10, 2, 3, 4, 5)
+  for i in range(1, 251)
+]
+
+
+class Cursor:
+  """
+  Stands in for pymysql's SSCursor, handing out ROWS
+  """
+  def __init__(self, log):
+    self.log = log
+    self.rows = iter(ROWS)
+
+  def execute(self, sql, parameters):
+    self.log.append((sql, parameters))
+
+  def fetchmany(self, size):
+    return [row for _, row in zip(range(size), self.rows)]
+
+  def close(self):
+    pass
+
+
+class Connection:
+  def __init__(self):
+    self.log = []
+
+  def cursor(self, cursor_class=None):
+    return Cursor(self.log)
+
+
+@pytest.fixture
+def s3(tmp_path):
+  return LocalS3(str(tmp_path))
+
+
+def read(s3, key):
+  return s3.get_object(Bucket="b", Key=key)["Body"].read()
+
+
+def test_writer_uploads_parts(s3):
+  data = bytes(range(256)) * 40
+
+  with entryexport.S3MultipartWriter(s3, "b", "x", part_bytes=4096) as out:
+    for lo in range(0, len(data), 1000):
+      out.write(data[lo:lo + 1000])
+
+  assert [part["PartNumber"] for part in out.parts] == [1, 2, 3]
+  assert out.bytes_written == len(data)
+  assert read(s3, "x") == data
+
+
+def test_writer_empty_file(s3):
+  with entryexport.S3MultipartWriter(s3, "b", "x"):
+    pass
+
+  assert read(s3, "x") == b""
+
+
+def test_writer_aborts_on_error(s3, tmp_path):
+  with pytest.raises(RuntimeError):
+    with entryexport.S3MultipartWriter(s3, "b", "x", part_bytes=10) as out:
+      out.write(b"a" * 25)
+      raise RuntimeError("lost connection")
+
+  assert not (tmp_path / "b" / "x").exists()
+  assert list((tmp_path / ".multipart").iterdir()) == []
+
+
+def test_export_csv(s3, monkeypatch):
+  monkeypatch.setattr(entryexport, "BATCH", 100)
+  dbConn = Connection()
+
+  result = entryexport.export_entries(dbConn, s3, "b", "e.csv.gz", uid=80001, fmt="csv")
+
+  assert result["format"] == "csv" and result["rows"] == len(ROWS)
+  assert dbConn.log == [(entryexport.USER_SQL, [80001])]
+
+  data = read(s3, "e.csv.gz")
+  assert result["bytes"] == len(data)
+
+  rows = list(csv.reader(io.StringIO(gzip.decompress(data).decode(), newline="")))
+  assert rows[0] == entryexport.COLUMNS
+  assert rows[1:] == [[str(v) for v in row] for row in ROWS]
+
+
+def test_export_parquet(s3, monkeypatch):
+  pq = pytest.importorskip("pyarrow.parquet")
+  monkeypatch.setattr(entryexport, "BATCH", 100)
+
+  result = entryexport.export_entries(Connection(), s3, "b", "e.parquet", fmt="parquet")
+
+  assert result["rows"] == len(ROWS)
+
+  parquet = pq.ParquetFile(io.BytesIO(read(s3, "e.parquet")))
+  assert parquet.metadata.num_row_groups == 3
+
+  table = parquet.read()
+  assert table.column_names == entryexport.COLUMNS
+  assert [tuple(row.values()) for row in table.to_pylist()] == ROWS
+
+
+def test_export_unknown_format(s3):
+  with pytest.raises(ValueError):
+    entryexport.export_entries(Connection(), s3, "b", "e.xml", fmt="xml")
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+import entryqueue
+
+
+@pytest.fixture(params=["memory", "files"])
+def queue(request, tmp_path):
+  if request.param == "memory":
+    return entryqueue.LocalQueue()
+  return entryqueue.LocalQueue(str(tmp_path / "queue"))
+
+
+def test_send_receive_delete(queue):
+  ids = queue.send([{"n": 1}, {"n": 2}, {"n": 3}])
+
+  assert len(ids) == 3 and len(set(ids)) == 3
+  assert len(queue) == 3
+
+  received = queue.receive(2)
+  assert [msgid for msgid, text in received] == ids[:2]
+  assert [json.loads(text) for msgid, text in received] == [{"n": 1}, {"n": 2}]
+  assert len(queue) == 3  # receive does not remove
+
+  queue.delete(ids[:2])
+  assert [msgid for msgid, text in queue.receive()] == ids[2:]
+
+
+def test_drain_keeps_failures(queue):
+  ids = queue.send([{"n": n} for n in range(5)])
+  seen = []
+
+  def handler(event, context):
+    records = event["Records"]
+    seen.extend(json.loads(r["body"])["n"] for r in records)
+    return {"batchItemFailures": [{"itemIdentifier": r["messageId"]} for r in records
+                                  if json.loads(r["body"])["n"] == 3]}
+
+  processed, failed = queue.drain(handler, batch_size=2)
+
+  #
+  # the failed message stays at the head of the queue and comes
+  # back with each batch, until a batch holds nothing else:
+  #
+  assert seen == [0, 1, 2, 3, 3, 4, 3]
+  assert (processed, failed) == (4, 3)
+  assert [msgid for msgid, text in queue.receive()] == [ids[3]]
+
+
+def test_drain_empty(queue):
+  assert queue.drain(lambda event, context: None) == (0, 0)
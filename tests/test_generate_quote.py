@@ -0,0 +1,56 @@
+import json
+import os
+import sys
+
+import pytest
+
+import fakedb
+import userstats
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def quote(load_lambda, monkeypatch):
+  # mood.py is imported from the lambda's own directory:
+  monkeypatch.syspath_prepend(os.path.join(HERE, "..", "lambda_functions", "journal_generate_quote"))
+  monkeypatch.delitem(sys.modules, "mood", raising=False)
+  return load_lambda("journal_generate_quote")
+
+
+def stats_row(last_entryid=2001):
+  return (last_entryid, 3) + (0,) * (len(userstats.STAT_COLUMNS) - 1)
+
+
+def test_mood_of_no_entries_is_neutral(quote):
+  assert quote.mood_module().mood([]) == quote.mood_module().NEUTRAL
+
+
+def test_mood_favours_recent_entries(quote):
+  mood = quote.mood_module().mood([(10, 10, 10, 10, 10), (1, 1, 1, 1, 1), (1, 1, 1, 1, 1)])
+
+  assert mood["score"] > 0.34  # above the plain average, 1/3
+  assert mood["trend"] > 0
+
+
+def test_user_without_recent_entries(quote, lambda_env):
+  def respond(sql, parameters):
+    if sql.startswith("SELECT last_entryid"):
+      return [stats_row()]
+    return []
+
+  lambda_env.db = fakedb.Connection(respond)
+
+  result = quote.lambda_handler({"queryStringParameters": {"uid": "80001"}}, None)
+
+  assert result["statusCode"] == 200
+  body = json.loads(result["body"])
+  assert body["mood"]["bucket"] == "steady" and body["window"] == 0
+
+
+@pytest.mark.parametrize("window", ["0", "-3"])
+def test_window_must_be_positive(quote, lambda_env, monkeypatch, window):
+  monkeypatch.setenv("JOURNALAPP_QUOTE_WINDOW", window)
+
+  with pytest.raises(ValueError):
+    quote.quote_window()
@@ -0,0 +1,51 @@
+import pytest
+
+import idempotency
+from validation import BadRequest
+
+
+def test_request_key_from_header_or_body():
+  event = {"headers": {"Idempotency-Key": "k1"}}
+
+  assert idempotency.request_key(event, {"request_id": "k2"}) == "k1"
+  assert idempotency.request_key({}, {"request_id": "k2"}) == "k2"
+  assert idempotency.request_key({}, [{"request_id": "k2"}]) is None  # batches use the header
+  assert idempotency.request_key({}, {}) is None
+
+
+@pytest.mark.parametrize("key", ["", "k" * (idempotency.MAX_KEY + 1), 12])
+def test_bad_request_key(key):
+  with pytest.raises(BadRequest):
+    idempotency.request_key({"headers": {"idempotency-key": key}})
+
+
+def test_remembered_is_bounded(monkeypatch):
+  monkeypatch.setattr(idempotency, "MAX_REMEMBERED", 2)
+  monkeypatch.setattr(idempotency, "_remembered", type(idempotency._remembered)())
+
+  for key in ["a", "b", "c"]:
+    idempotency.remember(80001, "journal_upload", key, {"statusCode": 200, "body": key})
+
+  assert idempotency.remembered(80001, "journal_upload", "a") is None
+  assert idempotency.remembered("80001", "journal_upload", "c") == (200, "c")
+
+
+def test_replay():
+  result = idempotency.replay((202, '{"queued": 2}'))
+
+  assert result["statusCode"] == 202
+  assert result["headers"] == idempotency.REPLAY_HEADERS
+  assert idempotency.replay_json((202, '{"queued": 2}')) == {"queued": 2}
+
+
+def test_queued_batch_ids_follow_the_key(load_lambda):
+  upload = load_lambda("journal_upload")
+  batch = [{}, {}, {"request_id": "mine"}]
+
+  ids = upload.request_ids(batch, "k" * idempotency.MAX_KEY)
+
+  assert ids == upload.request_ids(batch, "k" * idempotency.MAX_KEY)  # the same on a retry
+  assert ids[2] == "mine"
+  assert len(set(ids)) == 3 and all(len(rid) <= 64 for rid in ids)
+  assert upload.request_ids([{}], "k1") == ["k1"]
+  assert upload.request_ids([{}, {}])[0] != upload.request_ids([{}, {}])[0]
@@ -0,0 +1,42 @@
+import hashlib
+
+import imageblobs
+from local_s3 import LocalS3
+
+
+def test_hash_object_streams(tmp_path, monkeypatch):
+  monkeypatch.setattr(imageblobs, "CHUNK", 1000)
+
+  data = bytes(range(256)) * 100  # several chunks, not a multiple of CHUNK
+  s3 = LocalS3(str(tmp_path))
+  s3.put_object(Bucket="b", Key="images/blobs/x.jpg", Body=data)
+
+  assert imageblobs.hash_object(s3, "b", "images/blobs/x.jpg") == hashlib.sha256(data).hexdigest()
+
+
+def test_blob_key():
+  sha256 = "ab" * 32
+
+  key = imageblobs.blob_key(80001, sha256, ".jpg")
+
+  assert key.startswith("images/blobs/80001/" + sha256 + "/")
+  assert key.endswith(".jpg")
+  assert imageblobs.is_blob_key(key)
+  assert not imageblobs.is_blob_key("images/80001/x.jpg")
+  assert imageblobs.blob_key(80001, sha256, ".jpg") != key  # a new incarnation each time
+
+
+def test_actions_are_scoped_to_the_user():
+  sha256 = "cd" * 32
+
+  (reserve, reserve_params), (insert, insert_params) = \
+    imageblobs.reserve_actions(80001, "2024-01-01 10:00:00", sha256, "k")
+  assert reserve_params == [80001, sha256, "k"]
+  assert insert_params == [80001, "2024-01-01 10:00:00", 80001, sha256]
+  assert "uid = %s AND sha256 = %s" in insert
+
+  actions = imageblobs.release_actions(2001, 80001, "k", sha256)
+  assert len(actions) == 4
+  assert actions[2][1] == [80001, sha256]
+
+  assert len(imageblobs.release_actions(2001, 80001, "k", None)) == 2
@@ -0,0 +1,26 @@
+import pytest
+
+from validation import BadRequest
+
+
+@pytest.fixture
+def search(load_lambda):
+  return load_lambda("journal_search")
+
+
+def test_page_token_round_trip(search):
+  token = search.encode_page(1.25, 2001)
+
+  assert isinstance(token, str)
+  assert search.decode_page(token) == (1.25, 2001)
+
+
+def test_no_page(search):
+  assert search.decode_page(None) is None
+  assert search.decode_page("") is None
+
+
+@pytest.mark.parametrize("token", ["not a token", "W10=", "WyJ4IiwgMV0="])  # -, [], ["x", 1]
+def test_invalid_page_token(search, token):
+  with pytest.raises(BadRequest):
+    search.decode_page(token)
@@ -0,0 +1,103 @@
+import json
+
+import pytest
+
+import entryqueue
+import fakedb
+import handler
+
+ENTRY = {"notes": "n", "sleep": 7, "eat": 6, "water": 5, "social": 8, "overall": 7}
+
+
+@pytest.fixture
+def upload(load_lambda):
+  return load_lambda("journal_upload")
+
+
+def request(body, uid="80001"):
+  return {"pathParameters": {"uid": uid}, "headers": {}, "body": json.dumps(body)}
+
+
+def dated(second):
+  return dict(ENTRY, date="2024-01-01 10:00:%02d" % second)
+
+
+def test_batch_is_inserted(upload, lambda_env):
+  result = upload.lambda_handler(request([dated(0), dated(1)]), None)
+
+  assert result["statusCode"] == 200
+  assert json.loads(result["body"])["inserted"] == 2
+  (sql, rows), = [(sql, p) for sql, p in lambda_env.db.log if sql.startswith("INSERT INTO entries")]
+  assert [row[1] for row in rows] == ["2024-01-01 10:00:00", "2024-01-01 10:00:01"]
+
+
+def test_batch_entries_need_a_date(upload, lambda_env):
+  result = upload.lambda_handler(request([dict(ENTRY), dated(0), dict(ENTRY)]), None)
+
+  assert result["statusCode"] == 400
+  assert json.loads(result["body"])["errors"] == [
+    {"index": 0, "error": "date is required in a batch"},
+    {"index": 2, "error": "date is required in a batch"},
+  ]
+  assert lambda_env.db.log == []
+
+
+def test_batch_duplicate_date(upload, lambda_env):
+  result = upload.lambda_handler(request([dated(0), dated(0)]), None)
+
+  assert result["statusCode"] == 400
+  assert json.loads(result["body"])["errors"] == [{"index": 1, "error": "duplicate date within batch"}]
+
+
+def test_single_entry_defaults_to_now(upload, lambda_env):
+  result = upload.lambda_handler(request(dict(ENTRY)), None)
+
+  assert result == {"statusCode": 200, "body": "success"}
+  (sql, parameters), = [(sql, p) for sql, p in lambda_env.db.log if sql.startswith("INSERT INTO entries")]
+  assert parameters[0] == 80001 and len(parameters[1]) == len("2024-01-01 10:00:00")
+
+
+@pytest.mark.parametrize("uid", ["abc", "0", "1.5", str(2 ** 31)])
+def test_invalid_uid(upload, lambda_env, uid):
+  result = upload.lambda_handler(request(dated(0), uid=uid), None)
+
+  assert result["statusCode"] == 400 and "uid must be" in result["body"]
+  assert lambda_env.db.log == []
+
+
+@pytest.fixture
+def queue(monkeypatch):
+  monkeypatch.setattr(entryqueue, "_queues", {})
+  entryqueue.set_queues(entryqueue.LocalQueue())
+  return entryqueue.get_queue()
+
+
+def async_request(body, uid="80001"):
+  return dict(request(body, uid), queryStringParameters={"mode": "async"})
+
+
+def test_async_checks_the_user(upload, lambda_env, queue):
+  result = upload.lambda_handler(async_request([dated(0)]), None)
+
+  assert result["statusCode"] == 400 and "no such user" in result["body"]
+  assert len(queue) == 0
+
+
+def test_async_enqueues_for_a_known_user(upload, lambda_env, queue):
+  handler.remember_user(80001)
+
+  result = upload.lambda_handler(async_request([dated(0), dated(1)]), None)
+
+  assert result["statusCode"] == 202
+  assert len(queue) == 2
+  assert lambda_env.db.log == []  # answered from the cache
+
+
+def test_async_looks_up_an_unknown_user(upload, lambda_env, queue):
+  lambda_env.db = fakedb.Connection(lambda sql, parameters: [(80001,)])
+
+  result = upload.lambda_handler(async_request(dated(0)), None)
+
+  assert result["statusCode"] == 202 and len(queue) == 1
+  assert lambda_env.db.statements() == ["SELECT uid FROM users WHERE uid = %s;"]
+  assert handler.is_known_user(80001)
@@ -0,0 +1,149 @@
+import json
+
+import pymysql
+import pytest
+
+import fakedb
+
+SHA256 = "ab" * 32
+
+
+@pytest.fixture
+def upload(load_lambda):
+  return load_lambda("journal_upload_image")
+
+
+def images_row(bucketkey=None, status="pending"):
+  """
+  Answers the handler's queries: the user exists, and the new
+  images row has bucketkey (the one the INSERT was given if
+  None) and status
+  """
+  inserted = {}
+
+  def respond(sql, parameters):
+    if sql.startswith("SELECT uid FROM users"):
+      return [(int(parameters[0]),)]
+    if sql.startswith("INSERT INTO images(uid, date, bucketkey, status) VALUES"):
+      inserted["bucketkey"] = parameters[2]
+    if sql.startswith("INSERT INTO image_blobs"):
+      inserted["bucketkey"] = parameters[2]
+    if sql.startswith("SELECT bucketkey, status FROM images WHERE imageid"):
+      return [(bucketkey or inserted["bucketkey"], status)]
+    return 1 if not sql.startswith("SELECT") else []
+
+  return respond
+
+
+def request(body, uid="80001", headers=None):
+  return {"pathParameters": {"uid": uid}, "headers": headers or {}, "body": json.dumps(body)}
+
+
+def test_reservation_returns_presigned_post(upload, lambda_env):
+  lambda_env.db = fakedb.Connection(images_row())
+
+  result = upload.lambda_handler(request({"filename": "a.jpg", "content_type": "image/jpeg",
+                                          "date": "2024-01-01 10:00:00"}), None)
+
+  assert result["statusCode"] == 200
+  body = json.loads(result["body"])
+  assert body["imageid"] == 2001
+  assert body["bucketkey"].startswith("images/80001/") and body["bucketkey"].endswith(".jpg")
+  assert body["fields"]["key"] == body["bucketkey"]
+  assert body["fields"]["Content-Type"] == "image/jpeg"
+  assert body["expires_in"] == upload.URL_EXPIRES
+
+  (insert, parameters), = [(sql, p) for sql, p in lambda_env.db.log if sql.startswith("INSERT")]
+  assert "'pending'" in insert
+  assert parameters == ["80001", "2024-01-01 10:00:00", body["bucketkey"]]
+  assert lambda_env.db.statements()[-1] == insert  # the id is the INSERT's, nothing is read back
+
+
+@pytest.mark.parametrize("body, error", [
+  ({"filename": "a.txt", "content_type": "text/plain"}, "content_type"),
+  ({"content_type": "image/jpeg"}, "filename"),
+  ({"filename": "a.jpg", "content_type": "image/jpeg", "sha256": "xyz"}, "sha256"),
+])
+def test_invalid_request(upload, lambda_env, body, error):
+  result = upload.lambda_handler(request(body), None)
+
+  assert result["statusCode"] == 400 and error in result["body"]
+  assert lambda_env.db.log == []
+
+
+def test_unknown_user(upload, lambda_env):
+  result = upload.lambda_handler(request({"filename": "a.jpg", "content_type": "image/jpeg"}), None)
+
+  assert result["statusCode"] == 400 and "no such user" in result["body"]
+
+
+def test_duplicate_date(upload, lambda_env):
+  def respond(sql, parameters):
+    if sql.startswith("INSERT INTO images"):
+      return pymysql.err.IntegrityError(1062, "Duplicate entry for key 'images_uid_date'")
+    return images_row()(sql, parameters)
+
+  lambda_env.db = fakedb.Connection(respond)
+
+  result = upload.lambda_handler(request({"filename": "a.jpg", "content_type": "image/jpeg",
+                                          "date": "2024-01-01 10:00:00"}), None)
+
+  assert result["statusCode"] == 400 and "already exists" in result["body"]
+  assert lambda_env.db.transactions == ["rollback"]
+
+
+def test_new_blob_is_uploaded_to_its_key(upload, lambda_env):
+  lambda_env.db = fakedb.Connection(images_row())
+
+  result = upload.lambda_handler(request({"filename": "a.jpg", "content_type": "image/jpeg",
+                                          "sha256": SHA256}), None)
+
+  body = json.loads(result["body"])
+  assert body["imageid"] == lambda_env.db.lastrowid
+  assert body["bucketkey"].startswith("images/blobs/80001/" + SHA256 + "/")
+  assert body["fields"]["key"] == body["bucketkey"]
+
+
+def test_uploaded_blob_needs_no_upload(upload, lambda_env):
+  existing = "images/blobs/80001/" + SHA256 + "/first.jpg"
+  lambda_env.db = fakedb.Connection(images_row(existing, "uploaded"))
+
+  result = upload.lambda_handler(request({"filename": "a.jpg", "content_type": "image/jpeg",
+                                          "sha256": SHA256}), None)
+
+  assert json.loads(result["body"]) == {"imageid": lambda_env.db.lastrowid, "bucketkey": existing,
+                                        "uploaded": True}
+  assert lambda_env.db.log[-1] == ("SELECT bucketkey, status FROM images WHERE imageid = %s;",
+                                   [lambda_env.db.lastrowid])
+
+
+def test_retry_gets_the_same_reservation(upload, lambda_env):
+  lambda_env.db = fakedb.Connection(images_row())
+  event = request({"filename": "a.jpg", "content_type": "image/jpeg"}, headers={"Idempotency-Key": "k1"})
+
+  first = json.loads(upload.lambda_handler(event, None)["body"])
+  retry = upload.lambda_handler(event, None)
+
+  assert retry["headers"]["Idempotent-Replayed"] == "true"
+  assert json.loads(retry["body"])["bucketkey"] == first["bucketkey"]
+  assert sum(sql.startswith("INSERT INTO images") for sql in lambda_env.db.statements()) == 1
+
+
+def test_retry_after_the_image_was_deleted(upload, lambda_env):
+  event = request({"filename": "a.jpg", "content_type": "image/jpeg", "date": "2024-01-01 10:00:00"},
+                  headers={"Idempotency-Key": "k1"})
+  stored = (200, json.dumps({"bucketkey": "images/80001/gone.jpg", "content_type": "image/jpeg",
+                             "date": "2024-01-01 10:00:00"}))
+
+  def respond(sql, parameters):
+    if sql.startswith("INSERT INTO idempotency_keys"):
+      return pymysql.err.IntegrityError(1062, "Duplicate entry for key 'PRIMARY'")
+    if sql.startswith("SELECT status, response FROM idempotency_keys"):
+      return [stored]
+    return images_row()(sql, parameters)
+
+  lambda_env.db = fakedb.Connection(respond)
+
+  result = upload.lambda_handler(event, None)
+
+  assert result["statusCode"] == 404 and "no such image" in result["body"]
@@ -0,0 +1,122 @@
+import hashlib
+import urllib.parse
+
+import pytest
+
+import fakedb
+
+CONTENT = b"\xff\xd8 jpeg bytes"
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+PLAIN_KEY = "images/80001/photo.jpg"
+BLOB_KEY = "images/blobs/80001/" + SHA256 + "/first.jpg"
+
+
+@pytest.fixture
+def finalize(load_lambda):
+  return load_lambda("journal_upload_image_finalize")
+
+
+def event(*keys):
+  return {"Records": [{"s3": {"bucket": {"name": "b"},
+                              "object": {"key": urllib.parse.quote_plus(key)}}}
+                      for key in keys]}
+
+
+def confirmed(result):
+  return result["body"] == '{"confirmed": 1}'
+
+
+def blob_row(status, sha256=SHA256, pending_rows=1):
+  def respond(sql, parameters):
+    if sql.startswith("SELECT sha256, status FROM image_blobs"):
+      return [(sha256, status)]
+    if sql.startswith("UPDATE"):
+      return pending_rows
+    return 1
+
+  return respond
+
+
+def test_confirms_pending_image(finalize, lambda_env):
+  lambda_env.put(PLAIN_KEY, CONTENT)
+
+  assert confirmed(finalize.lambda_handler(event(PLAIN_KEY), None))
+
+  (sql, parameters), = lambda_env.db.log
+  assert sql.startswith("UPDATE images SET status = 'uploaded'")
+  assert parameters == [len(CONTENT), PLAIN_KEY]
+
+
+def test_too_large_is_deleted(finalize, lambda_env, monkeypatch):
+  monkeypatch.setattr(finalize, "MAX_BYTES", len(CONTENT) - 1)
+  lambda_env.put(PLAIN_KEY, CONTENT)
+
+  assert not confirmed(finalize.lambda_handler(event(PLAIN_KEY), None))
+
+  assert not lambda_env.exists(PLAIN_KEY)
+  assert lambda_env.db.statements() == [
+    "DELETE FROM images WHERE bucketkey = %s AND status = 'pending';"]
+
+
+def test_no_pending_row(finalize, lambda_env):
+  lambda_env.db = fakedb.Connection(lambda sql, parameters: 0)
+  lambda_env.put(PLAIN_KEY, CONTENT)
+
+  assert not confirmed(finalize.lambda_handler(event(PLAIN_KEY), None))
+  assert lambda_env.exists(PLAIN_KEY)
+
+
+def test_blob_without_row_is_deleted(finalize, lambda_env):
+  lambda_env.put(BLOB_KEY, CONTENT)
+
+  assert not confirmed(finalize.lambda_handler(event(BLOB_KEY), None))
+
+  assert not lambda_env.exists(BLOB_KEY)
+  assert not any(sql.startswith("UPDATE") for sql in lambda_env.db.statements())
+
+
+def test_blob_confirmed_when_hash_matches(finalize, lambda_env):
+  lambda_env.db = fakedb.Connection(blob_row("pending"))
+  lambda_env.put(BLOB_KEY, CONTENT)
+
+  assert confirmed(finalize.lambda_handler(event(BLOB_KEY), None))
+
+  assert lambda_env.exists(BLOB_KEY)
+  assert lambda_env.db.transactions == ["commit"]
+  updates = [(sql, p) for sql, p in lambda_env.db.log if sql.startswith("UPDATE")]
+  assert [sql.split(" SET")[0] for sql, p in updates] == ["UPDATE image_blobs", "UPDATE images"]
+  assert all(p == [len(CONTENT), BLOB_KEY] for sql, p in updates)
+
+
+@pytest.mark.parametrize("content, max_bytes", [
+  (b"not what was reserved", None),
+  (CONTENT, len(CONTENT) - 1),
+])
+def test_pending_blob_mismatch_is_deleted(finalize, lambda_env, monkeypatch, content, max_bytes):
+  if max_bytes is not None:
+    monkeypatch.setattr(finalize, "MAX_BYTES", max_bytes)
+  lambda_env.db = fakedb.Connection(blob_row("pending"))
+  lambda_env.put(BLOB_KEY, content)
+
+  assert not confirmed(finalize.lambda_handler(event(BLOB_KEY), None))
+
+  assert not lambda_env.exists(BLOB_KEY)
+  assert not any(sql.startswith("UPDATE") for sql in lambda_env.db.statements())
+
+
+def test_uploaded_blob_is_never_deleted(finalize, lambda_env):
+  lambda_env.db = fakedb.Connection(blob_row("uploaded"))
+  lambda_env.put(BLOB_KEY, b"overwritten")
+
+  assert not confirmed(finalize.lambda_handler(event(BLOB_KEY), None))
+
+  assert lambda_env.exists(BLOB_KEY)
+  assert not any(sql.startswith("UPDATE") for sql in lambda_env.db.statements())
+
+
+def test_blob_already_uploaded(finalize, lambda_env):
+  lambda_env.db = fakedb.Connection(blob_row("pending", pending_rows=0))
+  lambda_env.put(BLOB_KEY, CONTENT)
+
+  assert not confirmed(finalize.lambda_handler(event(BLOB_KEY), None))
+  assert lambda_env.exists(BLOB_KEY)
@@ -0,0 +1,37 @@
+import base64
+import gzip
+
+import pytest
+
+from validation import MAX_BODY, BadRequest, decode_body
+
+
+def gzip_event(data, **event):
+  return dict(event, headers={"Content-Encoding": "gzip"}, body=data)
+
+
+def test_plain_and_base64_bodies():
+  assert decode_body({"body": '{"a": 1}'}) == {"a": 1}
+  assert decode_body({"body": base64.b64encode(b'{"a": 1}').decode(), "isBase64Encoded": True}) == {"a": 1}
+  assert decode_body({"queryStringParameters": {"body": "[1]"}}) == [1]
+
+
+def test_gzipped_bodies():
+  data = gzip.compress(b'{"a": 1}')
+
+  assert decode_body(gzip_event(base64.b64encode(data).decode(), isBase64Encoded=True)) == {"a": 1}
+  assert decode_body(gzip_event(data.decode("latin-1"))) == {"a": 1}
+
+
+@pytest.mark.parametrize("event, error", [
+  ({}, "event has no body"),
+  ({"body": "{"}, "not valid JSON"),
+  ({"body": "e30", "isBase64Encoded": True}, "not valid base64"),
+  ({"body": b"\xff\xfe", "isBase64Encoded": False}, "not valid JSON"),
+  (gzip_event("not gzip"), "not valid gzip"),
+  (gzip_event("☃ snowman"), "not valid gzip"),
+  (gzip_event(gzip.compress(b" " * (MAX_BODY + 1))), "body too large"),
+])
+def test_bad_bodies(event, error):
+  with pytest.raises(BadRequest, match=error):
+    decode_body(event)